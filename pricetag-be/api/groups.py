@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException, status, Request, Depends
+from fastapi import APIRouter, HTTPException, status, Request, Response, Depends
 from bson import ObjectId
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from utils.devices import DEVICES, serialize_device
+from utils.revisions import get_revision, make_etag, not_modified
+from utils.changes import record_change
+from utils.cache import location_exists
 
 router = APIRouter()
 
@@ -31,6 +35,7 @@ async def create_group(location_id: str, group: GroupCreate, db=Depends(get_data
         "description": group.description
     }
     result = await db["groups"].insert_one(group_doc)
+    await record_change(db, location_id, op="groups")
     group_doc["_id"] = str(result.inserted_id)
     group_doc["location_id"] = str(group_doc["location_id"])
     return GroupResponse(**group_doc)
@@ -38,7 +43,15 @@ async def create_group(location_id: str, group: GroupCreate, db=Depends(get_data
 
 # 2. GET /locations/{location_id}/groups – pobierz wszystkie grupy
 @router.get("/locations/{location_id}/groups", response_model=List[GroupResponse])
-async def get_groups(location_id: str, db=Depends(get_database)):
+async def get_groups(location_id: str, request: Request, response: Response, db=Depends(get_database)):
+    rev = await get_revision(db, location_id) if ObjectId.is_valid(location_id) else None
+    if rev is not None:
+        etag = make_etag(location_id, rev, "groups")
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        response.headers["ETag"] = etag
+
     groups_cursor = db["groups"].find({"location_id": ObjectId(location_id)})
     groups = []
     async for group in groups_cursor:
@@ -51,50 +64,62 @@ async def get_groups(location_id: str, db=Depends(get_database)):
 @router.post("/locations/{location_id}/devices/{device_id}/groups")
 async def add_device_to_group(location_id: str, device_id: str, body: dict, db=Depends(get_database)):
     group_id = body.get("group_id")
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(400, detail="Invalid location_id")
     if not ObjectId.is_valid(group_id):
         raise HTTPException(400, detail="Invalid group_id")
 
-    result = await db["locations"].update_one(
-        {"_id": ObjectId(location_id), "devices._id": device_id},  # ✅ zakłada string
-        {"$addToSet": {"devices.$.groups": ObjectId(group_id)}}
+    result = await db[DEVICES].update_one(
+        {"_id": device_id, "location_id": ObjectId(location_id)},
+        {"$addToSet": {"groups": ObjectId(group_id)}}
     )
 
     if result.matched_count == 0:
         raise HTTPException(404, detail="Device or location not found")
 
+    await record_change(db, location_id, [device_id])
     return {"message": "Group added to device"}
 
 # 4. GET /locations/{location_id}/groups/{group_id}/devices – urządzenia przypisane do grupy
 @router.get("/locations/{location_id}/groups/{group_id}/devices")
 async def get_devices_in_group(location_id: str, group_id: str, db=Depends(get_database)):
-    location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-    if not location:
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(400, detail="Invalid location_id")
+    if not await location_exists(db, location_id):
         raise HTTPException(404, detail="Location not found")
+    if not ObjectId.is_valid(group_id):
+        # Żadne urządzenie nie należy do grupy o takim id
+        return []
 
-    devices = [
-        d for d in location.get("devices", [])
-        if group_id in [str(g) for g in d.get("groups", [])]
-    ]
-    for d in devices:
-        d["_id"] = str(d["_id"])
-    return devices
+    # Zapytanie po indeksie (location_id, groups) zamiast filtrowania wszystkich urządzeń
+    cursor = db[DEVICES].find({"location_id": ObjectId(location_id), "groups": ObjectId(group_id)})
+    return [serialize_device(d) async for d in cursor]
 
 # 5. DELETE /locations/{location_id}/devices/{device_id}/groups/{group_id} – usuń grupę z urządzenia
 @router.delete("/locations/{location_id}/devices/{device_id}/groups/{group_id}")
 async def remove_device_from_group(location_id: str, device_id: str, group_id: str, db=Depends(get_database)):
-    result = await db["locations"].update_one(
-        {"_id": ObjectId(location_id), "devices._id": device_id},  # string, nie ObjectId!
-        {"$pull": {"devices.$.groups": ObjectId(group_id)}}
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(400, detail="Invalid location_id")
+    if not ObjectId.is_valid(group_id):
+        raise HTTPException(400, detail="Invalid group_id")
+    result = await db[DEVICES].update_one(
+        {"_id": device_id, "location_id": ObjectId(location_id)},
+        {"$pull": {"groups": ObjectId(group_id)}}
     )
 
     if result.matched_count == 0:
         raise HTTPException(404, detail="Device or location not found")
 
+    await record_change(db, location_id, [device_id])
     return {"message": "Group removed from device"}
 
 # 6. DELETE /locations/{location_id}/groups/{group_id} – usuń grupę
 @router.delete("/locations/{location_id}/groups/{group_id}")
 async def delete_group(location_id: str, group_id: str, db=Depends(get_database)):
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(400, detail="Invalid location_id")
+    if not ObjectId.is_valid(group_id):
+        raise HTTPException(400, detail="Invalid group_id")
     # Usuń grupę z kolekcji groups
     delete_result = await db["groups"].delete_one({
         "_id": ObjectId(group_id),
@@ -105,9 +130,9 @@ async def delete_group(location_id: str, group_id: str, db=Depends(get_database)
         raise HTTPException(404, detail="Group not found")
 
     # Usuń referencje z urządzeń
-    await db["locations"].update_many(
-        {"_id": ObjectId(location_id)},
-        {"$pull": {"devices.$[].groups": ObjectId(group_id)}}
-    )
+    member_filter = {"location_id": ObjectId(location_id), "groups": ObjectId(group_id)}
+    member_ids = await db[DEVICES].distinct("_id", member_filter)
+    await db[DEVICES].update_many(member_filter, {"$pull": {"groups": ObjectId(group_id)}})
+    await record_change(db, location_id, member_ids, op="groups")
 
     return {"message": "Group deleted and removed from devices"}
@@ -0,0 +1,92 @@
+# 📁 api/jobs.py – stan zadań obróbki mediów (miniaturki, kodowanie wersji "device")
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Request, Depends
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from utils.jobs import JOBS, get_job, job_response, pool
+
+router = APIRouter()
+
+def get_database(request: Request):
+    return request.app.mongodb
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+# 1. GET /jobs – lista zadań (najnowsze pierwsze)
+@router.get("/")
+async def list_jobs(
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = 50,
+    db=Depends(get_database)
+):
+    if status is not None and status not in JOB_STATUSES:
+        raise HTTPException(400, detail=f"Invalid status, expected one of: {', '.join(JOB_STATUSES)}")
+    if not 1 <= limit <= 500:
+        raise HTTPException(400, detail="Limit must be between 1 and 500")
+
+    query = {}
+    if status:
+        query["status"] = status
+    if kind:
+        query["kind"] = kind
+    jobs = await db[JOBS].find(query).sort("created_at", DESCENDING).to_list(limit)
+    return [job_response(job) for job in jobs]
+
+
+# 2. GET /jobs/stats – liczba zadań wg statusu + liczniki puli tego procesu
+@router.get("/stats")
+async def jobs_stats(db=Depends(get_database)):
+    counts = {status: 0 for status in JOB_STATUSES}
+    async for row in db[JOBS].aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+    return {"jobs": counts, "pool": pool.stats()}
+
+
+# 3. GET /jobs/{job_id} – stan zadania
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, db=Depends(get_database)):
+    job = await get_job(db, job_id)
+    if not job:
+        raise HTTPException(404, detail="Job not found")
+    return job_response(job)
+
+
+# 4. POST /jobs/{job_id}/retry – ponów zadanie zakończone błędem
+@router.post("/{job_id}/retry")
+async def retry_job(job_id: str, db=Depends(get_database)):
+    job = await get_job(db, job_id)
+    if not job:
+        raise HTTPException(404, detail="Job not found")
+    if job["status"] != "failed":
+        raise HTTPException(409, detail="Only failed jobs can be retried")
+
+    update = {
+        "status": "queued", "attempts": 0, "run_at": datetime.utcnow(),
+        "finished_at": None, "error": None, "updated_at": datetime.utcnow()
+    }
+    if job.get("key"):
+        update["active_key"] = job["key"]
+    try:
+        await db[JOBS].update_one({"_id": job["_id"], "status": "failed"}, {"$set": update})
+    except DuplicateKeyError:
+        # To samo zadanie zlecono już od nowa – nie dublujemy
+        raise HTTPException(409, detail="An identical job is already queued")
+    pool.notify()
+    return job_response(await get_job(db, job_id))
+
+
+# 5. DELETE /jobs/{job_id} – anuluj zadanie, które jeszcze czeka
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, db=Depends(get_database)):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(400, detail="Invalid job ID format")
+    result = await db[JOBS].delete_one({"_id": ObjectId(job_id), "status": "queued"})
+    if result.deleted_count == 0:
+        raise HTTPException(409, detail="Job not found or already running")
+    return {"message": "Job cancelled"}
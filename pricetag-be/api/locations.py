@@ -1,9 +1,42 @@
 
-from fastapi import APIRouter, HTTPException, Depends, status, Request
-from typing import List
-from models import Location, LocationCreate, LocationResponse, Device
+from fastapi import APIRouter, HTTPException, Depends, Query, status, Request
+from typing import List, Optional
+from models import Location, LocationCreate, LocationResponse, Device, DeviceBulkFields, DeviceBulkUpdateItem, AssignMediaRequest, ThumbnailSpriteRequest
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pydantic import ValidationError
+import asyncio
+import json
 import logging
+import re
+from utils.devices import (
+    DEVICES, new_device_doc, serialize_device, find_location_devices, devices_by_location, device_projection
+)
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from utils.revisions import get_revision, make_etag, not_modified
+from utils.changes import record_change, read_changes, replay_changes
+from utils.events import broker as event_broker
+from utils.cache import location_cache, get_cached_location, location_exists, project_devices
+from utils.blobs import blob_hash, decode_legacy_media, location_dir as location_path, sniff_extension, store_blob
+from utils.uploads import commit_temp, discard_temp, safe_filename, stream_to_temp
+from utils.media import DEVICE_MD5_HEADER, media_response
+from utils.derived import after_file_written
+from utils.manifest import (
+    MEDIA as MANIFEST, SORT_FIELDS as MANIFEST_SORT_FIELDS, current_entry as current_manifest_entry,
+    entry_response as manifest_entry_response, get_entry as get_manifest_entry,
+    index_file, list_manifest, manifest_state, remove_file
+)
+from utils.thumbnails import (
+    FORMATS as THUMBNAIL_FORMATS, SPRITE_MAX_FILES, SPRITE_MAX_PIXELS, SPRITE_MAX_TILE, discard_thumbnails,
+    get_thumbnail, media_kind, request_warm_location, sprite_file, thumbnail_sprite, warm_thumbnails
+)
+from utils.jobs import PRIORITY_INTERACTIVE, job_response
+from utils.previews import (
+    PREVIEW_VARIANT, discard_preview, preview_path, preview_url, request_preview
+)
+from utils.transcode import DEVICE_VARIANT, discard_device_variant, request_device_variant
+from config import settings
 
 from fastapi import APIRouter, HTTPException, Depends, status, Request
 from models import Device, LocationCreate, LocationResponse
@@ -27,23 +60,37 @@ async def create_location(location: LocationCreate, db=Depends(get_database)):
     """
     Create a single location document
     """
+    # Unikalny indeks (location_id, clientId) – duplikat w payloadzie to błąd klienta, a nie
+    # połowicznie założona lokalizacja
+    client_ids = [d.clientId for d in location.devices or []]
+    if len(client_ids) != len(set(client_ids)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Duplicate device clientId in location payload"
+        )
+
     try:
-        # Prepare location data
+        # Prepare location data (urządzenia trafiają do kolekcji devices)
         location_data = {
             "id": str(ObjectId()),  # Generate unique ID for each location
             "name": location.name,
             "address": location.address,
-            "devices": location.devices,
         }
 
         # Insert the location document in the locations collection
         result = await db["locations"].insert_one(location_data)
+        location_id = str(result.inserted_id)
 
-        # Get the created location
-        created_location = await db["locations"].find_one({"_id": result.inserted_id})
-        created_location["_id"] = str(created_location["_id"])
+        if location.devices:
+            try:
+                await db[DEVICES].insert_many([new_device_doc(location_id, d) for d in location.devices])
+            except BulkWriteError:
+                # Nie zostawiamy lokalizacji z częścią urządzeń
+                await db[DEVICES].delete_many({"location_id": ObjectId(location_id)})
+                await db["locations"].delete_one({"_id": ObjectId(location_id)})
+                raise
 
-        return LocationResponse(**created_location)
+        return LocationResponse(**await _load_location(location_id, db))
 
     except Exception as e:
         logger.error(f"Error creating location: {str(e)}")
@@ -72,68 +119,29 @@ async def add_device_to_location(location_id: str, device: Device, db=Depends(ge
                 detail="Invalid location ID format"
             )
 
-        location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-        if not location:
+        if not await _location_exists(location_id, db):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Location not found"
             )
 
-        # Add unique ID to the device if not already present
-        device_dict = {
-            "_id": str(ObjectId()),
-            "clientId": device.clientId,
-            "clientName": device.clientName,
-            "ip": device.ip or "",
-            "photo": device.photo,
-            "video": device.video,
-            "changed": "false",
-            "thumbnail": None,
-            "isOnline": True
-        }
-
-
-
-
-        # Add the "changed" key with the value "false" to the device
-        device_dict["changed"] = "false"
-        
-        # Add unique _id to the device
-        device_dict["_id"] = str(ObjectId())  # Assign a unique ID to the device
-
-        # Check if device already exists
-        for existing_device in location.get("devices", []):
-            if existing_device.get("clientId") == device.clientId:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Device with this clientId already exists in this location"
-                )
-
-        # Add the new device to the list of devices
-        if "devices" not in location:
-            location["devices"] = []
-        
-        location["devices"].append(device_dict)
-
-        # Update the location in the database
-        result = await db["locations"].update_one(
-            {"_id": ObjectId(location_id)},
-            {"$set": {"devices": location["devices"]}}
-        )
-
-        if result.matched_count == 0:
+        # Unikalny indeks (location_id, clientId) chroni przed duplikatem także przy równoległych zapisach
+        device_doc = new_device_doc(location_id, device)
+        try:
+            await db[DEVICES].insert_one(device_doc)
+        except DuplicateKeyError:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Failed to update location"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Device with this clientId already exists in this location"
             )
 
-        # Convert _id and devices' _id to string before returning
-        location["_id"] = str(location["_id"])
-        for device in location["devices"]:
-            device["_id"] = str(device["_id"])
+        await record_change(db, location_id, [device_doc["_id"]], op="insert")
+        location = await _load_location(location_id, db)
 
         return {"message": "Device added successfully", "location": location}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -143,33 +151,59 @@ async def add_device_to_location(location_id: str, device: Device, db=Depends(ge
 
 
 
+def _parse_device_projection(view: Optional[str], fields: Optional[str]):
+    try:
+        return device_projection(view, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 # Endpoint to get all locations
 @router.get("/", response_model=List[LocationResponse])
-async def get_locations(db=Depends(get_database)):
+async def get_locations(view: Optional[str] = None, fields: Optional[str] = None, db=Depends(get_database)):
+    """
+    Wszystkie lokalizacje z urządzeniami. `view=slim` albo `fields=_id,clientId,...`
+    ogranicza pola urządzeń już na poziomie zapytania do MongoDB.
+    """
+    projection = _parse_device_projection(view, fields)
+
+    location_docs = await db["locations"].find().to_list(length=None)
+    # Urządzenia wszystkich lokalizacji jednym zapytaniem (zamiast N osobnych)
+    grouped = await devices_by_location(db, [loc["_id"] for loc in location_docs], projection)
+
     locations = []
-    async for location in db["locations"].find():
+    for location in location_docs:
         # Zamiana ObjectId na string
         location["_id"] = str(location["_id"])
-        # Zamiana ObjectId w urządzeniach jeśli istnieją
-        for device in location.get("devices", []):
-            if "_id" in device and isinstance(device["_id"], ObjectId):
-                device["_id"] = str(device["_id"])
-        locations.append(LocationResponse(**location))
+        location["devices"] = grouped.get(location["_id"], [])
+        if projection is None:
+            location = LocationResponse(**location)
+        locations.append(location)
+
+    if projection is not None:
+        # Widok częściowy nie spełnia pełnego modelu Device – zwracamy dokumenty bez walidacji
+        return JSONResponse(content=locations)
     return locations
 
 
 # Endpoint to get a specific location by ID
 @router.get("/{location_id}", response_model=LocationResponse)
-async def get_location(location_id: str, db=Depends(get_database)):
-    location = await db["locations"].find_one({"_id": ObjectId(location_id)})
+async def get_location(location_id: str, request: Request, response: Response, db=Depends(get_database)):
+    # Rewizję czytamy przed danymi – w razie wyścigu ETag jest co najwyżej starszy, nigdy nowszy
+    rev = await get_revision(db, location_id)
+    if rev is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    etag = make_etag(location_id, rev, "location")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    location = await _load_location(location_id, db)
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
-    
-    location["_id"] = str(location["_id"])
-    for device in location.get("devices", []):
-        if "_id" in device and isinstance(device["_id"], ObjectId):
-            device["_id"] = str(device["_id"])
-    
+
+    response.headers["ETag"] = etag
     return LocationResponse(**location)
 
 
@@ -180,8 +214,11 @@ async def delete_all_locations(db=Depends(get_database)):
     Usuwa wszystkie lokalizacje z bazy danych
     """
     try:
-        # Usuwanie wszystkich dokumentów w kolekcji "locations"
+        # Usuwanie wszystkich dokumentów w kolekcji "locations" (i ich urządzeń)
         result = await db["locations"].delete_many({})
+        await db[DEVICES].delete_many({})
+        await db[MANIFEST].delete_many({})
+        location_cache.clear()
 
         # Jeśli nie usunięto żadnych dokumentów, zwróć 404
         if result.deleted_count == 0:
@@ -217,37 +254,27 @@ async def remove_device_from_location(location_id: str, device_id: str, db=Depen
                 detail="Invalid device ID format"
             )
 
-        location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-        if not location:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Location not found"
-            )
-
-        # Find and remove the device with the provided device_id
-        devices = location.get("devices", [])
-        updated_devices = [device for device in devices if str(device["_id"]) != device_id]
+        result = await db[DEVICES].delete_one(
+            {"_id": device_id, "location_id": ObjectId(location_id)}
+        )
 
-        if len(devices) == len(updated_devices):
+        if result.deleted_count == 0:
+            if not await _location_exists(location_id, db):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Location not found"
+                )
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Device not found"
             )
 
-        # Update the location with the new list of devices
-        result = await db["locations"].update_one(
-            {"_id": ObjectId(location_id)},
-            {"$set": {"devices": updated_devices}}
-        )
-
-        if result.matched_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Failed to update location"
-            )
+        await record_change(db, location_id, [device_id], op="delete")
 
         return {"message": "Device removed successfully"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -256,10 +283,20 @@ async def remove_device_from_location(location_id: str, device_id: str, db=Depen
 
 
 @router.get("/{location_id}/devices", response_model=List[Device])
-async def get_devices_from_location(location_id: str, db=Depends(get_database)):
+async def get_devices_from_location(
+    location_id: str,
+    request: Request,
+    response: Response,
+    view: Optional[str] = None,
+    fields: Optional[str] = None,
+    db=Depends(get_database)
+):
     """
-    Get all devices from a specific location by its ID
+    Get all devices from a specific location by its ID.
+    `view=slim` (_id, clientId, ip, changed, isOnline) albo `fields=...` zwraca tylko wybrane pola.
     """
+    projection = _parse_device_projection(view, fields)
+
     try:
         if not ObjectId.is_valid(location_id):
             raise HTTPException(
@@ -267,22 +304,39 @@ async def get_devices_from_location(location_id: str, db=Depends(get_database)):
                 detail="Invalid location ID format"
             )
 
-        location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-        if not location:
+        rev = await get_revision(db, location_id)
+        if rev is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Location not found"
             )
 
-        devices = location.get("devices", [])
+        # Niezmieniona lista urządzeń -> 304 bez zapytania o urządzenia i bez serializacji
+        etag = make_etag(location_id, rev, f"devices:{sorted(projection or {})}")
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
 
-        # Zamień _id każdego urządzenia na string
-        for device in devices:
-            if "_id" in device and isinstance(device["_id"], ObjectId):
-                device["_id"] = str(device["_id"])
+        if projection is not None and location_cache.peek(location_id) is None:
+            # Poza cache – tylko wybrane pola prosto z bazy (projekcja MongoDB), bez czytania
+            # i cache'owania pełnych dokumentów urządzeń
+            devices = await find_location_devices(db, location_id, projection)
+            return JSONResponse(content=devices, headers={"ETag": etag})
 
+        location = await _load_location(location_id, db)
+        if not location:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Location not found"
+            )
+        devices = project_devices(location["devices"], projection)
+        if projection is not None:
+            return JSONResponse(content=devices, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         return devices
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching devices from location: {str(e)}")
         raise HTTPException(
@@ -290,6 +344,136 @@ async def get_devices_from_location(location_id: str, db=Depends(get_database)):
             detail=f"Error fetching devices from location: {str(e)}"
         )
 
+@router.get("/{location_id}/devices/changes")
+async def get_device_changes(
+    location_id: str,
+    since: int = 0,
+    limit: int = 1000,
+    view: Optional[str] = None,
+    fields: Optional[str] = None,
+    db=Depends(get_database)
+):
+    """
+    Przyrostowe pobieranie urządzeń: zwraca tylko urządzenia zmienione po kursorze `since`
+    oraz nowy kursor. `since=0` (albo `reset: true` w odpowiedzi) = pełna lista.
+    Usunięte urządzenia trafiają do `deleted`.
+    Przykład: GET /{location_id}/devices/changes?since=42 ->
+        { "cursor": 45, "devices": [...], "deleted": ["..."], "reset": false, "more": false }
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    projection = _parse_device_projection(view, fields)
+    limit = max(1, min(limit, 5000))
+
+    rev = await get_revision(db, location_id)
+    if rev is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    if since and since == rev:
+        return {"cursor": since, "devices": [], "deleted": [], "reset": False, "more": False}
+
+    events = None
+    if 0 < since < rev:
+        events, cursor = await read_changes(db, location_id, since, limit)
+
+    if events is None:
+        # Pełna migawka – kursor to rewizja odczytana przed listą (ew. duplikaty, nigdy braki);
+        # także dla kursora „z przyszłości” (odtworzona baza, lokalizacja założona od nowa)
+        devices = await find_location_devices(db, location_id, projection)
+        return {"cursor": rev, "devices": devices, "deleted": [], "reset": since > 0, "more": False}
+
+    touched = list(dict.fromkeys(d for e in events for d in e.get("device_ids", [])))
+    devices = []
+    if touched:
+        cursor_docs = db[DEVICES].find(
+            {"_id": {"$in": touched}, "location_id": ObjectId(location_id)}, projection
+        )
+        devices = [serialize_device(d) async for d in cursor_docs]
+    present = {d["_id"] for d in devices}
+
+    return {
+        "cursor": cursor,
+        "devices": devices,
+        "deleted": [d for d in touched if d not in present],
+        "reset": False,
+        # Kursor stoi przed świeżą luką – klient nie ponawia w pętli, tylko przy następnym odpytaniu
+        "more": since < cursor < rev
+    }
+
+
+# Co ile sekund wysyłamy komentarz podtrzymujący połączenie SSE (proxy zamykają bezczynne)
+EVENTS_HEARTBEAT_SECONDS = 15
+
+
+def _sse(message: dict) -> str:
+    return f"id: {message['seq']}\nevent: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+@router.get("/{location_id}/events")
+async def stream_location_events(
+    location_id: str,
+    request: Request,
+    since: Optional[int] = None,
+    db=Depends(get_database)
+):
+    """
+    Strumień SSE zmian urządzeń lokalizacji (text/event-stream).
+    Wznowienie od kursora: nagłówek `Last-Event-ID` (EventSource wysyła go sam) albo `?since=`.
+    Zdarzenia:
+        change – {"seq", "op", "devices": [...], "deleted": ["..."]}
+        reset  – kursor starszy niż dziennik, klient pobiera pełną listę urządzeń
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+
+    rev = await get_revision(db, location_id)
+    if rev is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+    if since is None:
+        since = rev
+
+    # Subskrypcja przed odtworzeniem zaległości – zdarzenia z tego okna przyjdą z kolejki
+    queue = event_broker.subscribe(location_id)
+
+    async def event_stream():
+        last_seq = since
+        try:
+            yield "retry: 3000\n\n"
+            catch_up = since < rev
+            while True:
+                if catch_up:
+                    async for message in replay_changes(db, location_id, last_seq):
+                        last_seq = message["seq"]
+                        yield _sse(message)
+                    catch_up = False
+
+                if await request.is_disconnected():
+                    break
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+
+                if message["type"] == "overflow":
+                    catch_up = True
+                elif message["seq"] > last_seq:
+                    last_seq = message["seq"]
+                    yield _sse(message)
+        finally:
+            event_broker.unsubscribe(location_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.put("/{location_id}/devices/{device_id}/photo", status_code=200)
 async def update_device_photo(location_id: str, device_id: str, body: dict, db=Depends(get_database)):
     """
@@ -299,7 +483,7 @@ async def update_device_photo(location_id: str, device_id: str, body: dict, db=D
     if not photo:
         raise HTTPException(status_code=400, detail="Missing photo")
 
-    return await _update_device_field(location_id, device_id, {"photo": photo}, db)
+    return await _update_device_field(location_id, device_id, await _media_fields(location_id, "photo", photo, db), db)
 
 
 @router.put("/{location_id}/devices/{device_id}/video", status_code=200)
@@ -311,34 +495,54 @@ async def update_device_video(location_id: str, device_id: str, body: dict, db=D
     if not video:
         raise HTTPException(status_code=400, detail="Missing video")
 
-    return await _update_device_field(location_id, device_id, {"video": video}, db)
+    return await _update_device_field(location_id, device_id, await _media_fields(location_id, "video", video, db), db)
 
 
-async def _update_device_field(location_id: str, device_id: str, update_fields: dict, db):
-    if not ObjectId.is_valid(location_id) or not ObjectId.is_valid(device_id):
+async def _media_fields(location_id: str, field: str, value: str, db) -> dict:
+    """
+    Pola urządzenia dla przypisania pliku: nazwa + skrót. Base64 od starszych klientów
+    jest od razu zapisywany jako plik adresowany treścią zamiast trafiać do dokumentu.
+    """
+    if not ObjectId.is_valid(location_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
+    data = decode_legacy_media(value)
+    if data is not None:
+        default_extension = "png" if field == "photo" else "mp4"
+        sha256, value, existed = await asyncio.to_thread(
+            store_blob, location_id, data, sniff_extension(data, default_extension)
+        )
+        if not existed:
+            await index_file(db, location_id, value, sha256)
+        return {field: value, f"{field}Hash": sha256}
+    return {field: value, f"{field}Hash": blob_hash(value)}
 
-    location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-    if not location:
-        raise HTTPException(status_code=404, detail="Location not found")
 
-    devices = location.get("devices", [])
-    updated = False
+async def _location_exists(location_id: str, db) -> bool:
+    return await location_exists(db, location_id)
 
-    for device in devices:
-        if str(device["_id"]) == device_id:
-            device.update(update_fields)
-            updated = True
-            break
 
-    if not updated:
-        raise HTTPException(status_code=404, detail="Device not found")
+async def _load_location(location_id: str, db):
+    """Lokalizacja w dawnym kształcie (z listą `devices`) albo None – z cache procesu."""
+    return await get_cached_location(db, location_id)
+
+
+async def _update_device_field(location_id: str, device_id: str, update_fields: dict, db):
+    if not ObjectId.is_valid(location_id) or not ObjectId.is_valid(device_id):
+        raise HTTPException(status_code=400, detail="Invalid ID format")
 
-    await db["locations"].update_one(
-        {"_id": ObjectId(location_id)},
-        {"$set": {"devices": devices}}
+    # Jeden update_one na dokumencie urządzenia – bez pobierania lokalizacji
+    result = await db[DEVICES].update_one(
+        {"_id": device_id, "location_id": ObjectId(location_id)},
+        {"$set": update_fields}
     )
 
+    if result.matched_count == 0:
+        if not await _location_exists(location_id, db):
+            raise HTTPException(status_code=404, detail="Location not found")
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    await record_change(db, location_id, [device_id])
+
     return {"message": "Device updated successfully", "updated_fields": update_fields}
 
 
@@ -350,26 +554,8 @@ async def clear_device_files(location_id: str, device_id: str, db=Depends(get_da
     if not ObjectId.is_valid(location_id) or not ObjectId.is_valid(device_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
 
-    location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-    if not location:
-        raise HTTPException(status_code=404, detail="Location not found")
-
-    devices = location.get("devices", [])
-    updated = False
-
-    for device in devices:
-        if str(device.get("_id")) == device_id:
-            device["photo"] = ""
-            device["video"] = ""
-            updated = True
-            break
-
-    if not updated:
-        raise HTTPException(status_code=404, detail="Device not found")
-
-    await db["locations"].update_one(
-        {"_id": ObjectId(location_id)},
-        {"$set": {"devices": devices}}
+    await _update_device_field(
+        location_id, device_id, {"photo": "", "video": "", "photoHash": None, "videoHash": None}, db
     )
 
     return {
@@ -395,13 +581,64 @@ async def set_device_changed_false(location_id: str, device_id: str, db=Depends(
     return await _update_device_field(location_id, device_id, {"changed": "false"}, db)
 
 
+@router.post("/{location_id}/devices/assign-media", status_code=200)
+async def assign_media_to_devices(location_id: str, body: AssignMediaRequest, db=Depends(get_database)):
+    """
+    Przypisuje plik wielu urządzeniom naraz (zamiast delete-files + PUT photo/video +
+    changed-true + PUT thumbnail dla każdego urządzenia osobno).
+    Cel: `device_ids` albo `group_id`. Ustawia pole `mediaType`, czyści drugie,
+    ustawia `changed: "true"` i `thumbnail`.
+    Przykład body: { "device_ids": ["..."], "filename": "promo.mp4", "mediaType": "video" }
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    if bool(body.device_ids) == bool(body.group_id):
+        raise HTTPException(status_code=400, detail="Provide either device_ids or group_id")
+    if body.group_id and not ObjectId.is_valid(body.group_id):
+        raise HTTPException(status_code=400, detail="Invalid group ID format")
+
+    if not await _location_exists(location_id, db):
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    target = {"location_id": ObjectId(location_id)}
+    if body.group_id:
+        target["groups"] = ObjectId(body.group_id)
+    else:
+        target["_id"] = {"$in": body.device_ids}
+
+    # Identyfikatory celów ustalamy raz – ten sam zbiór trafia do update_many i do dziennika zmian
+    device_ids = await db[DEVICES].distinct("_id", target)
+    other_field = "video" if body.mediaType == "photo" else "photo"
+    if device_ids:
+        await db[DEVICES].update_many(
+            {"_id": {"$in": device_ids}, "location_id": ObjectId(location_id)},
+            {"$set": {
+                body.mediaType: body.filename,
+                f"{body.mediaType}Hash": blob_hash(body.filename),
+                other_field: "",
+                f"{other_field}Hash": None,
+                "changed": "true",
+                "thumbnail": body.filename
+            }}
+        )
+        await record_change(db, location_id, device_ids, op="media")
+        # Siatka urządzeń zaraz pokaże miniaturkę tego pliku
+        await warm_thumbnails(db, location_id, body.filename, priority=PRIORITY_INTERACTIVE)
+
+    updated = set(device_ids)
+    return {
+        "message": f"Assigned {body.filename} to {len(device_ids)} device(s)",
+        "updated": device_ids,
+        "not_found": [d for d in (body.device_ids or []) if d not in updated]
+    }
+
+
 from fastapi import UploadFile, File
 import os
 from pathlib import Path
-import shutil
 
 # Konfiguracja ścieżki do przechowywania plików
-UPLOAD_DIR = ""  # Główny katalog dla przesyłanych plików
+UPLOAD_DIR = settings.UPLOAD_DIR  # Główny katalog dla przesyłanych plików
 
 @router.post("/{location_id}/upload-file/")
 async def upload_file_to_location(
@@ -418,32 +655,35 @@ async def upload_file_to_location(
             )
 
         # Check if location exists
-        location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-        if not location:
+        if not await _location_exists(location_id, db):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Location not found"
             )
 
-        # Create upload directory if it doesn't exist
-        location_dir = Path(UPLOAD_DIR) / location_id
-        location_dir.mkdir(parents=True, exist_ok=True)
+        # Zapis porcjami poza pętlą zdarzeń, do pliku tymczasowego i atomowa zmiana nazwy
+        directory = location_path(location_id)
+        filename = safe_filename(file.filename)
+        file_path = directory / filename
 
-        # Save the file
-        file_path = location_dir / file.filename
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        stored = await stream_to_temp(file, directory)
+        previous = await get_manifest_entry(db, location_id, filename)
+        await commit_temp(stored["tmp_path"], file_path)
+        await after_file_written(db, location_id, filename, stored, previous)
 
         # Return the path where the file was saved
         return {
             "message": "File uploaded successfully",
             "location_id": location_id,
-            "filename": file.filename,
+            "filename": filename,
             "file_path": str(file_path),
-            "file_size": os.path.getsize(file_path)
+            "file_size": stored["size"],
+            "sha256": stored["sha256"],
+            "md5": stored["md5"]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
         raise HTTPException(
@@ -452,27 +692,130 @@ async def upload_file_to_location(
         )
 
 
+@router.post("/{location_id}/blobs", status_code=status.HTTP_201_CREATED)
+async def upload_blob_to_location(
+    location_id: str,
+    file: UploadFile = File(...),
+    db=Depends(get_database)
+):
+    """
+    Wgrywa plik adresowany treścią: zapisany jako `<sha256>.<ext>`, ten sam plik wgrany
+    ponownie nie zajmuje miejsca drugi raz. Zwróconą nazwę przypisuje się urządzeniom
+    (photo/video, assign-media), a skrót trafia do photoHash/videoHash.
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    if not await _location_exists(location_id, db):
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    try:
+        directory = location_path(location_id)
+        stored = await stream_to_temp(file, directory)
+        extension = Path(file.filename or "").suffix.lstrip(".").lower()
+        if not extension:
+            with open(stored["tmp_path"], "rb") as f:
+                extension = sniff_extension(f.read(16))
+        sha256 = stored["sha256"]
+        filename = f"{sha256}.{extension}"
+        existed = (directory / filename).exists()
+        if existed:
+            await discard_temp(stored["tmp_path"])
+        else:
+            await commit_temp(stored["tmp_path"], directory / filename)
+            await after_file_written(db, location_id, filename, stored)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error storing blob: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error storing blob: {str(e)}"
+        )
+
+    return {
+        "message": "Blob already stored" if existed else "Blob stored",
+        "sha256": sha256,
+        "filename": filename,
+        "original_filename": file.filename,
+        "file_size": stored["size"],
+        "md5": stored["md5"]
+    }
+
+
 from fastapi.responses import FileResponse
 
+async def _device_variant_response(request: Request, db, location_id: str, filename: str):
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    state = await request_device_variant(db, location_id, filename)
+    if state is None:
+        # Plik spoza manifestu (wgrany ręcznie) – dopisz go i spróbuj ponownie
+        await index_file(db, location_id, filename)
+        state = await request_device_variant(db, location_id, filename)
+
+    if state["status"] == "processing":
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"status": "processing", "variant": DEVICE_VARIANT},
+            headers={"Retry-After": "5"}
+        )
+    if state["status"] == "unsupported":
+        raise HTTPException(status_code=415, detail="File type has no device variant")
+    if state["status"] == "failed":
+        raise HTTPException(status_code=422, detail=f"Device variant failed: {state.get('error')}")
+
+    headers = {"X-Media-Variant": DEVICE_VARIANT}
+    if state.get("md5"):
+        headers[DEVICE_MD5_HEADER] = state["md5"]
+    # Adres bez ?v= wskazuje bieżącą treść pliku, więc nie jest niezmienny (nawet jeśli wersja jest)
+    return await media_response(
+        request, state["path"], immutable="v" in request.query_params, extra_headers=headers
+    )
+
+
 @router.get("/{location_id}/files/{filename}")
 async def get_file_from_location(
     location_id: str,
-    filename: str
+    filename: str,
+    request: Request,
+    variant: Optional[str] = None,
+    db=Depends(get_database)
 ):
     """
-    Download a file from a specific location
+    Download a file from a specific location.
+    Obsługuje ETag (SHA-256 treści), Last-Modified, 304 oraz Range (206) – przewijanie
+    <video> w galerii i ponowne odpytywanie przez skrypty nie pobiera całego pliku.
+    Pliki `<sha256>.<ext>` i adresy z `?v=` są cache'owane jako niezmienne.
+    Nagłówek X-Device-MD5 niesie MD5 w formacie cenówek (z manifestu) – skrypt wysyłający
+    nie musi liczyć go ponownie.
+    `?variant=device` zwraca MP4 w profilu cenówek (kodowany raz na treść); dopóki się
+    koduje – 202 z Retry-After.
     """
+    if variant is not None and variant != DEVICE_VARIANT:
+        raise HTTPException(status_code=400, detail=f"Unknown variant: {variant}")
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    filename = safe_filename(filename)
     try:
-        file_path = Path(UPLOAD_DIR) / location_id / filename
-        
-        if not file_path.exists():
+        file_path = location_path(location_id) / filename
+
+        if not file_path.is_file():
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="File not found"
             )
 
-        return FileResponse(file_path)
+        if variant:
+            return await _device_variant_response(request, db, location_id, filename)
+
+        # ETag i MD5 z manifestu (odświeżany, gdy plik podmieniono poza API) – bez haszowania pliku
+        entry = await current_manifest_entry(db, location_id, filename)
+        return await media_response(
+            request, file_path, extra_headers={DEVICE_MD5_HEADER: entry["md5"]}, sha256=entry["sha256"]
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving file: {str(e)}")
         raise HTTPException(
@@ -482,19 +825,114 @@ async def get_file_from_location(
 
 
 
+@router.get("/{location_id}/files/{filename}/meta")
+async def get_file_meta(location_id: str, filename: str, request: Request, db=Depends(get_database)):
+    """
+    Metadane pliku z manifestu (badane raz przy zapisie): size, mime, sha256, md5,
+    duration, width, height, fps, video_codec, audio_codec, has_audio, bit_rate, pix_fmt
+    oraz stan wersji pochodnych ("device", "preview").
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    filename = safe_filename(filename)
+    if not (location_path(location_id) / filename).is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+
+    entry = await current_manifest_entry(db, location_id, filename)
+    meta = manifest_entry_response(entry)
+    variants = ",".join(f"{name}={state['status']}" for name, state in sorted((meta.get("variants") or {}).items()))
+    etag = f'W/"{entry["sha256"]}:{variants}"'
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return JSONResponse(content=meta, headers={"ETag": etag})
+
+
+@router.get("/{location_id}/files/{filename}/preview")
+async def get_file_preview(location_id: str, filename: str, db=Depends(get_database)):
+    """
+    Animowany podgląd wideo (WebP, kilka sekund, mała rozdzielczość). Gotowy – przekierowanie
+    na niezmienny adres z listy plików (`preview_url`); brakujący jest zlecany w tle i
+    odpowiedź to 202 z `job_id`.
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    filename = safe_filename(filename)
+    if not (location_path(location_id) / filename).is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+
+    await current_manifest_entry(db, location_id, filename)
+    state = await request_preview(db, location_id, filename, priority=PRIORITY_INTERACTIVE)
+    if state["status"] == "processing":
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"status": "processing", "job_id": state["job_id"]},
+            headers={"Retry-After": "2"}
+        )
+    if state["status"] == "unsupported":
+        raise HTTPException(status_code=415, detail="Only videos have animated previews")
+    if state["status"] == "failed":
+        raise HTTPException(status_code=422, detail=f"Preview failed: {state.get('error')}")
+    return RedirectResponse(state["url"], status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+
+@router.get("/{location_id}/previews/{name}")
+async def get_preview(location_id: str, name: str, request: Request):
+    """Plik podglądu `<sha256>.webp` – treść pod tym adresem się nie zmienia (Cache-Control: immutable)."""
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    sha256 = blob_hash(name)
+    if not sha256 or not name.endswith(".webp"):
+        raise HTTPException(status_code=404, detail="Preview not found")
+    path = preview_path(location_id, sha256)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Preview not found")
+    return await media_response(request, path, immutable=True)
+
+
 @router.get("/{location_id}/files/")
-async def list_files_in_location(location_id: str):
+async def list_files_in_location(
+    location_id: str,
+    request: Request,
+    sort: str = "name",
+    order: str = "asc",
+    offset: int = 0,
+    limit: Optional[int] = None,
+    refresh: bool = False,
+    db=Depends(get_database)
+):
     """
-    List all files in a specific location
+    List all files in a specific location – z manifestu (kolekcja media), bez chodzenia po dysku.
+    `files` to jak dawniej lista nazw; `items` zawiera size, mtime, mime, sha256, md5
+    i metadane z ffprobe (duration, width, height, fps, kodeki, has_audio, bit_rate), stan wersji
+    pochodnych (`variants`) i `preview_url` – animowany podgląd wideo, gdy jest gotowy (null, gdy nie).
+    Sortowanie: sort=name|size|mtime, order=asc|desc;
+    stronicowanie: offset/limit. `refresh=true` porównuje manifest z katalogiem.
     """
-    try:
-        location_dir = Path(UPLOAD_DIR) / location_id
-        
-        if not location_dir.exists():
-            return {"files": []}
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    if sort not in MANIFEST_SORT_FIELDS or order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid sort or order")
+    if offset < 0 or (limit is not None and limit < 1):
+        raise HTTPException(status_code=400, detail="Invalid offset or limit")
 
-        files = [f.name for f in location_dir.iterdir() if f.is_file()]
-        return {"files": files}
+    try:
+        media_rev = await manifest_state(db, location_id, refresh=refresh)
+        if media_rev is None:
+            return {"files": [], "items": [], "total": 0, "offset": offset, "limit": limit}
+
+        etag = make_etag(location_id, media_rev, f"files:{sort}:{order}:{offset}:{limit}")
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+
+        page = await list_manifest(db, location_id, sort, order, offset, limit)
+        page["files"] = [item["filename"] for item in page["items"]]
+        for item in page["items"]:
+            # Animowany podgląd wideo (adres niezmienny – zawiera skrót treści)
+            ready = (item.get("variants") or {}).get(PREVIEW_VARIANT, {}).get("status") == "ready"
+            item["preview_url"] = preview_url(location_id, item["sha256"]) if ready else None
+        return JSONResponse(content=page, headers={"ETag": etag})
 
     except Exception as e:
         logger.error(f"Error listing files: {str(e)}")
@@ -506,7 +944,6 @@ async def list_files_in_location(location_id: str):
 
 
 # Dodaj te importy na górze pliku z endpointami FastAPI
-from PIL import Image
 import io
 import asyncio
 import os
@@ -519,136 +956,188 @@ from bson import ObjectId # Jeśli używasz MongoDB, upewnij się, że masz to z
 # --- WAŻNE --- Upewnij się, że UPLOAD_DIR jest zdefiniowany i ma sensowną ścieżkę
 # PRZYKŁAD: UPLOAD_DIR = Path("uploads") # To stworzy katalog 'uploads' w miejscu, gdzie uruchamiasz skrypt
 # UPEWNIJ SIĘ, ŻE TEN KATALOG ISTNIEJE LUB JEST TWORZONY PRZY STARCIE APLIKACJI
-UPLOAD_DIR = Path("") # <-- Popraw lub zweryfikuj tę linię
+UPLOAD_DIR = Path(settings.UPLOAD_DIR)
 
 # Pamiętaj o importowaniu loggera, jeśli go używasz
 # from loguru import logger # Przykładowy logger
 
+async def _thumbnail_file(db, location_id: str, filename: str, size: int, fmt: str = "png"):
+    """
+    Miniaturka z cache (`.thumbcache`, klucz: treść + rozmiar + format), w razie potrzeby
+    wygenerowana (utils/thumbnails.get_thumbnail). Zwraca ścieżkę pliku albo odpowiedź 202,
+    gdy zadanie miniaturki wideo jeszcze trwa.
+    """
+    sha256 = (await current_manifest_entry(db, location_id, filename))["sha256"]
+    result = await get_thumbnail(db, location_id, filename, sha256, size, fmt)
+    if isinstance(result, Path):
+        return result
+    if result["status"] == "failed":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error generating thumbnail: {result.get('error')}"
+        )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": str(result["_id"]), "status": result["status"]},
+        headers={"Retry-After": "2"}
+    )
+
+
 @router.get("/{location_id}/files/{filename}/thumbnail")
 async def get_file_thumbnail(
     location_id: str,
     filename: str,
-    size: int = 128  # Rozmiar miniaturki (kwadrat)
+    request: Request,
+    size: int = 128,  # Rozmiar miniaturki (kwadrat)
+    fmt: str = Query("png", alias="format"),
+    db=Depends(get_database)
 ):
     """
-    Zwraca miniaturkę pliku (obrazu lub klatki z wideo).
+    Zwraca miniaturkę pliku (obrazu lub klatki z wideo) w formacie png/webp/jpeg.
+    Miniaturki są trwale cache'owane na dysku (klucz: treść pliku, rozmiar, format), a
+    odpowiedź ma ETag – ponowne ładowanie galerii to trafienia w cache albo 304.
+    Obrazy skalowane są w puli wątków obrazów (poza pętlą zdarzeń), klatki wideo w puli
+    zadań – jeśli nie skończy się w THUMBNAIL_WAIT_SECONDS, odpowiedź to 202 z `job_id`
+    (GET /api/jobs/{job_id}).
     """
-    try:
-        # Możesz dodać walidację location_id, jeśli jest to wymagane dla twojej logiki
-        # if not ObjectId.is_valid(location_id):
-        #     raise HTTPException(
-        #         status_code=status.HTTP_400_BAD_REQUEST,
-        #         detail="Invalid location ID format"
-        #     )
-
-        file_path = UPLOAD_DIR / location_id / filename
-        # print(f"Attempting to get thumbnail for: {file_path}") # Dodaj to do debugowania
-
-        if not file_path.exists():
-            # print(f"File not found at: {file_path}") # Dodaj to do debugowania
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="File not found"
-            )
-
-        file_extension = file_path.suffix.lower()
-
-        if file_extension in [".jpg", ".jpeg", ".png", ".gif", ".bmp"]:
-            # Przetwarzanie obrazów
-            img = Image.open(file_path)
-            img.thumbnail((size, size))
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='PNG')  # Zawsze zwracaj PNG dla spójności
-            return Response(img_byte_arr.getvalue(), media_type="image/png")
-
-        elif file_extension in [".mp4", ".mov", ".avi", ".mkv"]:
-            # Generowanie miniaturki z wideo za pomocą ffmpeg
-            thumbnail_dir = file_path.parent / ".thumbnails"
-            thumbnail_dir.mkdir(exist_ok=True)
-            thumbnail_filename = f"{file_path.stem}.png"
-            thumbnail_path = thumbnail_dir / thumbnail_filename
-
-            # Sprawdź, czy miniaturka już istnieje
-            if not thumbnail_path.exists():
-                # Użyj ffmpeg do wygenerowania miniaturki z 5 sekundy wideo
-                # Możesz dostosować '-ss' (czas startu) i '-vframes' (ilość klatek)
-                cmd = [
-                    "ffmpeg",
-                    "-i", str(file_path),
-                    "-ss", "00:00:05",  # Weź klatkę z 5 sekundy
-                    "-vframes", "1",
-                    "-vf", f"scale={size}:-1", # Skaluj do szerokości 'size', wysokość auto
-                    "-f", "image2",
-                    "-y", # Nadpisz istniejący plik bez pytania
-                    str(thumbnail_path)
-                ]
-                # print(f"Running FFmpeg command: {' '.join(cmd)}") # Dodaj to do debugowania
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                stdout, stderr = await process.communicate()
-
-                if process.returncode != 0:
-                    error_msg = stderr.decode()
-                    # logger.error(f"FFmpeg error: {error_msg}") # Użyj, jeśli masz logger
-                    print(f"FFmpeg error: {error_msg}") # Wypisz do konsoli
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="Could not generate video thumbnail: " + error_msg
-                    )
-
-            if not thumbnail_path.exists():
-                # logger.error("Thumbnail generation failed unexpectedly, file not found after FFmpeg.")
-                print("Thumbnail generation failed unexpectedly, file not found after FFmpeg.")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Thumbnail generation failed unexpectedly"
-                )
-
-            # Zwróć wygenerowaną miniaturkę
-            return FileResponse(thumbnail_path, media_type="image/png")
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Unsupported file type for thumbnail generation"
-            )
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid location ID format"
+        )
+    if not 16 <= size <= 1024:
+        raise HTTPException(status_code=400, detail="Thumbnail size must be between 16 and 1024")
+    if fmt not in THUMBNAIL_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported thumbnail format: {fmt}")
 
-    except HTTPException as http_exc:
-        raise http_exc
-    except FileNotFoundError:
-        # To złapie błąd, jeśli 'ffmpeg' nie zostanie znaleziony w PATH
-        # logger.error("FFmpeg command not found. Is FFmpeg installed and in your system's PATH?")
-        print("FFmpeg command not found. Is FFmpeg installed and in your system's PATH?")
+    filename = safe_filename(filename)
+    if not (UPLOAD_DIR / location_id / filename).exists():
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="FFmpeg is not installed or not in system PATH. Cannot generate video thumbnails."
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    if media_kind(filename) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported file type for thumbnail generation"
         )
+
+    try:
+        result = await _thumbnail_file(db, location_id, filename, size, fmt)
+        if isinstance(result, Response):
+            return result
+        return await media_response(request, result)
+
+    except HTTPException:
+        raise
     except Exception as e:
-        # logger.error(f"Error generating thumbnail for {filename}: {str(e)}")
-        print(f"Error generating thumbnail for {filename}: {str(e)}")
+        logger.error(f"Error generating thumbnail for {filename}: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating thumbnail: {str(e)}"
         )
 
 
+@router.post("/{location_id}/thumbnails/sprite")
+async def get_thumbnail_sprite(
+    location_id: str,
+    body: ThumbnailSpriteRequest,
+    db=Depends(get_database)
+):
+    """
+    Miniaturki wielu plików jednym żądaniem – arkusz (sprite) w formacie webp/png/jpeg,
+    np. cała galeria. Kafelki `size`×`size` ułożone po SPRITE_COLUMNS w rzędzie.
+    Odpowiedź to mapa (JSON) z adresem arkusza:
+        {"url": "/api/locations/{id}/thumbnails/sprites/sprite-<klucz>-128.webp",
+         "size": 128, "columns": 10, "tiles": {"promo.mp4": {"x": 0, "y": 0}, ...},
+         "pending": [...], "failed": [...], "missing": [...]}
+    `pending` – klatka wideo jeszcze się generuje (pusty kafelek, warto ponowić za chwilę),
+    `missing` – pliku nie ma w lokalizacji albo nie ma dla niego miniaturek (pominięty).
+    Kafelki pochodzą z cache miniaturek; arkusz jest kluczowany treścią plików, więc jego
+    adres jest niezmienny (Cache-Control: immutable).
+    Przykład body: { "filenames": ["promo.mp4", "cube.png"], "size": 128, "format": "webp" }
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    if not body.filenames:
+        raise HTTPException(status_code=400, detail="No filenames given")
+    if len(body.filenames) > SPRITE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {SPRITE_MAX_FILES} files per sprite")
+    if not 16 <= body.size <= SPRITE_MAX_TILE:
+        raise HTTPException(status_code=400, detail=f"Tile size must be between 16 and {SPRITE_MAX_TILE}")
+    if len(body.filenames) * body.size ** 2 > SPRITE_MAX_PIXELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Sprite too large: {SPRITE_MAX_PIXELS // body.size ** 2} files at most for tile size {body.size}"
+        )
+
+    filenames = list(dict.fromkeys(safe_filename(name) for name in body.filenames))
+    found = {
+        entry["filename"]: entry
+        async for entry in db[MANIFEST].find(
+            {"location_id": ObjectId(location_id), "filename": {"$in": filenames}},
+            {"filename": 1, "sha256": 1}
+        )
+    }
+    entries = [found[name] for name in filenames if name in found and media_kind(name)]
+    missing = [name for name in filenames if name not in found or not media_kind(name)]
+    if not entries:
+        raise HTTPException(status_code=404, detail="None of the files have thumbnails")
+
+    try:
+        path, mapping = await thumbnail_sprite(db, location_id, entries, body.size, body.format)
+    except Exception as e:
+        logger.error(f"Error generating thumbnail sprite for location {location_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating thumbnail sprite: {str(e)}")
+
+    return {
+        "url": f"/api/locations/{location_id}/thumbnails/sprites/{path.name}",
+        **mapping,
+        "missing": missing
+    }
+
+
+@router.get("/{location_id}/thumbnails/sprites/{name}")
+async def get_sprite_sheet(location_id: str, name: str, request: Request):
+    """Arkusz miniaturek z POST .../thumbnails/sprite – nazwa wyznacza treść, więc jest niezmienny."""
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    path = sprite_file(location_id, name)
+    if path is None or not path.is_file():
+        # Arkusz usunięty z cache (LRU) – klient prosi o niego ponownie przez POST
+        raise HTTPException(status_code=404, detail="Sprite not found")
+    return await media_response(request, path, immutable=True)
+
+
+@router.post("/{location_id}/thumbnails/warm", status_code=202)
+async def warm_location_thumbnails(location_id: str, db=Depends(get_database)):
+    """
+    Zadanie administracyjne: generuje w tle brakujące miniaturki standardowych rozmiarów
+    wszystkich plików lokalizacji. Zwraca zadanie – postęp (`progress`: total, done,
+    generated, failed) w GET /api/jobs/{job_id}. Ponowne wywołanie, gdy zadanie jeszcze
+    trwa, zwraca to samo zadanie.
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+    if await manifest_state(db, location_id) is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return job_response(await request_warm_location(db, location_id))
+
+
 @router.get("/{location_id}/devices/{device_id}/thumbnail", response_class=FileResponse)
 async def generate_and_get_thumbnail(location_id: str, device_id: str, db=Depends(get_database), size: int = 128):
     """
-    Generuje i zwraca miniaturkę wideo urządzenia, zapisując ją w polu `thumbnail`.
+    Generuje i zwraca miniaturkę wideo urządzenia; w polu `thumbnail` zapisuje nazwę
+    pliku wideo (miniaturka z cache jest rozwiązywana przy każdym żądaniu).
+    Generowanie idzie przez pulę zadań (jak /files/{filename}/thumbnail).
     """
     try:
         if not ObjectId.is_valid(location_id) or not ObjectId.is_valid(device_id):
             raise HTTPException(status_code=400, detail="Invalid ID format")
 
-        location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-        if not location:
-            raise HTTPException(status_code=404, detail="Location not found")
-
-        devices = location.get("devices", [])
-        target_device = next((d for d in devices if str(d["_id"]) == device_id), None)
+        target_device = await db[DEVICES].find_one(
+            {"_id": device_id, "location_id": ObjectId(location_id)}
+        )
 
         if not target_device:
             raise HTTPException(status_code=404, detail="Device not found")
@@ -661,47 +1150,19 @@ async def generate_and_get_thumbnail(location_id: str, device_id: str, db=Depend
         if not video_path.exists():
             raise HTTPException(status_code=404, detail="Video file not found")
 
-        # Generuj ścieżkę miniaturki
-        thumbnail_dir = video_path.parent / ".thumbnails"
-        thumbnail_dir.mkdir(exist_ok=True)
-        thumbnail_filename = f"{video_path.stem}.png"
-        thumbnail_path = thumbnail_dir / thumbnail_filename
-
-        if not thumbnail_path.exists():
-            cmd = [
-                "ffmpeg",
-                "-i", str(video_path),
-                "-ss", "00:00:05",
-                "-vframes", "1",
-                "-vf", f"scale={size}:-1",
-                "-f", "image2",
-                "-y",
-                str(thumbnail_path)
-            ]
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            _, stderr = await process.communicate()
+        result = await _thumbnail_file(db, location_id, video_filename, size)
+        if isinstance(result, Response):
+            return result
 
-            if process.returncode != 0:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to generate thumbnail: " + stderr.decode()
-                )
-
-        # Zapisz miniaturkę w polu `thumbnail` (jeśli jeszcze nie była zapisana)
-        relative_path = f"{location_id}/.thumbnails/{thumbnail_filename}"
-        if target_device.get("thumbnail") != relative_path:
-            target_device["thumbnail"] = relative_path
-            await db["locations"].update_one(
-                {"_id": ObjectId(location_id)},
-                {"$set": {"devices": devices}}
-            )
+        # W polu `thumbnail` trzymamy nazwę pliku wideo, nie ścieżkę w cache – cache miniaturek
+        # jest przycinany (LRU) i sprzątany, a miniaturkę i tak rozwiązuje ten endpoint
+        if target_device.get("thumbnail") != video_filename:
+            await _update_device_field(location_id, device_id, {"thumbnail": video_filename}, db)
 
-        return FileResponse(thumbnail_path, media_type="image/png")
+        return FileResponse(result, media_type="image/png")
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Thumbnail error: {str(e)}")
 
@@ -717,13 +1178,18 @@ async def update_device_thumbnail(
     db=Depends(get_database)
 ):
     """
-    Ręcznie ustawia ścieżkę miniaturki (`thumbnail`) dla danego urządzenia
+    Ręcznie ustawia ścieżkę miniaturki (`thumbnail`) dla danego urządzenia.
+    Gdy to nazwa pliku lokalizacji, jego miniaturki są od razu zlecane do wygenerowania.
     """
     thumbnail = body.get("thumbnail")
     if not thumbnail:
         raise HTTPException(status_code=400, detail="Missing 'thumbnail' field in body")
 
-    return await _update_device_field(location_id, device_id, {"thumbnail": thumbnail}, db)
+    result = await _update_device_field(location_id, device_id, {"thumbnail": thumbnail}, db)
+    if "/" not in thumbnail:
+        # Plik lokalizacji (a nie ścieżka gotowej miniaturki) – siatka urządzeń zaraz o nią poprosi
+        await warm_thumbnails(db, location_id, thumbnail, priority=PRIORITY_INTERACTIVE)
+    return result
 
 
 @router.delete("/{location_id}/devices", status_code=200)
@@ -738,26 +1204,20 @@ async def remove_all_devices_from_location(location_id: str, db=Depends(get_data
                 detail="Invalid location ID format"
             )
 
-        location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-        if not location:
+        if not await _location_exists(location_id, db):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Location not found"
             )
 
-        result = await db["locations"].update_one(
-            {"_id": ObjectId(location_id)},
-            {"$set": {"devices": []}}
-        )
-
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Devices were not removed"
-            )
+        removed_ids = await db[DEVICES].distinct("_id", {"location_id": ObjectId(location_id)})
+        await db[DEVICES].delete_many({"location_id": ObjectId(location_id)})
+        await record_change(db, location_id, removed_ids, op="delete")
 
         return {"message": f"All devices removed from location {location_id}"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -768,13 +1228,15 @@ async def remove_all_devices_from_location(location_id: str, db=Depends(get_data
 from fastapi import status
 
 @router.delete("/{location_id}/files/{filename}", status_code=status.HTTP_200_OK)
-async def delete_file_from_location(location_id: str, filename: str):
+async def delete_file_from_location(location_id: str, filename: str, db=Depends(get_database)):
     """
     Usuwa fizyczny plik z lokalizacji (i opcjonalnie także miniaturkę, jeśli istnieje).
     """
     try:
-        file_path = UPLOAD_DIR / location_id / filename
-        thumbnail_path = UPLOAD_DIR / location_id / ".thumbnails" / f"{Path(filename).stem}.png"
+        if not ObjectId.is_valid(location_id):
+            raise HTTPException(status_code=400, detail="Invalid location ID format")
+        filename = safe_filename(filename)
+        file_path = location_path(location_id) / filename
 
         # Sprawdź czy plik istnieje
         if not file_path.exists():
@@ -783,18 +1245,22 @@ async def delete_file_from_location(location_id: str, filename: str):
                 detail="Plik nie istnieje"
             )
 
-        # Usuń plik
+        # Usuń plik (i jego wpis w manifeście)
         file_path.unlink()
+        removed = await remove_file(db, location_id, filename)
+        await discard_device_variant(db, location_id, removed and removed.get("sha256"))
+        await discard_preview(db, location_id, removed and removed.get("sha256"))
 
-        # Usuń miniaturkę, jeśli istnieje
-        if thumbnail_path.exists():
-            thumbnail_path.unlink()
+        # Usuń miniaturki tej treści (jeśli nie używa jej inny plik)
+        await discard_thumbnails(db, location_id, removed and removed.get("sha256"), filename)
 
         return {
             "message": f"Plik {filename} został usunięty",
             "location_id": location_id
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -817,6 +1283,9 @@ async def set_device_offline(location_id: str, device_id: str, db=Depends(get_da
     return await _update_device_field(location_id, device_id, {"isOnline": False}, db)
 
 
+_IPV4_RE = re.compile(r"(?:\d{1,3}\.){3}\d{1,3}")
+
+
 @router.put("/{location_id}/devices/{device_id}/ip", status_code=200)
 async def update_device_ip(
     location_id: str,
@@ -833,13 +1302,113 @@ async def update_device_ip(
         raise HTTPException(status_code=400, detail="Missing 'ip' field in body")
 
     # (opcjonalnie) prosta walidacja IPv4
-    import re
-    if not re.fullmatch(r"(?:\d{1,3}\.){3}\d{1,3}", ip):
+    if not _IPV4_RE.fullmatch(ip):
         raise HTTPException(status_code=400, detail="Invalid IPv4 format")
 
     return await _update_device_field(location_id, device_id, {"ip": ip}, db)
 
 
+@router.patch("/{location_id}/devices/bulk", status_code=200)
+async def bulk_update_devices(
+    location_id: str,
+    items: List[DeviceBulkUpdateItem],
+    db=Depends(get_database)
+):
+    """
+    Zbiorcza aktualizacja stanu wielu urządzeń jednym bulk_write.
+    Każdy element wskazuje urządzenie po `device_id` albo `clientId` i podaje `fields`.
+    Przykład body: [{ "clientId": "ABC", "fields": { "isOnline": true, "ip": "192.168.68.201" } }]
+    Zwraca wynik dla każdego elementu (w kolejności z body); pola i typy wartości są
+    sprawdzane modelem DeviceBulkFields – błędny element dostaje `invalid`, reszta się zapisuje.
+    """
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(status_code=400, detail="Invalid location ID format")
+
+    if not await _location_exists(location_id, db):
+        raise HTTPException(status_code=404, detail="Location not found")
+
+    # Jeden odczyt samych identyfikatorów – do rozwiązania clientId -> _id
+    known = await db[DEVICES].find(
+        {"location_id": ObjectId(location_id)}, {"_id": 1, "clientId": 1}
+    ).to_list(length=None)
+    known_ids = {d["_id"] for d in known}
+    by_client_id = {d.get("clientId"): d["_id"] for d in known}
+
+    results = []
+    operations = []
+    operation_items = []
+    for index, item in enumerate(items):
+        result = {"index": index, "device_id": item.device_id, "clientId": item.clientId}
+        results.append(result)
+
+        if item.device_id:
+            stored_id = item.device_id if item.device_id in known_ids else None
+        elif item.clientId:
+            stored_id = by_client_id.get(item.clientId)
+        else:
+            result.update(status="invalid", detail="Missing device_id or clientId")
+            continue
+        if stored_id is None:
+            result.update(status="not_found", detail="Device not found")
+            continue
+
+        if not item.fields:
+            result.update(status="invalid", detail="No fields to update")
+            continue
+        try:
+            update_fields = DeviceBulkFields(**item.fields).model_dump(exclude_unset=True)
+        except ValidationError as e:
+            # Zły typ wartości nie może trafić do bazy – GET /devices przestałby przechodzić walidację
+            result.update(status="invalid", detail="; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            ))
+            continue
+        if "ip" in update_fields and not _IPV4_RE.fullmatch(update_fields["ip"]):
+            result.update(status="invalid", detail="Invalid IPv4 format")
+            continue
+
+        try:
+            # Jak PUT .../photo i .../video: nazwa pliku + skrót, base64 zapisany jako plik
+            for media_field in ("photo", "video"):
+                if media_field in update_fields:
+                    update_fields.update(
+                        await _media_fields(location_id, media_field, update_fields[media_field], db)
+                    )
+        except Exception as e:
+            result.update(status="error", detail=f"Could not store {media_field}: {e}")
+            continue
+
+        result["device_id"] = stored_id
+        operations.append(UpdateOne(
+            {"_id": stored_id, "location_id": ObjectId(location_id)},
+            {"$set": update_fields}
+        ))
+        operation_items.append(result)
+
+    failed = {}
+    if operations:
+        try:
+            await db[DEVICES].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"]: err.get("errmsg", "Write error") for err in e.details.get("writeErrors", [])}
+
+    for op_index, result in enumerate(operation_items):
+        if op_index in failed:
+            result.update(status="error", detail=failed[op_index])
+        else:
+            result["status"] = "updated"
+
+    updated_ids = [r["device_id"] for r in results if r["status"] == "updated"]
+    if updated_ids:
+        await record_change(db, location_id, updated_ids)
+
+    return {
+        "message": "Bulk update processed",
+        "updated": sum(1 for r in results if r["status"] == "updated"),
+        "results": results
+    }
+
+
 @router.put("/{location_id}")
 async def update_location(location_id: str, body: dict, db=Depends(get_database)):
     if not ObjectId.is_valid(location_id):
@@ -850,6 +1419,5 @@ async def update_location(location_id: str, body: dict, db=Depends(get_database)
     if not updates: raise HTTPException(400, "No fields to update")
     res = await db["locations"].update_one({"_id": ObjectId(location_id)}, {"$set": updates})
     if res.matched_count == 0: raise HTTPException(404, "Location not found")
-    doc = await db["locations"].find_one({"_id": ObjectId(location_id)})
-    doc["_id"] = str(doc["_id"])
-    return doc
+    await record_change(db, location_id, op="location")
+    return await _load_location(location_id, db)
@@ -1,9 +1,11 @@
 # 📁 api/schedules.py
-from fastapi import APIRouter, HTTPException, status, Request, Depends
+from fastapi import APIRouter, HTTPException, status, Request, Response, Depends
 from typing import List, Optional, Union, Literal
 from pydantic import BaseModel, Field
 from bson import ObjectId
 from datetime import datetime
+from utils.revisions import get_revision, make_etag, not_modified
+from utils.changes import record_change
 
 router = APIRouter()
 
@@ -56,10 +58,19 @@ async def add_schedule(location_id: str, device_id: str, schedule: ScheduleModel
         "createdAt": datetime.utcnow()
     })
     await db["schedules"].insert_one(doc)
+    await record_change(db, location_id, [device_id], op="schedules")
     return {"message": "Schedule added"}
 
 @router.get("/locations/{location_id}/devices/{device_id}/schedules", response_model=List[ScheduleModel])
-async def get_device_schedules(location_id: str, device_id: str, db=Depends(get_database)):
+async def get_device_schedules(location_id: str, device_id: str, request: Request, response: Response, db=Depends(get_database)):
+    rev = await get_revision(db, location_id) if ObjectId.is_valid(location_id) else None
+    if rev is not None:
+        etag = make_etag(location_id, rev, f"schedules:{device_id}")
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
+        response.headers["ETag"] = etag
+
     cursor = db["schedules"].find({
         "locationId": ObjectId(location_id),
         "deviceId": ObjectId(device_id)
@@ -80,6 +91,8 @@ async def delete_all_schedules(location_id: str, device_id: str, db=Depends(get_
         "locationId": ObjectId(location_id),
         "deviceId": ObjectId(device_id)
     })
+    if result.deleted_count:
+        await record_change(db, location_id, [device_id], op="schedules")
     return {"message": f"Deleted {result.deleted_count} schedule(s)"}
 
 @router.get("/locations/{location_id}/devices/{device_id}/has-schedule")
@@ -90,6 +103,6 @@ async def check_device_has_schedule(location_id: str, device_id: str, db=Depends
     has_schedule = await db["schedules"].count_documents({
         "locationId": ObjectId(location_id),
         "deviceId": ObjectId(device_id)
-    }) > 0
+    }, limit=1) > 0
 
     return {"hasSchedule": has_schedule}
\ No newline at end of file
@@ -0,0 +1,245 @@
+# 📁 api/uploads.py – wznawialny upload dużych plików (sesje + porcje)
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Request, Depends
+from pydantic import BaseModel, Field
+from pymongo import ReturnDocument
+
+from config import settings
+from utils.blobs import location_dir
+from utils.cache import location_exists
+from utils.derived import after_file_written
+from utils.manifest import get_entry as get_manifest_entry
+from utils.uploads import (
+    UPLOAD_SESSIONS, commit_temp, discard_temp, file_digests, open_part_at, safe_filename, session_part_path
+)
+
+router = APIRouter()
+
+def get_database(request: Request):
+    return request.app.mongodb
+
+# Zapis porcji, który trwa dłużej, uznajemy za przerwany (np. restart API) i zwalniamy blokadę
+WRITE_LOCK_SECONDS = 120
+# Co ile sekund trwający zapis odświeża swoją blokadę
+WRITE_LOCK_REFRESH_SECONDS = WRITE_LOCK_SECONDS / 4
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., description="Docelowa nazwa pliku w katalogu lokalizacji")
+    size: int = Field(..., gt=0, description="Rozmiar całego pliku w bajtach")
+    sha256: Optional[str] = Field(None, description="Oczekiwany SHA-256 – sprawdzany przy zakończeniu")
+
+
+def _session_response(session: dict) -> dict:
+    return {
+        "upload_id": str(session["_id"]),
+        "filename": session["filename"],
+        "size": session["size"],
+        "offset": session["offset"],
+        "chunks": session.get("chunks", 0),
+        "complete": session["offset"] >= session["size"],
+        "chunk_size": settings.UPLOAD_CHUNK_SIZE,
+        "expires_at": session["updated_at"] + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS)
+    }
+
+
+async def _get_session(db, location_id: str, upload_id: str) -> dict:
+    if not ObjectId.is_valid(location_id) or not ObjectId.is_valid(upload_id):
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+    session = await db[UPLOAD_SESSIONS].find_one(
+        {"_id": ObjectId(upload_id), "location_id": ObjectId(location_id)}
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+# 1. POST /locations/{location_id}/uploads – rozpocznij sesję
+@router.post("/{location_id}/uploads", status_code=201)
+async def create_upload_session(location_id: str, body: UploadSessionCreate, db=Depends(get_database)):
+    if not ObjectId.is_valid(location_id):
+        raise HTTPException(400, detail="Invalid location ID format")
+    if not await location_exists(db, location_id):
+        raise HTTPException(404, detail="Location not found")
+    if body.size > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(413, detail=f"File exceeds the {settings.MAX_UPLOAD_SIZE} byte upload limit")
+
+    now = datetime.utcnow()
+    session = {
+        "location_id": ObjectId(location_id),
+        "filename": safe_filename(body.filename),
+        "size": body.size,
+        "sha256": body.sha256.lower() if body.sha256 else None,
+        "offset": 0,
+        "chunks": 0,
+        "writing_since": None,
+        "write_token": None,
+        "status": None,
+        "created_at": now,
+        "updated_at": now
+    }
+    result = await db[UPLOAD_SESSIONS].insert_one(session)
+    session["_id"] = result.inserted_id
+    return _session_response(session)
+
+
+# 2. PUT /locations/{location_id}/uploads/{upload_id}?offset=N&index=K – dopisz porcję (surowe body)
+@router.put("/{location_id}/uploads/{upload_id}")
+async def upload_chunk(
+    location_id: str,
+    upload_id: str,
+    request: Request,
+    offset: int,
+    index: Optional[int] = None,
+    db=Depends(get_database)
+):
+    """
+    Porcja musi zaczynać się dokładnie w bieżącym `offset` sesji – inaczej 409 z aktualnym
+    offsetem, od którego klient wznawia. Body jest zapisywane strumieniowo na dysk.
+    """
+    session = await _get_session(db, location_id, upload_id)
+    if offset != session["offset"]:
+        raise HTTPException(409, detail={"message": "Offset mismatch", "offset": session["offset"]})
+
+    # Blokada sesji na czas zapisu – dwie równoległe porcje nie dopiszą się pod ten sam offset.
+    # `write_token` wskazuje właściciela: tylko on odświeża blokadę i przesuwa offset.
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    locked = await db[UPLOAD_SESSIONS].find_one_and_update(
+        {
+            "_id": session["_id"],
+            "offset": offset,
+            "status": {"$ne": "completing"},
+            "$or": [
+                {"writing_since": None},
+                {"writing_since": {"$lt": now - timedelta(seconds=WRITE_LOCK_SECONDS)}}
+            ]
+        },
+        {"$set": {"writing_since": now, "write_token": token}}
+    )
+    if not locked:
+        current = await _get_session(db, location_id, upload_id)
+        raise HTTPException(409, detail={"message": "Chunk already in progress", "offset": current["offset"]})
+
+    owned = {"_id": session["_id"], "write_token": token}
+    part_path = session_part_path(location_dir(location_id), upload_id)
+    new_offset = offset
+    try:
+        f = await asyncio.to_thread(open_part_at, part_path, offset)
+        try:
+            refreshed = asyncio.get_running_loop().time()
+            async for chunk in request.stream():
+                if not chunk:
+                    continue
+                if new_offset + len(chunk) > session["size"]:
+                    raise HTTPException(413, detail="Chunk goes past the declared file size")
+                if asyncio.get_running_loop().time() - refreshed >= WRITE_LOCK_REFRESH_SECONDS:
+                    # Wolny klient – odśwież blokadę; jeśli ją przejęto, przestań pisać do pliku
+                    result = await db[UPLOAD_SESSIONS].update_one(owned, {"$set": {"writing_since": datetime.utcnow()}})
+                    if not result.matched_count:
+                        raise HTTPException(409, detail={"message": "Upload lock lost", "offset": offset})
+                    refreshed = asyncio.get_running_loop().time()
+                await asyncio.to_thread(f.write, chunk)
+                new_offset += len(chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+    except BaseException:
+        # Przerwana porcja – offset zostaje, następna próba przytnie plik do niego
+        await db[UPLOAD_SESSIONS].update_one(owned, {"$set": {"writing_since": None, "write_token": None}})
+        raise
+
+    updated = await db[UPLOAD_SESSIONS].find_one_and_update(
+        {**owned, "offset": offset},
+        {"$set": {"offset": new_offset, "writing_since": None, "write_token": None, "updated_at": datetime.utcnow()},
+         "$inc": {"chunks": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        # Blokadę przejął inny zapis – ta porcja się nie liczy
+        current = await _get_session(db, location_id, upload_id)
+        raise HTTPException(409, detail={"message": "Upload lock lost", "offset": current["offset"]})
+    response = _session_response(updated)
+    if index is not None:
+        response["index"] = index
+    return response
+
+
+# 3. GET /locations/{location_id}/uploads/{upload_id} – postęp
+@router.get("/{location_id}/uploads/{upload_id}")
+async def get_upload_progress(location_id: str, upload_id: str, db=Depends(get_database)):
+    return _session_response(await _get_session(db, location_id, upload_id))
+
+
+# 4. POST /locations/{location_id}/uploads/{upload_id}/complete – zakończ i przenieś plik
+@router.post("/{location_id}/uploads/{upload_id}/complete")
+async def complete_upload(location_id: str, upload_id: str, db=Depends(get_database)):
+    session = await _get_session(db, location_id, upload_id)
+    if session.get("status") == "completing":
+        raise HTTPException(409, detail={"message": "Upload is already being completed", "offset": session["offset"]})
+    if session.get("writing_since"):
+        raise HTTPException(409, detail={"message": "Chunk still in progress", "offset": session["offset"]})
+    if session["offset"] != session["size"]:
+        raise HTTPException(409, detail={"message": "Upload incomplete", "offset": session["offset"]})
+
+    # Atomowe przejęcie sesji – dwa równoległe `complete` nie przeniosą i nie zindeksują pliku dwa razy
+    claimed = await db[UPLOAD_SESSIONS].find_one_and_update(
+        {
+            "_id": session["_id"], "offset": session["size"], "writing_since": None,
+            "status": {"$ne": "completing"}
+        },
+        {"$set": {"status": "completing", "updated_at": datetime.utcnow()}}
+    )
+    if not claimed:
+        current = await _get_session(db, location_id, upload_id)
+        raise HTTPException(409, detail={"message": "Upload is already being completed", "offset": current["offset"]})
+    try:
+        return await _complete_claimed(db, location_id, upload_id, session)
+    except BaseException:
+        # Nieudane zakończenie – sesja wraca do stanu sprzed przejęcia (jeśli jeszcze istnieje)
+        await db[UPLOAD_SESSIONS].update_one(
+            {"_id": session["_id"], "status": "completing"}, {"$set": {"status": None}}
+        )
+        raise
+
+
+async def _complete_claimed(db, location_id: str, upload_id: str, session: dict) -> dict:
+    directory = location_dir(location_id)
+    part_path = session_part_path(directory, upload_id)
+    if not part_path.exists():
+        raise HTTPException(410, detail="Upload data expired")
+
+    digests = await asyncio.to_thread(file_digests, part_path)
+    if session.get("sha256") and digests["sha256"] != session["sha256"]:
+        await discard_temp(str(part_path))
+        await db[UPLOAD_SESSIONS].delete_one({"_id": session["_id"]})
+        raise HTTPException(422, detail="SHA-256 mismatch – upload discarded")
+
+    file_path = directory / session["filename"]
+    previous = await get_manifest_entry(db, location_id, session["filename"])
+    await commit_temp(str(part_path), file_path)
+    await db[UPLOAD_SESSIONS].delete_one({"_id": session["_id"]})
+    await after_file_written(db, location_id, session["filename"], digests, previous)
+
+    return {
+        "message": "File uploaded successfully",
+        "location_id": location_id,
+        "filename": session["filename"],
+        "file_path": str(file_path),
+        "file_size": session["size"],
+        "sha256": digests["sha256"],
+        "md5": digests["md5"]
+    }
+
+
+# 5. DELETE /locations/{location_id}/uploads/{upload_id} – porzuć sesję
+@router.delete("/{location_id}/uploads/{upload_id}")
+async def abort_upload(location_id: str, upload_id: str, db=Depends(get_database)):
+    session = await _get_session(db, location_id, upload_id)
+    await db[UPLOAD_SESSIONS].delete_one({"_id": session["_id"]})
+    await discard_temp(str(session_part_path(location_dir(location_id), upload_id)))
+    return {"message": "Upload session aborted"}
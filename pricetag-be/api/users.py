@@ -4,6 +4,8 @@ from models import User, UserCreate, UserResponse, LocationIdsRequest, UserDevic
 from passlib.context import CryptContext
 from bson import ObjectId
 import logging
+from utils.devices import devices_by_location
+from utils.cache import location_exists
 
 router = APIRouter()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -137,8 +139,7 @@ async def add_locations_to_user(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"Invalid location ID format: {location_id}"
                 )
-            location = await db["locations"].find_one({"_id": ObjectId(location_id)})
-            if not location:
+            if not await location_exists(db, location_id):
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Location with ID {location_id} not found"
@@ -202,19 +203,9 @@ async def get_user_devices(user_id: str, db=Depends(get_database)):
         # Convert string location IDs to ObjectId
         location_object_ids = [ObjectId(loc_id) for loc_id in location_ids]
 
-        # Find all locations that belong to the user
-        locations_cursor = db["locations"].find({"_id": {"$in": location_object_ids}})
-        locations = await locations_cursor.to_list(length=None)
-
-        # Collect all devices from all locations
-        all_devices = []
-        for location in locations:
-            devices = location.get("devices", [])
-            # Convert device _id to string if it exists
-            for device in devices:
-                if "_id" in device and isinstance(device["_id"], ObjectId):
-                    device["_id"] = str(device["_id"])
-            all_devices.extend(devices)
+        # Collect all devices from all user's locations (one query on the devices collection)
+        grouped = await devices_by_location(db, location_object_ids)
+        all_devices = [device for devices in grouped.values() for device in devices]
 
         return UserDevicesResponse(
             user_id=user_id,
@@ -0,0 +1,115 @@
+"""
+Benchmark: aktualizacja pojedynczego urządzenia w lokalizacji.
+
+Porównuje dotychczasowy read-modify-write (find_one + $set całej tablicy devices),
+aktualizację pozycyjną przez arrayFilters (devices.$[d].field) oraz update_one
+na osobnej kolekcji devices, której używa teraz api/locations.py::_update_device_field.
+
+Uruchomienie (z katalogu pricetag-be, korzysta z MONGODB_URI z .env):
+    python -m benchmarks.device_updates
+    python -m benchmarks.device_updates --sizes 10 100 1000 5000 --updates 200
+"""
+import argparse
+import asyncio
+import time
+from statistics import median
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import settings
+
+
+def _make_devices(count: int):
+    return [
+        {
+            "_id": str(ObjectId()),
+            "clientId": f"bench-{i:05d}",
+            "clientName": f"Bench tag {i}",
+            "ip": f"192.168.{i // 256}.{i % 256}",
+            "photo": "",
+            "video": "",
+            "changed": "false",
+            "thumbnail": None,
+            "isOnline": True,
+        }
+        for i in range(count)
+    ]
+
+
+async def _legacy_update(collection, location_id, device_id, fields):
+    location = await collection.find_one({"_id": location_id})
+    devices = location.get("devices", [])
+    for device in devices:
+        if str(device["_id"]) == device_id:
+            device.update(fields)
+            break
+    await collection.update_one({"_id": location_id}, {"$set": {"devices": devices}})
+
+
+async def _positional_update(collection, location_id, device_id, fields):
+    await collection.update_one(
+        {"_id": location_id, "devices._id": device_id},
+        {"$set": {f"devices.$[d].{k}": v for k, v in fields.items()}},
+        array_filters=[{"d._id": device_id}],
+    )
+
+
+async def _collection_update(collection, location_id, device_id, fields):
+    await collection.update_one({"_id": device_id, "location_id": location_id}, {"$set": fields})
+
+
+async def _measure(update_fn, collection, location_id, device_ids, updates):
+    timings = []
+    for i in range(updates):
+        device_id = device_ids[(i * 7919) % len(device_ids)]
+        fields = {"isOnline": bool(i % 2), "ip": f"10.0.{i // 256 % 256}.{i % 256}"}
+        start = time.perf_counter()
+        await update_fn(collection, location_id, device_id, fields)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+async def run(sizes, updates):
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[f"{settings.DATABASE_NAME}_bench"]
+    collection = db["locations"]
+    devices_collection = db["devices"]
+    await devices_collection.create_index([("location_id", 1), ("clientId", 1)], unique=True)
+
+    print(f"{'devices':>8} | {'legacy p50/p95':>17} | {'arrayFilters p50/p95':>20} | {'collection p50/p95':>18}")
+    print("-" * 74)
+    try:
+        for size in sizes:
+            await collection.delete_many({})
+            await devices_collection.delete_many({})
+            devices = _make_devices(size)
+            location_id = (await collection.insert_one(
+                {"name": f"bench-{size}", "address": "-", "devices": devices}
+            )).inserted_id
+            device_ids = [d["_id"] for d in devices]
+
+            legacy = await _measure(_legacy_update, collection, location_id, device_ids, updates)
+            positional = await _measure(_positional_update, collection, location_id, device_ids, updates)
+
+            await devices_collection.insert_many([{**d, "location_id": location_id} for d in devices])
+            separate = await _measure(_collection_update, devices_collection, location_id, device_ids, updates)
+
+            print(f"{size:>8} | {legacy[0]:>6.2f}/{legacy[1]:>6.2f} ms | {positional[0]:>9.2f}/{positional[1]:>6.2f} ms | "
+                  f"{separate[0]:>7.2f}/{separate[1]:>6.2f} ms")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-device update latency vs devices per location")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--updates", type=int, default=200, help="liczba aktualizacji na rozmiar")
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.updates))
+
+
+if __name__ == "__main__":
+    main()
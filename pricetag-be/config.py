@@ -6,6 +6,17 @@ class Settings(BaseSettings):
     MONGODB_URI: str = Field(..., env="MONGODB_URI")
     DATABASE_NAME: str = Field(default="location_management", env="DATABASE_NAME")
     SECRET_KEY: str = Field(default="your-secret-key-here", env="SECRET_KEY")
+    UPLOAD_DIR: str = Field(default="", env="UPLOAD_DIR")
+    UPLOAD_CHUNK_SIZE: int = Field(default=1024 * 1024, env="UPLOAD_CHUNK_SIZE")
+    MAX_UPLOAD_SIZE: int = Field(default=500 * 1024 * 1024, env="MAX_UPLOAD_SIZE")
+    UPLOAD_SESSION_TTL_SECONDS: int = Field(default=24 * 3600, env="UPLOAD_SESSION_TTL_SECONDS")
+    LOCATION_CACHE_SIZE: int = Field(default=1000, env="LOCATION_CACHE_SIZE")
+    LOCATION_CACHE_TTL_SECONDS: float = Field(default=5.0, env="LOCATION_CACHE_TTL_SECONDS")
+    TRANSCODE_CONCURRENCY: int = Field(default=1, env="TRANSCODE_CONCURRENCY")
+    JOB_WORKERS: int = Field(default=0, env="JOB_WORKERS")  # 0 = liczba rdzeni
+    IMAGE_WORKERS: int = Field(default=0, env="IMAGE_WORKERS")  # 0 = liczba rdzeni
+    FFMPEG_CONCURRENCY: int = Field(default=0, env="FFMPEG_CONCURRENCY")  # 0 = liczba rdzeni
+    THUMBNAIL_CACHE_BYTES: int = Field(default=512 * 1024 * 1024, env="THUMBNAIL_CACHE_BYTES")
 
     class Config:
         env_file = ".env"
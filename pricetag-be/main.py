@@ -7,7 +7,21 @@ from api import groups
 from api import schedules
 from api import priceusers
 from api import ai
-
+from api import uploads
+from api import jobs
+from utils import devices as device_store
+from utils import indexes
+from utils.uploads import UploadSizeLimitMiddleware, cleanup_upload_sessions
+from utils.cache import location_cache
+from utils.events import broker as event_broker
+from utils.jobs import pool as job_pool, start_workers
+from utils.imaging import image_pool
+from utils.ffmpeg import ffmpeg
+from utils.thumbnails import WARM_JOB, load_thumbnail_cache, thumbnail_cache, thumbnail_flights
+from utils.previews import PREVIEW_JOB, backfill_previews
+from utils.transcode import TRANSCODE_JOB
+
+import asyncio
 import logging
 
 # Wyłącz debugowanie pymongo i innych bibliotek
@@ -23,6 +37,10 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Limit rozmiaru uploadów multipart – przed buforowaniem body (dodany przed CORS, żeby
+# odpowiedź 413 też miała nagłówki CORS)
+app.add_middleware(UploadSizeLimitMiddleware, paths=("/upload-file/", "/blobs"))
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +48,8 @@ app.add_middleware(
     allow_credentials=True,             # bo używasz cookies
     allow_methods=["*"],
     allow_headers=["*"],                # lub ["Authorization","Content-Type",...]
+    # Nagłówki odpowiedzi czytane przez FE (cache warunkowy, zakresy bajtów)
+    expose_headers=["ETag", "Last-Modified", "Content-Range", "Accept-Ranges", "Content-Length", "X-Device-MD5", "X-Media-Variant"],
 )
 
 # Database connection
@@ -42,13 +62,54 @@ async def startup_db_client():
         await app.mongodb_client.admin.command('ping')
         print(f"✅ Connected to MongoDB at {settings.MONGODB_URI}")
         print(f"📁 Using database: {settings.DATABASE_NAME}")
+
+        # Urządzenia w osobnej kolekcji – skopiuj stary układ i załóż indeksy. Tablica
+        # `locations.devices` zostaje (powrót do poprzedniej wersji); usuwa ją dopiero
+        # jawne `python migrate_devices.py`
+        moved = await device_store.migrate_embedded_devices(app.mongodb, keep_embedded=True)
+        if moved:
+            print(f"📦 Migrated {moved} embedded device(s) to the 'devices' collection")
+        await indexes.ensure_indexes(app.mongodb)
+        for plan in await indexes.audit_query_plans(app.mongodb):
+            if plan["collscan"]:
+                print(f"⚠️  COLLSCAN: {plan['collection']} by {', '.join(plan['fields'])}")
+
+        app.upload_gc_task = asyncio.create_task(collect_upload_sessions())
+        await load_thumbnail_cache()
+        # Pula zadań obróbki mediów; praca w tle (kodowanie, podglądy, rozgrzewanie miniaturek)
+        # nie zajmuje wszystkich workerów
+        start_workers(app.mongodb, kind_limits={
+            TRANSCODE_JOB: settings.TRANSCODE_CONCURRENCY,
+            PREVIEW_JOB: settings.TRANSCODE_CONCURRENCY,
+            WARM_JOB: settings.TRANSCODE_CONCURRENCY
+        })
+        # Podglądy wideo wgranych przed ich wprowadzeniem – zlecane w tle, nie w liście plików
+        queued = await backfill_previews(app.mongodb)
+        if queued:
+            print(f"🎞️  Queued {queued} missing video preview(s)")
     except Exception as e:
         print(f"❌ Failed to connect to MongoDB: {e}")
         print(f"🔧 Check your MONGODB_URI in .env: {settings.MONGODB_URI}")
         raise e
 
+# Co ile sekund sprzątamy porzucone sesje wznawialnego uploadu
+UPLOAD_GC_INTERVAL_SECONDS = 600
+
+async def collect_upload_sessions():
+    while True:
+        try:
+            removed = await cleanup_upload_sessions(app.mongodb)
+            if removed:
+                logging.getLogger(__name__).info(f"Removed {removed} abandoned upload session(s)")
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Upload session cleanup failed: {e}")
+        await asyncio.sleep(UPLOAD_GC_INTERVAL_SECONDS)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.upload_gc_task.cancel()
+    await job_pool.stop()
+    image_pool.shutdown()
     app.mongodb_client.close()
 
 # Include routers
@@ -58,6 +119,8 @@ app.include_router(groups.router, prefix="/api", tags=["groups"])
 app.include_router(schedules.router, prefix="/api")
 app.include_router(priceusers.router, prefix="/api/priceusers", tags=["priceusers"])
 app.include_router(ai.router, prefix="/api/ai", tags=["AI"])
+app.include_router(uploads.router, prefix="/api/locations", tags=["uploads"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
 
 @app.get("/")
 async def root():
@@ -80,6 +143,19 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/metrics")
+async def metrics():
+    """Liczniki procesu API (cache lokalizacji, subskrybenci strumienia zdarzeń, pule zadań, obrazów i ffmpeg)."""
+    return {
+        "location_cache": location_cache.stats(),
+        "event_subscribers": event_broker.subscriber_count(),
+        "jobs": job_pool.stats(),
+        "image_pool": image_pool.stats(),
+        "thumbnail_cache": thumbnail_cache.stats(),
+        "thumbnail_flights": thumbnail_flights.stats(),
+        "ffmpeg": ffmpeg.stats()
+    }
+
 
 
 @app.on_event("startup")
@@ -0,0 +1,37 @@
+"""
+Migracja: urządzenia z tablicy `locations.devices` -> kolekcja `devices`.
+
+Uruchomienie (z katalogu pricetag-be, korzysta z MONGODB_URI z .env):
+    python migrate_devices.py
+    python migrate_devices.py --keep-embedded   # nie usuwaj tablicy z lokalizacji
+
+Skrypt jest idempotentny – można go uruchomić wielokrotnie; istniejących urządzeń
+w `devices` nie nadpisuje. Start API (main.py) wykonuje tylko kopię (jak --keep-embedded);
+usunięcie tablicy z lokalizacji to jawny krok – uruchomienie tego skryptu bez flagi,
+gdy powrót do poprzedniej wersji nie jest już potrzebny.
+"""
+import argparse
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import settings
+from utils.devices import ensure_indexes, migrate_embedded_devices
+
+
+async def run(keep_embedded: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[settings.DATABASE_NAME]
+    try:
+        moved = await migrate_embedded_devices(db, keep_embedded=keep_embedded)
+        await ensure_indexes(db)
+        print(f"✅ Przeniesiono {moved} urządzeń do kolekcji 'devices'")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move embedded location devices to the devices collection")
+    parser.add_argument("--keep-embedded", action="store_true", help="zostaw locations.devices po migracji")
+    args = parser.parse_args()
+    asyncio.run(run(args.keep_embedded))
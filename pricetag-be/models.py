@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, EmailStr, StrictBool, StrictStr
+from typing import Optional, List, Dict, Any, Literal
 from bson import ObjectId
 from enum import Enum
 
@@ -44,12 +44,14 @@ class Device(BaseModel):
     clientId: str = Field(..., description="Unique device identifier")
     clientName: str = Field(..., description="Device name")
     ip: Optional[str] = Field("", description="Device IP address")
-    photo: Optional[str] = Field(None, description="Base64 encoded photo")
-    video: Optional[str] = Field(None, description="Base64 encoded video")
+    photo: Optional[str] = Field(None, description="Nazwa pliku zdjęcia w katalogu lokalizacji")
+    video: Optional[str] = Field(None, description="Nazwa pliku video w katalogu lokalizacji")
     changed: Optional[str] = Field("false", description="Has device been changed")
     thumbnail: Optional[str] = Field(None, description="Path to thumbnail")
     groups: Optional[List[PyObjectId]] = Field(default_factory=list, description="Lista ID grup")
     isOnline: Optional[bool] = Field(default=None, description="Czy urządzenie jest online")
+    photoHash: Optional[str] = Field(None, description="SHA-256 pliku zdjęcia (pliki <sha256>.<ext>)")
+    videoHash: Optional[str] = Field(None, description="SHA-256 pliku video (pliki <sha256>.<ext>)")
 
     class Config:
         allow_population_by_field_name = True
@@ -70,6 +72,39 @@ class DeviceMediaUpdate(BaseModel):
     video: Optional[str] = None
 
 
+class DeviceBulkUpdateItem(BaseModel):
+    device_id: Optional[str] = Field(None, description="_id urządzenia")
+    clientId: Optional[str] = Field(None, description="clientId urządzenia (gdy brak device_id)")
+    fields: Dict[str, Any] = Field(..., description="Pola do ustawienia, np. {\"isOnline\": true, \"ip\": \"...\"}")
+
+
+class DeviceBulkFields(BaseModel):
+    """Pola zbiorczego PATCH – typy jak w `Device`, bez niejawnych konwersji (null tylko tam, gdzie Device go dopuszcza)."""
+    ip: StrictStr = None
+    isOnline: Optional[StrictBool] = None
+    changed: Literal["true", "false"] = None
+    thumbnail: Optional[StrictStr] = None
+    photo: Optional[StrictStr] = None
+    video: Optional[StrictStr] = None
+    clientName: StrictStr = None
+
+    class Config:
+        extra = "forbid"
+
+
+class AssignMediaRequest(BaseModel):
+    device_ids: Optional[List[str]] = Field(None, description="_id urządzeń, którym przypisujemy plik")
+    group_id: Optional[str] = Field(None, description="Albo wszystkie urządzenia z tej grupy")
+    filename: str = Field(..., description="Nazwa pliku w katalogu lokalizacji")
+    mediaType: Literal["photo", "video"] = Field(..., description="Pole urządzenia: photo albo video")
+
+
+class ThumbnailSpriteRequest(BaseModel):
+    filenames: List[str] = Field(..., description="Pliki lokalizacji w kolejności kafelków")
+    size: int = Field(128, description="Bok kwadratowego kafelka w px (16–256)")
+    format: Literal["webp", "png", "jpeg"] = Field("webp", description="Format arkusza")
+
+
 class LocationData(BaseModel):
     name: str = Field(..., description="Location name")
     address: str = Field(..., description="Location address")
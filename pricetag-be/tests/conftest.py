@@ -0,0 +1,55 @@
+"""
+Wspólne fikstury testów API: baza w pamięci (mongomock-motor), katalog uploadów w tmp
+i aplikacja z routerami lokalizacji, grup, uploadów i zadań – bez startu (migracja, workery).
+
+Uruchomienie (z katalogu pricetag-be):
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from api import groups, jobs as jobs_api, locations, uploads
+from config import settings
+from utils.cache import location_cache
+
+
+@pytest.fixture
+def db():
+    location_cache.clear()
+    return AsyncMongoMockClient()["pricetag_test"]
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(locations, "UPLOAD_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def client(db, upload_dir):
+    app = FastAPI()
+    app.include_router(locations.router, prefix="/api/locations")
+    app.include_router(uploads.router, prefix="/api/locations")
+    app.include_router(groups.router, prefix="/api")
+    app.include_router(jobs_api.router, prefix="/api/jobs")
+    app.mongodb = db
+    return TestClient(app)
+
+
+@pytest.fixture
+def create_location(client):
+    """Zakłada lokalizację przez API; zwraca (location_id, {clientId: device_id})."""
+    def create(*client_ids: str):
+        response = client.post("/api/locations/", json={
+            "name": "Sklep",
+            "address": "ul. Testowa 1",
+            "devices": [{"clientId": cid, "clientName": f"Cenówka {cid}"} for cid in client_ids]
+        })
+        assert response.status_code == 201, response.text
+        body = response.json()
+        return body["_id"], {d["clientId"]: d["_id"] for d in body["devices"]}
+    return create
@@ -0,0 +1,64 @@
+import base64
+import hashlib
+
+
+def _devices(client, location_id):
+    return {d["clientId"]: d for d in client.get(f"/api/locations/{location_id}/devices").json()}
+
+
+def test_bulk_update_reports_each_item(client, create_location):
+    location_id, ids = create_location("A", "B")
+
+    response = client.patch(f"/api/locations/{location_id}/devices/bulk", json=[
+        {"clientId": "A", "fields": {"isOnline": False, "ip": "192.168.68.201"}},
+        {"device_id": ids["B"], "fields": {"changed": "true"}},
+        {"clientId": "missing", "fields": {"isOnline": True}},
+        {"fields": {"isOnline": True}},
+    ])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["updated"] == 2
+    assert [r["status"] for r in body["results"]] == ["updated", "updated", "not_found", "invalid"]
+    assert body["results"][0]["device_id"] == ids["A"]
+
+    devices = _devices(client, location_id)
+    assert devices["A"]["isOnline"] is False
+    assert devices["A"]["ip"] == "192.168.68.201"
+    assert devices["B"]["changed"] == "true"
+
+
+def test_bulk_update_rejects_bad_values_per_item(client, create_location):
+    location_id, _ = create_location("A", "B", "C", "D")
+
+    response = client.patch(f"/api/locations/{location_id}/devices/bulk", json=[
+        {"clientId": "A", "fields": {"isOnline": "yes"}},
+        {"clientId": "B", "fields": {"ip": "999.1.1.1"}},
+        {"clientId": "C", "fields": {"groups": []}},
+        {"clientId": "D", "fields": {"changed": "false"}},
+    ])
+
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["invalid", "invalid", "invalid", "updated"]
+    assert "isOnline" in results[0]["detail"]
+    assert results[1]["detail"] == "Invalid IPv4 format"
+    # Złe elementy nie zmieniły urządzeń
+    assert _devices(client, location_id)["A"]["isOnline"] is True
+
+
+def test_bulk_media_fields_match_single_device_endpoint(client, create_location, upload_dir):
+    location_id, ids = create_location("A", "B")
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+    data_url = "data:image/png;base64," + base64.b64encode(png).decode()
+    sha256 = hashlib.sha256(png).hexdigest()
+
+    client.patch(f"/api/locations/{location_id}/devices/bulk", json=[
+        {"clientId": "A", "fields": {"photo": data_url}},
+    ])
+    client.put(f"/api/locations/{location_id}/devices/{ids['B']}/photo", json={"photo": data_url})
+
+    devices = _devices(client, location_id)
+    for client_id in ("A", "B"):
+        assert devices[client_id]["photo"] == f"{sha256}.png"
+        assert devices[client_id]["photoHash"] == sha256
+    assert (upload_dir / location_id / f"{sha256}.png").read_bytes() == png
@@ -0,0 +1,62 @@
+from bson import ObjectId
+
+from utils.cache import LocationCache, location_cache
+from utils.devices import DEVICES
+
+
+def test_stale_read_does_not_overwrite_newer_write():
+    cache = LocationCache(max_entries=2, ttl_seconds=60)
+    generation = cache.generation("loc")
+    # Zapis w trakcie odczytu
+    cache.invalidate("loc")
+    cache.set("loc", {"rev": 1}, generation)
+    assert cache.peek("loc") is None
+
+    cache.set("loc", {"rev": 2}, cache.generation("loc"))
+    assert cache.get("loc") == {"rev": 2}
+
+
+def test_cache_keeps_at_most_max_entries():
+    cache = LocationCache(max_entries=2, ttl_seconds=60)
+    for key in ("a", "b", "c"):
+        cache.set(key, {}, cache.generation(key))
+    assert cache.peek("a") is None
+    assert cache.peek("c") == {}
+
+
+async def test_writes_through_the_api_invalidate_the_cache(client, db, create_location):
+    location_id, ids = create_location("A")
+    url = f"/api/locations/{location_id}/devices"
+    client.get(url)
+
+    # Zapis z pominięciem API (np. inny proces) – do czasu TTL widać wersję z cache
+    await db[DEVICES].update_one({"_id": ids["A"]}, {"$set": {"ip": "10.0.0.7"}})
+    assert client.get(url).json()[0]["ip"] != "10.0.0.7"
+
+    client.put(f"/api/locations/{location_id}/devices/{ids['A']}/changed-true")
+    device = client.get(url).json()[0]
+    assert device["ip"] == "10.0.0.7"
+    assert device["changed"] == "true"
+
+
+def test_projection_on_cache_miss_reads_only_selected_fields(client, create_location):
+    location_id, ids = create_location("A")
+    client.put(f"/api/locations/{location_id}/devices/{ids['A']}/changed-true")
+    assert location_cache.peek(location_id) is None
+
+    response = client.get(f"/api/locations/{location_id}/devices", params={"fields": "clientId,changed"})
+    assert response.json() == [{"_id": ids["A"], "clientId": "A", "changed": "true"}]
+    # Częściowy odczyt nie wypełnia cache pełnymi dokumentami
+    assert location_cache.peek(location_id) is None
+
+    client.get(f"/api/locations/{location_id}/devices")
+    assert location_cache.peek(location_id) is not None
+    cached = client.get(f"/api/locations/{location_id}/devices", params={"fields": "clientId,changed"})
+    assert cached.json() == response.json()
+
+
+def test_unknown_fields_are_rejected(client, create_location):
+    location_id, _ = create_location("A")
+    response = client.get(f"/api/locations/{location_id}/devices", params={"fields": "clientId,password"})
+    assert response.status_code == 400
+    assert client.get(f"/api/locations/{ObjectId()}/devices").status_code == 404
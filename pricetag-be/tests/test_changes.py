@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from utils.cache import location_cache
+from utils.changes import DEVICE_EVENTS, GAP_GRACE_SECONDS, read_changes
+
+
+def _changes(client, location_id, since):
+    response = client.get(f"/api/locations/{location_id}/devices/changes", params={"since": since})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def _set_revision(db, location_id, rev):
+    await db["locations"].update_one({"_id": ObjectId(location_id)}, {"$set": {"rev": rev}})
+    location_cache.invalidate(location_id)
+
+
+async def _events(db, location_id, *seqs, age=0):
+    at = datetime.utcnow() - timedelta(seconds=age)
+    await db[DEVICE_EVENTS].insert_many([
+        {"location_id": ObjectId(location_id), "seq": seq, "op": "update", "device_ids": [f"d{seq}"], "at": at}
+        for seq in seqs
+    ])
+
+
+def test_changes_follow_the_cursor(client, create_location):
+    location_id, ids = create_location("A", "B")
+
+    snapshot = _changes(client, location_id, 0)
+    assert snapshot["cursor"] == 0
+    assert {d["clientId"] for d in snapshot["devices"]} == {"A", "B"}
+    assert snapshot["reset"] is False
+
+    client.put(f"/api/locations/{location_id}/devices/{ids['A']}/changed-true")
+    client.put(f"/api/locations/{location_id}/devices/{ids['B']}/changed-true")
+
+    delta = _changes(client, location_id, 1)
+    assert delta["cursor"] == 2
+    assert [d["clientId"] for d in delta["devices"]] == ["B"]
+    assert delta["reset"] is False
+    assert delta["more"] is False
+
+    client.delete(f"/api/locations/{location_id}/devices/{ids['A']}")
+    assert _changes(client, location_id, 2)["deleted"] == [ids["A"]]
+
+
+def test_up_to_date_cursor_gets_empty_reply(client, create_location):
+    location_id, ids = create_location("A")
+    client.put(f"/api/locations/{location_id}/devices/{ids['A']}/changed-true")
+
+    assert _changes(client, location_id, 1) == {
+        "cursor": 1, "devices": [], "deleted": [], "reset": False, "more": False
+    }
+
+
+def test_cursor_ahead_of_server_resets(client, create_location):
+    location_id, ids = create_location("A")
+    client.put(f"/api/locations/{location_id}/devices/{ids['A']}/changed-true")
+
+    # Np. baza odtworzona z kopii – kursor klienta jest „z przyszłości”
+    body = _changes(client, location_id, 40)
+    assert body["reset"] is True
+    assert body["cursor"] == 1
+    assert [d["clientId"] for d in body["devices"]] == ["A"]
+
+
+async def test_cursor_older_than_log_resets(client, db, create_location):
+    location_id, _ = create_location("A")
+    await _set_revision(db, location_id, 10)
+    await _events(db, location_id, 8, 9, 10)
+
+    assert await read_changes(db, location_id, 3, 100) == (None, 3)
+    body = _changes(client, location_id, 3)
+    assert body["reset"] is True
+    assert body["cursor"] == 10
+
+
+async def test_fresh_gap_stops_the_cursor(db):
+    location_id = str(ObjectId())
+    await _events(db, location_id, 1, 2, 4, 5)
+
+    events, cursor = await read_changes(db, location_id, 0, 100)
+    assert cursor == 2
+    assert [e["seq"] for e in events] == [1, 2]
+
+    # Kursor przed luką nie przesuwa się, dopóki brakujący zapis się nie pojawi
+    assert await read_changes(db, location_id, 2, 100) == ([], 2)
+
+
+async def test_settled_gap_is_skipped(db):
+    location_id = str(ObjectId())
+    await _events(db, location_id, 1, 2, 4, age=GAP_GRACE_SECONDS + 1)
+
+    events, cursor = await read_changes(db, location_id, 0, 100)
+    assert cursor == 4
+    assert [e["seq"] for e in events] == [1, 2, 4]
+
+
+async def test_fresh_gap_does_not_ask_for_more(client, db, create_location):
+    location_id, _ = create_location("A")
+    await _set_revision(db, location_id, 3)
+    await _events(db, location_id, 1, 3)
+
+    body = _changes(client, location_id, 1)
+    assert body["cursor"] == 1
+    assert body["devices"] == []
+    # Klient nie odpytuje w pętli – kolejna próba przy następnym cyklu
+    assert body["more"] is False
+
+
+def test_limit_pages_through_the_log(client, create_location):
+    location_id, ids = create_location("A")
+    for _ in range(3):
+        client.put(f"/api/locations/{location_id}/devices/{ids['A']}/changed-true")
+
+    response = client.get(
+        f"/api/locations/{location_id}/devices/changes", params={"since": 1, "limit": 1}
+    ).json()
+    assert response["cursor"] == 2
+    assert response["more"] is True
@@ -0,0 +1,66 @@
+from bson import ObjectId
+
+from utils.devices import DEVICES, migrate_embedded_devices
+
+
+def test_create_location_rejects_duplicate_client_ids(client, db):
+    response = client.post("/api/locations/", json={
+        "name": "Sklep",
+        "address": "ul. Testowa 1",
+        "devices": [{"clientId": "A", "clientName": "1"}, {"clientId": "A", "clientName": "2"}]
+    })
+
+    assert response.status_code == 400
+    assert client.get("/api/locations/").json() == []
+
+
+def test_group_endpoints_reject_invalid_ids(client, create_location):
+    location_id, ids = create_location("A")
+
+    assert client.post(
+        f"/api/locations/{location_id}/devices/{ids['A']}/groups", json={"group_id": "not-an-id"}
+    ).status_code == 400
+    assert client.get(f"/api/locations/{location_id}/groups/not-an-id/devices").json() == []
+    assert client.delete(f"/api/locations/{location_id}/groups/not-an-id").status_code == 400
+    assert client.delete(
+        f"/api/locations/{location_id}/devices/{ids['A']}/groups/not-an-id"
+    ).status_code == 400
+
+
+async def _embedded_location(db, *client_ids):
+    result = await db["locations"].insert_one({
+        "name": "Sklep",
+        "address": "ul. Testowa 1",
+        "devices": [
+            {"_id": str(ObjectId()), "clientId": cid, "clientName": cid, "isOnline": True}
+            for cid in client_ids
+        ]
+    })
+    return result.inserted_id
+
+
+async def test_startup_migration_keeps_embedded_devices(db):
+    location_id = await _embedded_location(db, "A", "B")
+
+    assert await migrate_embedded_devices(db, keep_embedded=True) == 2
+    # Drugi start niczego nie przenosi, tablica zostaje na wypadek powrotu do poprzedniej wersji
+    assert await migrate_embedded_devices(db, keep_embedded=True) == 0
+
+    location = await db["locations"].find_one({"_id": location_id})
+    assert len(location["devices"]) == 2
+    assert location["devices_migrated"] is True
+    assert await db[DEVICES].count_documents({"location_id": location_id}) == 2
+
+
+async def test_explicit_migration_drops_array_without_overwriting(db):
+    location_id = await _embedded_location(db, "A")
+    await migrate_embedded_devices(db, keep_embedded=True)
+    await db[DEVICES].update_one({"location_id": location_id}, {"$set": {"isOnline": False}})
+
+    await migrate_embedded_devices(db)
+
+    location = await db["locations"].find_one({"_id": location_id})
+    assert "devices" not in location
+    device = await db[DEVICES].find_one({"location_id": location_id})
+    # Dokument w kolekcji jest nowszy niż kopia w tablicy
+    assert device["isOnline"] is False
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import sys
+import time
+
+import pytest
+
+from utils import manifest
+from utils.ffmpeg import FfmpegLimiter
+from utils.singleflight import SingleFlight
+
+
+def _sleep(seconds):
+    return [sys.executable, "-c", f"import time; time.sleep({seconds})"]
+
+
+async def test_limiter_runs_at_most_limit_processes():
+    limiter = FfmpegLimiter(2)
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(limiter.run(_sleep(0.3)) for _ in range(4)))
+
+    assert [code for code, _, _ in results] == [0, 0, 0, 0]
+    # Dwie tury po dwa procesy
+    assert time.monotonic() - started >= 0.6
+    stats = limiter.stats()
+    assert stats["completed"] == 4
+    assert stats["max_waiting"] >= 2
+    assert stats["running"] == 0
+
+
+async def test_timeout_kills_the_process_and_frees_the_slot():
+    limiter = FfmpegLimiter(1)
+
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        await limiter.run(_sleep(30), timeout=0.2)
+    assert time.monotonic() - started < 5
+
+    code, stdout, _ = await limiter.run([sys.executable, "-c", "print('ok')"], timeout=10)
+    assert code == 0
+    assert stdout.strip() == b"ok"
+
+
+async def test_single_flight_shares_one_run():
+    flights = SingleFlight()
+    calls = []
+
+    async def render():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "thumb.png"
+
+    results = await asyncio.gather(*(flights.do("promo.mp4", render) for _ in range(10)))
+
+    assert results == ["thumb.png"] * 10
+    assert calls == [1]
+    assert flights.stats() == {"in_flight": 0, "started": 1, "shared": 9}
+
+
+async def test_single_flight_survives_the_first_caller_leaving():
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def render():
+        await release.wait()
+        return "thumb.png"
+
+    first = asyncio.ensure_future(flights.do("promo.mp4", render))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(flights.do("promo.mp4", render))
+    await asyncio.sleep(0)
+    # Rozłączony klient nie przerywa pracy pozostałym
+    first.cancel()
+    release.set()
+
+    assert await second == "thumb.png"
+
+
+async def test_manifest_ffprobe_goes_through_the_limiter(monkeypatch, tmp_path):
+    calls = []
+
+    async def run(cmd, timeout=None):
+        calls.append((cmd[0], timeout))
+        return 0, json.dumps({
+            "streams": [{"codec_type": "video", "codec_name": "h264", "width": 720, "height": 1280,
+                         "avg_frame_rate": "24/1", "pix_fmt": "yuv420p"}],
+            "format": {"duration": "4.5", "bit_rate": "1200000"}
+        }).encode(), b""
+
+    monkeypatch.setattr(manifest.ffmpeg, "run", run)
+    video = tmp_path / "promo.mp4"
+    video.write_bytes(b"\x00" * 16)
+
+    meta = await manifest.probe_media(video, "video/mp4")
+
+    assert calls == [("ffprobe", manifest.FFPROBE_TIMEOUT_SECONDS)]
+    assert meta["width"] == 720
+    assert meta["fps"] == 24
+    assert meta["duration"] == 4.5
+    assert meta["has_audio"] is False
+
+
+async def test_hung_ffprobe_leaves_metadata_empty(monkeypatch, tmp_path):
+    async def run(cmd, timeout=None):
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(manifest.ffmpeg, "run", run)
+    video = tmp_path / "broken.mp4"
+    video.write_bytes(b"\x00")
+
+    meta = await manifest.probe_media(video, "video/mp4")
+    assert meta == dict.fromkeys(manifest.PROBE_FIELDS)
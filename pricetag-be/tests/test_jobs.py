@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import jobs
+from utils.jobs import (
+    BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS, JOBS, LEASE_SECONDS, PRIORITY_BULK, PRIORITY_INTERACTIVE,
+    JobWorkerPool, backoff_seconds, enqueue
+)
+
+
+@pytest.fixture
+async def queue(db, monkeypatch):
+    """Pusta kolejka z indeksami i zadaniami testowymi `ok` (zwraca params) i `boom` (zawsze błąd)."""
+    async def ok(db, params, job):
+        return {"echo": params}
+
+    async def boom(db, params, job):
+        raise RuntimeError("ffmpeg exited with 1")
+
+    monkeypatch.setattr(jobs, "_handlers", {"ok": ok, "boom": boom})
+    await jobs.ensure_indexes(db)
+    return db
+
+
+def _worker(db, kind_limits=None):
+    worker = JobWorkerPool()
+    worker._db = db
+    worker.kind_limits = kind_limits or {}
+    return worker
+
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    assert [backoff_seconds(n) for n in (1, 2, 3)] == [
+        BACKOFF_BASE_SECONDS, 2 * BACKOFF_BASE_SECONDS, 4 * BACKOFF_BASE_SECONDS
+    ]
+    assert backoff_seconds(50) == BACKOFF_MAX_SECONDS
+
+
+async def test_same_key_returns_the_waiting_job_with_higher_priority(queue):
+    first = await enqueue(queue, "ok", {"n": 1}, priority=PRIORITY_BULK, key="thumb:a")
+    again = await enqueue(queue, "ok", {"n": 1}, priority=PRIORITY_INTERACTIVE, key="thumb:a")
+
+    assert again["_id"] == first["_id"]
+    assert again["priority"] == PRIORITY_INTERACTIVE
+    assert await queue[JOBS].count_documents({}) == 1
+
+
+async def test_claim_order_and_lease(queue):
+    bulk = await enqueue(queue, "ok", {}, priority=PRIORITY_BULK)
+    interactive = await enqueue(queue, "ok", {}, priority=PRIORITY_INTERACTIVE)
+    later = await enqueue(queue, "ok", {}, priority=PRIORITY_INTERACTIVE)
+    await queue[JOBS].update_one({"_id": later["_id"]}, {"$set": {"run_at": datetime.utcnow() + timedelta(hours=1)}})
+    worker = _worker(queue)
+
+    claimed = await worker._claim()
+    assert claimed["_id"] == interactive["_id"]
+    assert claimed["status"] == "running"
+    assert claimed["attempts"] == 1
+    assert claimed["worker"] == worker.worker_id
+    assert claimed["lease_until"] > datetime.utcnow() + timedelta(seconds=LEASE_SECONDS - 5)
+
+    assert (await worker._claim())["_id"] == bulk["_id"]
+    # Zadanie z run_at w przyszłości (np. po błędzie) jeszcze czeka
+    assert await worker._claim() is None
+
+
+async def test_expired_lease_returns_job_to_another_worker(queue):
+    job = await enqueue(queue, "ok", {})
+    crashed = _worker(queue)
+    await crashed._claim()
+
+    other = _worker(queue)
+    assert await other._claim() is None
+
+    await queue[JOBS].update_one({"_id": job["_id"]}, {"$set": {"lease_until": datetime.utcnow() - timedelta(seconds=1)}})
+    reclaimed = await other._claim()
+    assert reclaimed["_id"] == job["_id"]
+    assert reclaimed["worker"] == other.worker_id
+    assert reclaimed["attempts"] == 2
+
+    # Spóźniony wynik pierwszego workera nie nadpisuje stanu
+    await crashed._finish(reclaimed, {"$set": {"status": "done"}})
+    assert (await queue[JOBS].find_one({"_id": job["_id"]}))["status"] == "running"
+
+
+async def test_kind_limit_leaves_room_for_other_kinds(queue):
+    await enqueue(queue, "boom", {}, priority=PRIORITY_INTERACTIVE)
+    ok = await enqueue(queue, "ok", {}, priority=PRIORITY_BULK)
+    worker = _worker(queue, kind_limits={"boom": 1})
+    worker._running["boom"] = 1
+
+    assert (await worker._claim())["_id"] == ok["_id"]
+
+
+async def test_success_stores_result_and_frees_the_key(queue):
+    job = await enqueue(queue, "ok", {"n": 1}, key="thumb:a")
+    worker = _worker(queue)
+    await worker._run(await worker._claim())
+
+    done = await jobs.wait_for(queue, job["_id"], timeout=0)
+    assert done["status"] == "done"
+    assert done["result"] == {"echo": {"n": 1}}
+    assert "active_key" not in done
+
+    # Klucz wolny – kolejne zlecenie to nowe zadanie
+    again = await enqueue(queue, "ok", {"n": 1}, key="thumb:a")
+    assert again["_id"] != job["_id"]
+
+
+async def test_failure_backs_off_then_fails_permanently(queue):
+    job = await enqueue(queue, "boom", {}, key="transcode:a", max_attempts=2)
+    worker = _worker(queue)
+
+    started = datetime.utcnow()
+    await worker._run(await worker._claim())
+    retried = await queue[JOBS].find_one({"_id": job["_id"]})
+    assert retried["status"] == "queued"
+    assert retried["error"] == "ffmpeg exited with 1"
+    assert retried["worker"] is None
+    # Mongo przechowuje czas z dokładnością do milisekund
+    assert retried["run_at"] >= started + timedelta(seconds=backoff_seconds(1), milliseconds=-1)
+    assert await worker._claim() is None
+
+    await queue[JOBS].update_one({"_id": job["_id"]}, {"$set": {"run_at": datetime.utcnow()}})
+    await worker._run(await worker._claim())
+    failed = await queue[JOBS].find_one({"_id": job["_id"]})
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == 2
+    assert "active_key" not in failed
+    assert worker.stats()["retried"] == 1
+    assert worker.stats()["failed"] == 1
@@ -0,0 +1,83 @@
+import hashlib
+import os
+
+
+def _upload(client, location_id, filename, data):
+    response = client.post(
+        f"/api/locations/{location_id}/upload-file/", files={"file": (filename, data, "text/plain")}
+    )
+    assert response.status_code == 200, response.text
+
+
+def test_listing_comes_from_the_manifest(client, create_location):
+    location_id, _ = create_location()
+    _upload(client, location_id, "b.txt", b"bb")
+    _upload(client, location_id, "a.txt", b"aaaa")
+    _upload(client, location_id, "c.txt", b"c")
+
+    body = client.get(f"/api/locations/{location_id}/files/").json()
+    assert body["files"] == ["a.txt", "b.txt", "c.txt"]
+    assert body["total"] == 3
+    item = body["items"][0]
+    assert item["size"] == 4
+    assert item["sha256"] == hashlib.sha256(b"aaaa").hexdigest()
+    assert item["md5"] == hashlib.md5(b"aaaa").hexdigest().upper()
+    assert item["preview_url"] is None
+
+
+def test_listing_sorts_and_pages(client, create_location):
+    location_id, _ = create_location()
+    for name, data in (("b.txt", b"bb"), ("a.txt", b"aaaa"), ("c.txt", b"c")):
+        _upload(client, location_id, name, data)
+    url = f"/api/locations/{location_id}/files/"
+
+    assert client.get(url, params={"sort": "size", "order": "desc"}).json()["files"] == ["a.txt", "b.txt", "c.txt"]
+    assert client.get(url, params={"sort": "size"}).json()["files"] == ["c.txt", "b.txt", "a.txt"]
+    page = client.get(url, params={"offset": 1, "limit": 1}).json()
+    assert page["files"] == ["b.txt"]
+    assert page["total"] == 3
+
+    assert client.get(url, params={"sort": "owner"}).status_code == 400
+    assert client.get(url, params={"limit": 0}).status_code == 400
+
+
+def test_listing_etag_changes_with_the_files(client, create_location):
+    location_id, _ = create_location()
+    _upload(client, location_id, "a.txt", b"a")
+    url = f"/api/locations/{location_id}/files/"
+
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    # Inna strona listy to inna reprezentacja
+    assert client.get(url, params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 200
+
+    _upload(client, location_id, "b.txt", b"b")
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+    etag = client.get(url).headers["ETag"]
+    client.delete(f"/api/locations/{location_id}/files/a.txt")
+    after_delete = client.get(url, headers={"If-None-Match": etag})
+    assert after_delete.status_code == 200
+    assert after_delete.json()["files"] == ["b.txt"]
+
+
+def test_refresh_picks_up_changes_made_outside_the_api(client, create_location, upload_dir):
+    location_id, _ = create_location()
+    _upload(client, location_id, "a.txt", b"a")
+    url = f"/api/locations/{location_id}/files/"
+    client.get(url)
+
+    directory = upload_dir / location_id
+    (directory / "b.txt").write_bytes(b"bbb")
+    (directory / ".upload-tmp").write_bytes(b"partial")
+    os.remove(directory / "a.txt")
+
+    # Bez refresh lista nie czyta katalogu
+    assert client.get(url).json()["files"] == ["a.txt"]
+    assert client.get(url, params={"refresh": True}).json()["files"] == ["b.txt"]
+
+
+def test_unknown_location_lists_nothing(client):
+    body = client.get("/api/locations/0123456789abcdef01234567/files/").json()
+    assert body["files"] == []
+    assert body["total"] == 0
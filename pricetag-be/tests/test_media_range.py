@@ -0,0 +1,93 @@
+import hashlib
+
+import pytest
+
+from utils.media import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, parse_range
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 1023)),
+    ("bytes=-24", (1000, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    ("bytes=0-1,5-6", None),
+    ("bytes=a-b", None),
+    ("bytes=-", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(DATA)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=5-4", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, len(DATA))
+
+
+@pytest.fixture
+def media_file(client, create_location, upload_dir):
+    location_id, _ = create_location()
+    (upload_dir / location_id).mkdir()
+    (upload_dir / location_id / "cennik.bin").write_bytes(DATA)
+    return f"/api/locations/{location_id}/files/cennik.bin"
+
+
+def test_full_download_carries_manifest_etag_and_md5(client, media_file):
+    response = client.get(media_file)
+
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["ETag"] == f'"{hashlib.sha256(DATA).hexdigest()}"'
+    assert response.headers["X-Device-MD5"] == hashlib.md5(DATA).hexdigest().upper()
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+
+
+def test_range_returns_206(client, media_file):
+    response = client.get(media_file, headers={"Range": "bytes=10-19"})
+
+    assert response.status_code == 206
+    assert response.content == DATA[10:20]
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(DATA)}"
+    assert response.headers["Content-Length"] == "10"
+
+
+def test_unsatisfiable_range_returns_416(client, media_file):
+    response = client.get(media_file, headers={"Range": f"bytes={len(DATA)}-"})
+
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(DATA)}"
+
+
+def test_stale_if_range_returns_whole_file(client, media_file):
+    response = client.get(media_file, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_matching_etag_returns_304(client, media_file):
+    etag = client.get(media_file).headers["ETag"]
+
+    response = client.get(media_file, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_versioned_url_is_immutable(client, media_file):
+    response = client.get(media_file, params={"v": "1"})
+    assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_invalid_paths_are_rejected(client, media_file, create_location):
+    location_id, _ = create_location()
+
+    assert client.get("/api/locations/not-an-id/files/cennik.bin").status_code == 400
+    assert client.get(f"/api/locations/{location_id}/files/%2E%2E").status_code == 400
+    assert client.get(f"/api/locations/{location_id}/files/cennik.bin").status_code == 404
+    assert client.get(media_file, params={"variant": "hd"}).status_code == 400
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from utils import jobs
+from utils.jobs import JOBS
+from utils.manifest import MEDIA
+from utils.previews import (
+    PREVIEW_JOB, PREVIEW_VARIANT, backfill_previews, preview_path, preview_url, render_preview
+)
+
+
+@pytest.fixture(autouse=True)
+async def job_indexes(db):
+    await jobs.ensure_indexes(db)
+
+
+async def _entry(db, location_id, filename, sha256, mime="video/mp4", preview=None):
+    doc = {
+        "location_id": ObjectId(location_id), "filename": filename, "sha256": sha256, "md5": sha256.upper(),
+        "mime": mime, "size": 1, "mtime": datetime.utcnow(), "has_audio": False
+    }
+    if preview:
+        doc["variants"] = {PREVIEW_VARIANT: preview}
+    await db[MEDIA].insert_one(doc)
+
+
+async def _queued_previews(db):
+    return sorted(
+        (job["params"]["location_id"], job["params"]["filename"])
+        async for job in db[JOBS].find({"kind": PREVIEW_JOB})
+    )
+
+
+async def test_backfill_queues_only_videos_without_a_current_preview(db):
+    first, second = str(ObjectId()), str(ObjectId())
+    await _entry(db, first, "old.mp4", "a" * 64)
+    await _entry(db, first, "ready.mp4", "b" * 64, preview={"status": "ready", "sha256": "b" * 64})
+    await _entry(db, first, "replaced.mp4", "c" * 64, preview={"status": "ready", "sha256": "0" * 64})
+    await _entry(db, first, "cube.png", "d" * 64, mime="image/png")
+    await _entry(db, second, "promo.mov", "e" * 64, mime="video/quicktime")
+
+    assert await backfill_previews(db) == 3
+    assert await _queued_previews(db) == sorted([
+        (first, "old.mp4"), (first, "replaced.mp4"), (second, "promo.mov")
+    ])
+    entry = await db[MEDIA].find_one({"filename": "old.mp4"})
+    assert entry["variants"][PREVIEW_VARIANT]["status"] == "queued"
+
+    # Kolejny start niczego nie zleca ponownie
+    assert await backfill_previews(db) == 0
+
+
+async def test_listing_does_not_queue_previews(client, db, create_location, upload_dir):
+    location_id, _ = create_location()
+    await db["locations"].update_one(
+        {"_id": ObjectId(location_id)}, {"$set": {"media_indexed": True, "media_rev": 1}}
+    )
+    (upload_dir / location_id).mkdir()
+    await _entry(db, location_id, "old.mp4", "a" * 64)
+    await _entry(db, location_id, "ready.mp4", "b" * 64, preview={"status": "ready", "sha256": "b" * 64})
+    preview_path(location_id, "b" * 64).parent.mkdir(parents=True)
+    preview_path(location_id, "b" * 64).write_bytes(b"RIFF")
+
+    response = client.get(f"/api/locations/{location_id}/files/")
+    items = {item["filename"]: item for item in response.json()["items"]}
+    assert items["old.mp4"]["preview_url"] is None
+    assert items["ready.mp4"]["preview_url"] == preview_url(location_id, "b" * 64)
+    # Lista tylko czyta – brakujące podglądy zleca start API (backfill_previews)
+    assert await _queued_previews(db) == []
+
+    served = client.get(items["ready.mp4"]["preview_url"])
+    assert served.status_code == 200
+    assert served.content == b"RIFF"
+
+
+async def test_preview_job_for_replaced_content_is_skipped(db, upload_dir):
+    location_id = str(ObjectId())
+    await _entry(db, location_id, "promo.mp4", "b" * 64)
+
+    params = {"location_id": location_id, "filename": "promo.mp4", "sha256": "a" * 64}
+    assert await render_preview(db, params, {"attempts": 1, "max_attempts": 3}) == {"status": "skipped"}
+    assert not preview_path(location_id, "a" * 64).exists()
@@ -0,0 +1,71 @@
+import pytest
+
+from utils.revisions import etag_matches, make_etag
+
+
+def test_make_etag_is_quoted_and_varies_by_representation():
+    etag = make_etag("loc", 3)
+    assert etag == '"loc-3"'
+    assert make_etag("loc", 3, "devices:[]") != make_etag("loc", 3, "devices:['clientId']")
+    assert make_etag("loc", 4, "devices:[]") != make_etag("loc", 3, "devices:[]")
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    ('"loc-3"', True),
+    ('W/"loc-3"', True),
+    ('"loc-2", "loc-3"', True),
+    ('"loc-2", W/"loc-4"', False),
+    ('"loc-30"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"loc-3"') is expected
+
+
+def test_devices_answer_304_until_a_write_bumps_the_revision(client, create_location):
+    location_id, ids = create_location("A", "B")
+    url = f"/api/locations/{location_id}/devices"
+
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+
+    cached = client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+
+    client.put(f"/api/locations/{location_id}/devices/{ids['A']}/changed-true")
+
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert {d["clientId"]: d["changed"] for d in changed.json()}["A"] == "true"
+
+
+def test_views_have_separate_etags(client, create_location):
+    location_id, _ = create_location("A")
+    url = f"/api/locations/{location_id}/devices"
+
+    full = client.get(url).headers["ETag"]
+    slim = client.get(url, params={"view": "slim"})
+
+    assert slim.headers["ETag"] != full
+    assert client.get(url, params={"view": "slim"}, headers={"If-None-Match": full}).status_code == 200
+    assert client.get(url, headers={"If-None-Match": slim.headers["ETag"]}).status_code == 200
+
+
+def test_location_etag_changes_after_rename(client, create_location):
+    location_id, _ = create_location("A")
+    url = f"/api/locations/{location_id}"
+
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    client.put(url, json={"name": "Sklep 2"})
+
+    renamed = client.get(url, headers={"If-None-Match": etag})
+    assert renamed.status_code == 200
+    assert renamed.json()["name"] == "Sklep 2"
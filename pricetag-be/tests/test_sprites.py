@@ -0,0 +1,93 @@
+import io
+
+import pytest
+from PIL import Image
+
+from utils.media import IMMUTABLE_CACHE_CONTROL
+from utils.thumbnails import SPRITE_MAX_FILES, SPRITE_MAX_PIXELS, SPRITE_MAX_TILE, sprite_file, sprite_map
+
+LOCATION_ID = "0123456789abcdef01234567"
+
+
+def _png(color, size=(40, 20)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_sprite_map_places_tiles_row_by_row():
+    mapping = sprite_map(["a.png", "b.png", "c.png"], 64, 2)
+
+    assert mapping["size"] == 64
+    assert mapping["columns"] == 2
+    assert mapping["tiles"] == {
+        "a.png": {"x": 0, "y": 0},
+        "b.png": {"x": 64, "y": 0},
+        "c.png": {"x": 0, "y": 64},
+    }
+
+
+@pytest.mark.parametrize("name, valid", [
+    (f"sprite-{'a' * 64}-128.webp", True),
+    (f"sprite-{'0' * 64}-64.jpeg", True),
+    (f"sprite-{'a' * 64}-128.gif", False),
+    (f"sprite-{'A' * 64}-128.png", False),
+    ("../promo.mp4", False),
+    ("promo.mp4", False),
+])
+def test_sprite_file_accepts_only_sprite_names(upload_dir, name, valid):
+    path = sprite_file(LOCATION_ID, name)
+    assert (path is not None) is valid
+    if valid:
+        assert path.parent.parent == upload_dir / LOCATION_ID
+
+
+@pytest.mark.parametrize("body", [
+    {"filenames": []},
+    {"filenames": ["a.png"], "size": 8},
+    {"filenames": ["a.png"], "size": SPRITE_MAX_TILE + 1},
+    {"filenames": [f"{n}.png" for n in range(SPRITE_MAX_FILES + 1)], "size": 16},
+    {"filenames": [f"{n}.png" for n in range(SPRITE_MAX_PIXELS // SPRITE_MAX_TILE ** 2 + 1)], "size": SPRITE_MAX_TILE},
+])
+def test_sprite_request_limits(client, body):
+    response = client.post(f"/api/locations/{LOCATION_ID}/thumbnails/sprite", json=body)
+    assert response.status_code == 400
+
+
+def test_sprite_of_location_images(client, create_location):
+    location_id, _ = create_location()
+    for name, color in (("a.png", "red"), ("b.png", "blue")):
+        client.post(f"/api/locations/{location_id}/upload-file/", files={"file": (name, _png(color), "image/png")})
+    client.post(f"/api/locations/{location_id}/upload-file/", files={"file": ("notes.txt", b"x", "text/plain")})
+
+    response = client.post(f"/api/locations/{location_id}/thumbnails/sprite", json={
+        "filenames": ["a.png", "notes.txt", "b.png", "gone.png", "a.png"], "size": 32, "format": "png"
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["columns"] == 2
+    assert body["tiles"] == {"a.png": {"x": 0, "y": 0}, "b.png": {"x": 32, "y": 0}}
+    assert body["missing"] == ["notes.txt", "gone.png"]
+    assert body["pending"] == [] and body["failed"] == []
+
+    sheet = client.get(body["url"])
+    assert sheet.status_code == 200
+    assert sheet.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    image = Image.open(io.BytesIO(sheet.content))
+    assert image.size == (64, 32)
+    # Miniaturka 32×16 wyśrodkowana w komórce – środek kafelka ma kolor pliku
+    assert image.getpixel((16, 16))[:3] == (255, 0, 0)
+    assert image.getpixel((48, 16))[:3] == (0, 0, 255)
+
+    # Ta sama treść – ten sam (niezmienny) adres arkusza
+    again = client.post(f"/api/locations/{location_id}/thumbnails/sprite", json={
+        "filenames": ["a.png", "b.png"], "size": 32, "format": "png"
+    })
+    assert again.json()["url"] == body["url"]
+
+
+def test_sprite_without_known_files_is_404(client, create_location):
+    location_id, _ = create_location()
+    response = client.post(f"/api/locations/{location_id}/thumbnails/sprite", json={"filenames": ["gone.png"]})
+    assert response.status_code == 404
+    assert client.get(f"/api/locations/{location_id}/thumbnails/sprites/{'x' * 10}.png").status_code == 404
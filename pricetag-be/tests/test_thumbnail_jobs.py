@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from utils import jobs
+from utils.jobs import JOBS
+from utils.thumbnails import THUMBNAIL_JOB, THUMBNAIL_WAIT_SECONDS
+
+
+@pytest.fixture
+async def video(client, db, create_location, upload_dir):
+    """Wideo wgrane z pominięciem API (bez workerów kolejki – zadania tylko czekają)."""
+    await jobs.ensure_indexes(db)
+    location_id, _ = create_location()
+    (upload_dir / location_id).mkdir()
+    (upload_dir / location_id / "promo.mp4").write_bytes(b"\x00" * 64)
+    return location_id
+
+
+def test_pending_video_thumbnail_answers_202_quickly(client, video):
+    url = f"/api/locations/{video}/files/promo.mp4/thumbnail"
+
+    started = time.monotonic()
+    response = client.get(url)
+    assert time.monotonic() - started < THUMBNAIL_WAIT_SECONDS + 2
+    assert response.status_code == 202
+    assert response.headers["Retry-After"]
+    job_id = response.json()["job_id"]
+
+    job = client.get(f"/api/jobs/{job_id}").json()
+    assert job["kind"] == THUMBNAIL_JOB
+    assert job["status"] == "queued"
+    assert job["priority"] == jobs.PRIORITY_INTERACTIVE
+
+    # Ponowne żądanie czeka na to samo zadanie
+    assert client.get(url).json()["job_id"] == job_id
+
+
+async def test_failed_job_can_be_retried_once(client, db, video):
+    job_id = client.get(f"/api/locations/{video}/files/promo.mp4/thumbnail").json()["job_id"]
+    assert client.post(f"/api/jobs/{job_id}/retry").status_code == 409
+
+    job = await jobs.get_job(db, job_id)
+    await db[JOBS].update_one(
+        {"_id": job["_id"]}, {"$set": {"status": "failed", "attempts": 3}, "$unset": {"active_key": ""}}
+    )
+    retried = client.post(f"/api/jobs/{job_id}/retry").json()
+    assert retried["status"] == "queued"
+    assert retried["attempts"] == 0
+
+
+def test_queued_job_can_be_cancelled(client, video):
+    job_id = client.get(f"/api/locations/{video}/files/promo.mp4/thumbnail").json()["job_id"]
+
+    assert client.delete(f"/api/jobs/{job_id}").status_code == 200
+    assert client.get(f"/api/jobs/{job_id}").status_code == 404
+    assert client.delete(f"/api/jobs/{job_id}").status_code == 409
@@ -0,0 +1,119 @@
+import hashlib
+import io
+
+import pytest
+from PIL import Image
+
+from utils import jobs, transcode
+from utils.jobs import JOBS
+from utils.transcode import DEVICE_VARIANT, TRANSCODE_JOB, render_device_variant, request_device_variant
+
+
+def _png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (9, 16), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+async def job_indexes(db):
+    # Unikalny `active_key` – to samo kodowanie nie trafia do kolejki dwa razy
+    await jobs.ensure_indexes(db)
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """Zamiast ffmpeg: zapisuje stały plik MP4 i notuje, co kodowano."""
+    calls = []
+
+    async def fake_transcode(src, mime, out, has_audio=None):
+        calls.append(src.name)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_bytes(b"device-mp4")
+
+    monkeypatch.setattr(transcode, "transcode_to_device", fake_transcode)
+    return calls
+
+
+def _upload(client, location_id, filename, data, content_type="image/png"):
+    response = client.post(
+        f"/api/locations/{location_id}/upload-file/", files={"file": (filename, data, content_type)}
+    )
+    assert response.status_code == 200, response.text
+
+
+async def _transcode_job(db, location_id):
+    return await db[JOBS].find_one({"kind": TRANSCODE_JOB, "params.location_id": location_id, "status": "queued"})
+
+
+async def test_upload_queues_one_transcode_per_content(client, db, create_location):
+    location_id, _ = create_location()
+    red = _png("red")
+    _upload(client, location_id, "a.png", red)
+    _upload(client, location_id, "copy.png", red)
+
+    jobs_for_content = await db[JOBS].count_documents({"kind": TRANSCODE_JOB, "params.location_id": location_id})
+    assert jobs_for_content == 1
+    job = await _transcode_job(db, location_id)
+    assert job["params"]["sha256"] == hashlib.sha256(red).hexdigest()
+
+    assert (await request_device_variant(db, location_id, "a.png"))["status"] == "processing"
+    _upload(client, location_id, "notes.txt", b"x", "text/plain")
+    assert await request_device_variant(db, location_id, "notes.txt") == {"status": "unsupported"}
+
+
+async def test_variant_is_served_once_ready(client, db, create_location, encoded):
+    location_id, _ = create_location()
+    _upload(client, location_id, "a.png", _png("red"))
+    url = f"/api/locations/{location_id}/files/a.png"
+
+    pending = client.get(url, params={"variant": DEVICE_VARIANT})
+    assert pending.status_code == 202
+    assert pending.headers["Retry-After"]
+
+    job = await _transcode_job(db, location_id)
+    state = await render_device_variant(db, job["params"], {**job, "attempts": 1})
+    assert state["status"] == "ready"
+    assert state["md5"] == hashlib.md5(b"device-mp4").hexdigest().upper()
+
+    ready = client.get(url, params={"variant": DEVICE_VARIANT})
+    assert ready.status_code == 200
+    assert ready.content == b"device-mp4"
+    assert ready.headers["X-Device-MD5"] == state["md5"]
+    assert encoded == ["a.png"]
+
+
+async def test_job_for_replaced_content_is_skipped(client, db, create_location, encoded):
+    location_id, _ = create_location()
+    _upload(client, location_id, "a.png", _png("red"))
+    stale = await _transcode_job(db, location_id)
+    # Plik nadpisany, zanim worker doszedł do zadania
+    _upload(client, location_id, "a.png", _png("blue"))
+
+    assert await render_device_variant(db, stale["params"], {**stale, "attempts": 1}) == {"status": "skipped"}
+    assert encoded == []
+
+
+async def test_last_failed_attempt_is_remembered(client, db, create_location, monkeypatch):
+    location_id, _ = create_location()
+    _upload(client, location_id, "a.png", _png("red"))
+    job = await _transcode_job(db, location_id)
+
+    async def broken(src, mime, out, has_audio=None):
+        raise RuntimeError("Invalid data found when processing input")
+
+    monkeypatch.setattr(transcode, "transcode_to_device", broken)
+
+    # Nie ostatnia próba – kolejka ponowi zadanie, stan bez zmian
+    with pytest.raises(RuntimeError):
+        await render_device_variant(db, job["params"], {**job, "attempts": 1})
+    assert (await request_device_variant(db, location_id, "a.png"))["status"] == "processing"
+
+    with pytest.raises(RuntimeError):
+        await render_device_variant(db, job["params"], {**job, "attempts": job["max_attempts"]})
+    failed = await request_device_variant(db, location_id, "a.png")
+    assert failed["status"] == "failed"
+    assert "Invalid data" in failed["error"]
+    assert client.get(
+        f"/api/locations/{location_id}/files/a.png", params={"variant": DEVICE_VARIANT}
+    ).status_code == 422
@@ -0,0 +1,67 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import locations
+from utils.uploads import UploadSizeLimitMiddleware
+
+LIMIT = 4096
+
+
+@pytest.fixture
+def limited(db, upload_dir):
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, paths=("/upload-file/", "/blobs"), max_body=LIMIT)
+    app.include_router(locations.router, prefix="/api/locations")
+    app.mongodb = db
+    return TestClient(app)
+
+
+def _location(limited):
+    response = limited.post("/api/locations/", json={"name": "Sklep", "address": "ul. Testowa 1", "devices": []})
+    return response.json()["_id"]
+
+
+def test_small_upload_passes(limited, upload_dir):
+    location_id = _location(limited)
+    response = limited.post(
+        f"/api/locations/{location_id}/upload-file/", files={"file": ("a.txt", b"x" * 100, "text/plain")}
+    )
+    assert response.status_code == 200
+    assert (upload_dir / location_id / "a.txt").read_bytes() == b"x" * 100
+
+
+def test_declared_length_over_limit_is_rejected_up_front(limited, upload_dir):
+    location_id = _location(limited)
+    response = limited.post(
+        f"/api/locations/{location_id}/upload-file/", files={"file": ("a.txt", b"x" * (2 * LIMIT), "text/plain")}
+    )
+    assert response.status_code == 413
+    assert not (upload_dir / location_id / "a.txt").exists()
+
+
+def test_chunked_body_over_limit_is_cut_off(limited, upload_dir):
+    location_id = _location(limited)
+    boundary = "testboundary"
+    parts = [
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.txt\"\r\n"
+        "Content-Type: text/plain\r\n\r\n".encode(),
+        b"x" * (2 * LIMIT),
+        f"\r\n--{boundary}--\r\n".encode(),
+    ]
+
+    # Body bez Content-Length (Transfer-Encoding: chunked)
+    response = limited.post(
+        f"/api/locations/{location_id}/upload-file/",
+        content=iter(parts),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    assert response.status_code == 413
+    assert not (upload_dir / location_id / "a.txt").exists()
+
+
+def test_other_paths_are_not_limited(limited):
+    response = limited.post("/api/locations/", json={
+        "name": "x" * (2 * LIMIT), "address": "ul. Testowa 1", "devices": []
+    })
+    assert response.status_code == 201
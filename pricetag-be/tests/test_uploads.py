@@ -0,0 +1,127 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from api.uploads import WRITE_LOCK_SECONDS
+from utils.uploads import UPLOAD_SESSIONS
+
+DATA = b"0123456789" * 10
+
+
+def _start(client, location_id, **body):
+    response = client.post(
+        f"/api/locations/{location_id}/uploads", json={"filename": "cennik.txt", "size": len(DATA), **body}
+    )
+    assert response.status_code == 201, response.text
+    return f"/api/locations/{location_id}/uploads/{response.json()['upload_id']}"
+
+
+async def _set_session(db, url, **fields):
+    await db[UPLOAD_SESSIONS].update_one({"_id": ObjectId(url.rsplit("/", 1)[1])}, {"$set": fields})
+
+
+def test_chunks_advance_the_offset_and_complete(client, create_location, upload_dir):
+    location_id, _ = create_location()
+    url = _start(client, location_id, sha256=hashlib.sha256(DATA).hexdigest())
+
+    first = client.put(url, params={"offset": 0, "index": 0}, content=DATA[:40])
+    assert first.status_code == 200
+    assert first.json()["offset"] == 40
+    assert first.json()["index"] == 0
+    assert first.json()["complete"] is False
+
+    last = client.put(url, params={"offset": 40}, content=DATA[40:])
+    assert last.json()["offset"] == len(DATA)
+    assert last.json()["chunks"] == 2
+    assert last.json()["complete"] is True
+
+    done = client.post(f"{url}/complete")
+    assert done.status_code == 200, done.text
+    assert done.json()["md5"] == hashlib.md5(DATA).hexdigest()
+    assert (upload_dir / location_id / "cennik.txt").read_bytes() == DATA
+    # Sesja znika po zakończeniu
+    assert client.get(url).status_code == 404
+
+
+def test_offset_mismatch_returns_current_offset(client, create_location):
+    location_id, _ = create_location()
+    url = _start(client, location_id)
+    client.put(url, params={"offset": 0}, content=DATA[:30])
+
+    # Powtórzona porcja (klient nie dostał odpowiedzi) i porcja z przyszłości
+    for offset in (0, 60):
+        response = client.put(url, params={"offset": offset}, content=DATA[offset:offset + 30])
+        assert response.status_code == 409
+        assert response.json()["detail"] == {"message": "Offset mismatch", "offset": 30}
+
+    assert client.get(url).json()["offset"] == 30
+
+
+def test_chunk_past_declared_size_is_rejected(client, create_location):
+    location_id, _ = create_location()
+    url = _start(client, location_id)
+
+    response = client.put(url, params={"offset": 0}, content=DATA + b"!")
+    assert response.status_code == 413
+    # Blokada zwolniona, offset bez zmian – można ponowić poprawną porcją
+    assert client.put(url, params={"offset": 0}, content=DATA).json()["offset"] == len(DATA)
+
+
+async def test_parallel_chunk_is_refused_while_locked(client, db, create_location):
+    location_id, _ = create_location()
+    url = _start(client, location_id)
+    await _set_session(db, url, writing_since=datetime.utcnow(), write_token="other")
+
+    response = client.put(url, params={"offset": 0}, content=DATA[:10])
+    assert response.status_code == 409
+    assert response.json()["detail"] == {"message": "Chunk already in progress", "offset": 0}
+
+    complete = client.post(f"{url}/complete")
+    assert complete.status_code == 409
+
+
+async def test_stale_lock_is_taken_over(client, db, create_location):
+    location_id, _ = create_location()
+    url = _start(client, location_id)
+    stale = datetime.utcnow() - timedelta(seconds=WRITE_LOCK_SECONDS + 1)
+    await _set_session(db, url, writing_since=stale, write_token="crashed")
+
+    response = client.put(url, params={"offset": 0}, content=DATA[:10])
+    assert response.status_code == 200
+    assert response.json()["offset"] == 10
+
+    session = await db[UPLOAD_SESSIONS].find_one({"_id": ObjectId(url.rsplit("/", 1)[1])})
+    assert session["writing_since"] is None
+    assert session["write_token"] is None
+
+
+async def test_complete_is_claimed_once(client, db, create_location):
+    location_id, _ = create_location()
+    url = _start(client, location_id)
+    client.put(url, params={"offset": 0}, content=DATA)
+    await _set_session(db, url, status="completing")
+
+    assert client.post(f"{url}/complete").status_code == 409
+    # W trakcie kończenia żadna porcja nie dopisze się do pliku
+    assert client.put(url, params={"offset": len(DATA)}, content=b"x").status_code == 409
+
+
+def test_incomplete_upload_cannot_complete(client, create_location):
+    location_id, _ = create_location()
+    url = _start(client, location_id)
+    client.put(url, params={"offset": 0}, content=DATA[:50])
+
+    response = client.post(f"{url}/complete")
+    assert response.status_code == 409
+    assert response.json()["detail"] == {"message": "Upload incomplete", "offset": 50}
+
+
+def test_sha256_mismatch_discards_upload(client, create_location, upload_dir):
+    location_id, _ = create_location()
+    url = _start(client, location_id, sha256="0" * 64)
+    client.put(url, params={"offset": 0}, content=DATA)
+
+    assert client.post(f"{url}/complete").status_code == 422
+    assert client.get(url).status_code == 404
+    assert not (upload_dir / location_id / "cennik.txt").exists()
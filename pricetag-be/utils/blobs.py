@@ -0,0 +1,97 @@
+"""
+Pliki adresowane treścią: `<katalog lokalizacji>/<sha256>.<rozszerzenie>`.
+
+Ten sam plik wgrany kilka razy zajmuje miejsce raz, a urządzenie trzyma tylko nazwę
+pliku (`photo`/`video`) i skrót (`photoHash`/`videoHash`) zamiast base64 w dokumencie.
+Stare wartości base64 są zamieniane na pliki przy pierwszym odczycie urządzenia
+(utils/devices.migrate_legacy_media).
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple
+
+from config import settings
+
+BLOB_NAME_RE = re.compile(r"^([0-9a-f]{64})\.[a-z0-9]+$")
+
+_DATA_URL_RE = re.compile(r"^data:[\w/+.-]+;base64,(.*)$", re.DOTALL)
+_BASE64_RE = re.compile(r"^[A-Za-z0-9+/_-]+={0,2}$")
+
+# Krótsze wartości to nazwy plików, nie zakodowane media
+_MIN_BASE64_LENGTH = 128
+
+# Sygnatury formatów: (przesunięcie, bajty, rozszerzenie)
+_SIGNATURES = (
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"\xff\xd8\xff", "jpg"),
+    (0, b"GIF8", "gif"),
+    (8, b"WEBP", "webp"),
+    (4, b"ftyp", "mp4"),
+    (0, b"\x1a\x45\xdf\xa3", "webm"),
+)
+
+
+def location_dir(location_id: str) -> Path:
+    return Path(settings.UPLOAD_DIR) / location_id
+
+
+def blob_hash(filename: Optional[str]) -> Optional[str]:
+    """SHA-256 z nazwy pliku adresowanego treścią albo None dla zwykłej nazwy."""
+    match = BLOB_NAME_RE.match(filename or "")
+    return match.group(1) if match else None
+
+
+def sniff_extension(data: bytes, default: str = "bin") -> str:
+    for offset, signature, extension in _SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            return extension
+    return default
+
+
+def decode_legacy_media(value: Optional[str]) -> Optional[bytes]:
+    """Bajty mediów zapisanych dawniej jako base64 (lub data URL) albo None dla nazwy pliku."""
+    if not value or len(value) < _MIN_BASE64_LENGTH:
+        return None
+    value = value.strip()
+    match = _DATA_URL_RE.match(value)
+    if match:
+        value = match.group(1).strip()
+    if not _BASE64_RE.match(value):
+        return None
+    value = value.replace("-", "+").replace("_", "/")
+    value += "=" * (-len(value) % 4)
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def store_blob(location_id: str, data: bytes, extension: str) -> Tuple[str, str, bool]:
+    """
+    Zapisuje treść jako `<sha256>.<extension>` (atomowo, przez plik tymczasowy).
+    Zwraca (sha256, nazwa_pliku, czy_plik_już_istniał). Operacja blokująca – z handlerów
+    wywoływać przez asyncio.to_thread.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    filename = f"{sha256}.{extension.lower().lstrip('.')}"
+    directory = location_dir(location_id)
+    target = directory / filename
+    if target.exists():
+        return sha256, filename, True
+
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".blob-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sha256, filename, False
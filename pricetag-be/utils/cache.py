@@ -0,0 +1,114 @@
+"""
+Pamięć podręczna lokalizacji (dokument lokalizacji + pełna lista urządzeń) w procesie API.
+
+Odczyty tej samej lokalizacji przez FE i skrypty pipeline'u (co minutę, z wielu
+urządzeń brzegowych) są obsługiwane z pamięci. Każdy zapis przechodzi przez
+utils/changes.record_change, który unieważnia wpis. Licznik generacji chroni przed
+wyścigiem: odczyt rozpoczęty przed zapisem nie wstawi do cache starych danych.
+Zapisy z innych procesów API widać najpóźniej po LOCATION_CACHE_TTL_SECONDS.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+
+from config import settings
+from utils.devices import find_location_devices
+
+
+class LocationCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Wartość bez liczenia trafień i bez zmiany kolejności LRU (np. sama rewizja dla ETag)."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def generation(self, key: str) -> int:
+        return self._generations.get(key, 0)
+
+    def set(self, key: str, value: Any, generation: int):
+        """Wstawia wartość, o ile od rozpoczęcia odczytu (`generation`) nie było zapisu."""
+        if self.generation(key) != generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        for key in list(self._entries):
+            self.invalidate(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+location_cache = LocationCache(settings.LOCATION_CACHE_SIZE, settings.LOCATION_CACHE_TTL_SECONDS)
+
+
+async def get_cached_location(db, location_id: str) -> Optional[dict]:
+    """
+    Lokalizacja w kształcie API (z pełną listą `devices`) albo None.
+    Zwraca kopię – wywołujący może ją modyfikować bez wpływu na cache.
+    """
+    cached = location_cache.get(location_id)
+    if cached is None:
+        generation = location_cache.generation(location_id)
+        # Rewizja jest czytana razem z lokalizacją, przed urządzeniami – ETag nigdy nie wyprzedza danych
+        location = await db["locations"].find_one({"_id": ObjectId(location_id)})
+        if not location:
+            return None
+        location["_id"] = str(location["_id"])
+        location["devices"] = await find_location_devices(db, location_id)
+        location_cache.set(location_id, location, generation)
+        cached = location
+
+    copy = dict(cached)
+    copy["devices"] = [dict(d) for d in cached["devices"]]
+    return copy
+
+
+async def location_exists(db, location_id: str) -> bool:
+    if location_cache.peek(location_id) is not None:
+        return True
+    return await db["locations"].count_documents({"_id": ObjectId(location_id)}, limit=1) > 0
+
+
+def project_devices(devices: List[dict], projection: Optional[dict]) -> List[dict]:
+    """Projekcja listy urządzeń z cache (odpowiednik projekcji MongoDB z device_projection)."""
+    if projection is None:
+        return devices
+    return [{k: d[k] for k in projection if k in d} for d in devices]
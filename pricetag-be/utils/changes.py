@@ -0,0 +1,118 @@
+"""
+Dziennik zmian lokalizacji (`device_events`) dla przyrostowego pobierania urządzeń.
+
+Każdy zapis podbija `locations.rev` (utils/revisions.py) i zapisuje zdarzenie z tą
+samą wartością jako `seq`, więc numery zdarzeń w lokalizacji są gęste (1, 2, 3, ...).
+Czytelnik zmian może dzięki temu wykryć lukę – zapis, który dostał już numer,
+ale jego zdarzenie jeszcze nie zostało wstawione – i nie przesunąć kursora poza nią.
+
+Zdarzenie:
+    {"location_id": ObjectId, "seq": int, "op": str, "device_ids": [str], "at": datetime}
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from utils.cache import location_cache
+from utils.events import broker, change_message, device_states
+from utils.revisions import bump_revision
+
+logger = logging.getLogger(__name__)
+
+DEVICE_EVENTS = "device_events"
+
+# Jak długo trzymamy zdarzenia – starszy kursor dostaje `reset` i pobiera pełną listę
+EVENTS_TTL_SECONDS = 7 * 24 * 3600
+
+# Luka w numeracji starsza niż to okno oznacza zapis, który nie dokończył się (np. restart)
+GAP_GRACE_SECONDS = 5
+
+
+async def record_change(db, location_id: str, device_ids: Iterable[str] = (), op: str = "update") -> int:
+    """
+    Rejestruje zapis w lokalizacji: podbija rewizję i dopisuje zdarzenie.
+    `device_ids` – urządzenia, których dotyczy zmiana (puste dla zmian grup/harmonogramów itp.).
+    Zwraca nowy numer sekwencyjny.
+    """
+    seq = await bump_revision(db, location_id)
+    location_cache.invalidate(location_id)
+    if seq:
+        await db[DEVICE_EVENTS].insert_one({
+            "location_id": ObjectId(location_id),
+            "seq": seq,
+            "op": op,
+            "device_ids": [str(d) for d in device_ids],
+            "at": datetime.utcnow()
+        })
+        try:
+            await broker.publish(db, location_id, seq, op, [str(d) for d in device_ids])
+        except Exception as e:
+            # Zapis już się udał – subskrybenci dociągną zdarzenie z dziennika
+            logger.error(f"Error publishing change {seq} of location {location_id}: {e}")
+    return seq
+
+
+async def read_changes(db, location_id: str, since: int, limit: int) -> Tuple[Optional[List[dict]], int]:
+    """
+    Zdarzenia z seq > since, tylko do pierwszej „świeżej” luki w numeracji.
+    Zwraca (zdarzenia, nowy_kursor); zdarzenia == None oznacza, że kursor jest starszy
+    niż najstarsze zachowane zdarzenie i klient musi pobrać pełną listę.
+    """
+    events_collection = db[DEVICE_EVENTS]
+    oldest = await events_collection.find_one(
+        {"location_id": ObjectId(location_id)}, {"seq": 1}, sort=[("seq", ASCENDING)]
+    )
+    if oldest is None or oldest["seq"] > since + 1:
+        return None, since
+
+    events = await events_collection.find(
+        {"location_id": ObjectId(location_id), "seq": {"$gt": since}}
+    ).sort("seq", ASCENDING).limit(limit).to_list(length=limit)
+
+    settled_before = datetime.utcnow() - timedelta(seconds=GAP_GRACE_SECONDS)
+    cursor = since
+    accepted = []
+    for event in events:
+        if event["seq"] != cursor + 1 and event["at"] > settled_before:
+            # Brakujący numer może jeszcze zostać zapisany – zatrzymujemy kursor przed luką
+            break
+        accepted.append(event)
+        cursor = event["seq"]
+    return accepted, cursor
+
+
+async def replay_changes(db, location_id: str, since: int, batch_size: int = 500) -> AsyncIterator[dict]:
+    """
+    Zaległe zdarzenia od `since` w kształcie wiadomości strumienia SSE (utils/events.py).
+    Gdy dziennik nie sięga tak daleko, zwraca jedną wiadomość `reset` z aktualną rewizją.
+    """
+    while True:
+        events, cursor = await read_changes(db, location_id, since, batch_size)
+        if events is None:
+            location = await db["locations"].find_one({"_id": ObjectId(location_id)}, {"rev": 1})
+            yield {"type": "reset", "seq": (location or {}).get("rev", 0)}
+            return
+        if not events:
+            return
+
+        states = await device_states(db, events)
+        for event in events:
+            yield change_message(event, states)
+
+        since = cursor
+        if len(events) < batch_size:
+            return
+
+
+async def ensure_indexes(db):
+    await db[DEVICE_EVENTS].create_index(
+        [("location_id", ASCENDING), ("seq", ASCENDING)],
+        unique=True,
+        name="location_id_seq_unique"
+    )
+    await db[DEVICE_EVENTS].create_index(
+        "at", expireAfterSeconds=EVENTS_TTL_SECONDS, name="at_ttl"
+    )
@@ -0,0 +1,32 @@
+"""
+Wszystko, co wynika z zapisu pliku w katalogu lokalizacji: wpis w manifeście
+i dane pochodne (wersja "device", animowany podgląd, miniaturki).
+
+Upload zwykły, upload po treści i wznawialny upload kończą się tym samym ciągiem
+kroków – `after_file_written` – więc nowa wersja pochodna dochodzi w jednym miejscu.
+"""
+from typing import Optional
+
+from utils.manifest import index_file
+from utils.previews import refresh_preview
+from utils.thumbnails import discard_thumbnails, warm_thumbnails
+from utils.transcode import refresh_device_variant
+
+
+async def after_file_written(
+    db, location_id: str, filename: str, digests: dict, previous: Optional[dict] = None
+):
+    """
+    Po atomowym zapisie pliku: indeksuje go (`digests` – sha256 i md5 treści) i zleca
+    w tle dane pochodne nowej treści. `previous` to wpis manifestu sprzed zapisu –
+    pochodne poprzedniej treści są sprzątane, jeśli nic już z niej nie korzysta.
+    """
+    previous_sha256 = previous and previous.get("sha256")
+    await index_file(db, location_id, filename, digests["sha256"], digests["md5"])
+    # Wersja dla cenówek kodowana raz, w tle – zanim ktokolwiek o nią poprosi
+    await refresh_device_variant(db, location_id, filename, previous_sha256)
+    await refresh_preview(db, location_id, filename, previous_sha256)
+    if previous_sha256:
+        await discard_thumbnails(db, location_id, previous_sha256)
+    # Miniaturki standardowych rozmiarów od razu w tle – pierwsze otwarcie galerii nie czeka na ffmpeg
+    await warm_thumbnails(db, location_id, filename, digests["sha256"])
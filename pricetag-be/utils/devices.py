@@ -0,0 +1,235 @@
+"""
+Kolekcja `devices` – urządzenia trzymane w osobnych dokumentach zamiast tablicy
+`locations.devices`.
+
+Dokument urządzenia:
+    {
+        "_id": "<ObjectId jako string>",
+        "location_id": ObjectId,
+        "clientId", "clientName", "ip", "photo", "video",
+        "changed", "thumbnail", "groups": [ObjectId], "isOnline",
+        "photoHash", "videoHash"    # sha256 pliku z photo/video (utils/blobs.py)
+    }
+
+Odpowiedzi REST nie zmieniają kształtu – `location_id` jest wewnętrzny i nie
+trafia do klienta (patrz `serialize_device`).
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.blobs import decode_legacy_media, sniff_extension, store_blob
+from utils.manifest import index_file
+
+logger = logging.getLogger(__name__)
+
+DEVICES = "devices"
+
+# Pola wewnętrzne, których nie zwracamy w API
+_INTERNAL_FIELDS = ("location_id",)
+
+# Pola, o które można prosić przez ?fields=
+DEVICE_FIELDS = {
+    "_id", "clientId", "clientName", "ip", "photo", "video",
+    "changed", "thumbnail", "groups", "isOnline", "photoHash", "videoHash"
+}
+
+MEDIA_FIELDS = ("photo", "video")
+
+# ?view=slim – to, czego potrzebują skrypty pipeline'u (bez photo/video/thumbnail)
+SLIM_FIELDS = ("_id", "clientId", "ip", "changed", "isOnline")
+
+
+def device_projection(view: Optional[str] = None, fields: Optional[str] = None) -> Optional[dict]:
+    """
+    Projekcja MongoDB dla listy urządzeń: `fields` (lista po przecinku) ma pierwszeństwo
+    przed `view`. None oznacza pełny dokument. Nieznane pola/widok -> ValueError.
+    """
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested - DEVICE_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown device fields: {', '.join(sorted(unknown))}")
+    elif view in (None, "", "full"):
+        return None
+    elif view == "slim":
+        requested = set(SLIM_FIELDS)
+    else:
+        raise ValueError(f"Unknown view: {view}")
+
+    projection = {field: 1 for field in requested}
+    projection.setdefault("_id", 1)
+    return projection
+
+
+def new_device_doc(location_id: str, device) -> dict:
+    """Buduje dokument nowego urządzenia z modelu `Device`."""
+    return {
+        "_id": str(ObjectId()),
+        "location_id": ObjectId(location_id),
+        "clientId": device.clientId,
+        "clientName": device.clientName,
+        "ip": device.ip or "",
+        "photo": device.photo,
+        "video": device.video,
+        "changed": "false",
+        "thumbnail": None,
+        "groups": [],
+        "isOnline": True
+    }
+
+
+def serialize_device(doc: dict) -> dict:
+    """Dokument z kolekcji -> kształt zwracany przez API (jak dawniej w locations.devices)."""
+    for field in _INTERNAL_FIELDS:
+        doc.pop(field, None)
+    if "_id" in doc:
+        doc["_id"] = str(doc["_id"])
+    if doc.get("groups"):
+        doc["groups"] = [str(g) for g in doc["groups"]]
+    return doc
+
+
+async def migrate_legacy_media(db, docs: List[dict]):
+    """
+    Zamienia media zapisane w urządzeniu jako base64 na pliki adresowane treścią
+    (utils/blobs.py) i zostawia w dokumencie tylko nazwę pliku i skrót.
+    Dokumenty (z `location_id`) są poprawiane w miejscu, więc odczyt od razu zwraca nowy kształt.
+    """
+    migrated: Dict[str, List[str]] = {}
+    for doc in docs:
+        updates = {}
+        for field in MEDIA_FIELDS:
+            data = decode_legacy_media(doc.get(field))
+            if data is None:
+                continue
+            default_extension = "png" if field == "photo" else "mp4"
+            sha256, filename, existed = await asyncio.to_thread(
+                store_blob, str(doc["location_id"]), data, sniff_extension(data, default_extension)
+            )
+            if not existed:
+                await index_file(db, str(doc["location_id"]), filename, sha256)
+            updates[field] = filename
+            updates[f"{field}Hash"] = sha256
+        if not updates:
+            continue
+
+        # Warunek na starą wartość – równoległy zapis nowego pliku nie zostanie nadpisany
+        result = await db[DEVICES].update_one(
+            {"_id": doc["_id"], **{f: doc[f] for f in MEDIA_FIELDS if f in updates}},
+            {"$set": updates}
+        )
+        doc.update(updates)
+        if result.modified_count:
+            migrated.setdefault(str(doc["location_id"]), []).append(str(doc["_id"]))
+            logger.info(f"Moved base64 media of device {doc['_id']} to {', '.join(updates[f] for f in MEDIA_FIELDS if f in updates)}")
+
+    if migrated:
+        # Import lokalny: utils.changes -> utils.events -> utils.devices
+        from utils.changes import record_change
+        for location_id, device_ids in migrated.items():
+            await record_change(db, location_id, device_ids, op="media")
+
+
+async def find_location_devices(db, location_id: str, projection: Optional[dict] = None) -> List[dict]:
+    """Wszystkie urządzenia jednej lokalizacji (zapytanie po indeksie location_id)."""
+    if projection is not None:
+        projection = {**projection, "location_id": 1}
+    docs = await db[DEVICES].find({"location_id": ObjectId(location_id)}, projection).to_list(length=None)
+    await migrate_legacy_media(db, docs)
+    return [serialize_device(d) for d in docs]
+
+
+async def devices_by_location(db, location_ids: Iterable[ObjectId], projection: Optional[dict] = None) -> Dict[str, List[dict]]:
+    """
+    Urządzenia wielu lokalizacji jednym zapytaniem, pogrupowane po str(location_id).
+    """
+    if projection is not None:
+        projection = {**projection, "location_id": 1}
+    grouped: Dict[str, List[dict]] = {}
+    docs = await db[DEVICES].find({"location_id": {"$in": list(location_ids)}}, projection).to_list(length=None)
+    await migrate_legacy_media(db, docs)
+    for doc in docs:
+        grouped.setdefault(str(doc["location_id"]), []).append(serialize_device(doc))
+    return grouped
+
+
+async def ensure_indexes(db):
+    """
+    Indeksy kolekcji devices (idempotentne):
+    - unikalny (location_id, clientId) – obsługuje też wszystkie zapytania po samym location_id
+      (prefiks indeksu), więc osobny indeks {location_id: 1} byłby zbędnym kosztem zapisu,
+    - (location_id, groups) – urządzenia w grupie danej lokalizacji.
+    """
+    await db[DEVICES].create_index(
+        [("location_id", ASCENDING), ("clientId", ASCENDING)],
+        unique=True,
+        name="location_id_clientId_unique"
+    )
+    await db[DEVICES].create_index(
+        [("location_id", ASCENDING), ("groups", ASCENDING)],
+        name="location_id_groups"
+    )
+
+
+async def migrate_embedded_devices(db, keep_embedded: bool = False) -> int:
+    """
+    Przenosi urządzenia z `locations.devices` do kolekcji `devices`.
+    Idempotentne: urządzenie jest wstawiane tylko, jeśli go jeszcze nie ma (po _id) –
+    dokument w `devices` jest nowszy niż kopia w tablicy i nigdy nie jest nadpisywany.
+    Z `keep_embedded` (tak działa start API) tablica w lokalizacji zostaje – powrót do
+    poprzedniej wersji nie gubi urządzeń – a lokalizacja jest oznaczana `devices_migrated`,
+    żeby kolejne takie uruchomienia ją pomijały. Bez `keep_embedded` (jawny krok:
+    migrate_devices.py) tablica jest usuwana, także w lokalizacjach oznaczonych wcześniej.
+    Lokalizacja z konfliktem (ten sam clientId pod innym _id) jest logowana i zostaje
+    nietknięta. Zwraca liczbę przeniesionych urządzeń.
+    """
+    moved = 0
+    query = {"devices.0": {"$exists": True}}
+    if keep_embedded:
+        query["devices_migrated"] = {"$ne": True}
+    cursor = db["locations"].find(query, {"devices": 1})
+    async for location in cursor:
+        operations = []
+        seen_client_ids = set()
+        for device in location.get("devices", []):
+            # (location_id, clientId) jest unikalne – duplikaty z dawnej tablicy pomijamy
+            if device.get("clientId") in seen_client_ids:
+                logger.warning(f"Skipping duplicate clientId {device.get('clientId')} in location {location['_id']}")
+                continue
+            seen_client_ids.add(device.get("clientId"))
+
+            doc = dict(device)
+            device_id = str(doc.pop("_id", None) or ObjectId())
+            doc["location_id"] = location["_id"]
+            doc.setdefault("groups", [])
+            operations.append(UpdateOne({"_id": device_id}, {"$setOnInsert": doc}, upsert=True))
+
+        inserted = 0
+        if operations:
+            try:
+                result = await db[DEVICES].bulk_write(operations, ordered=False)
+                inserted = result.upserted_count
+            except BulkWriteError as e:
+                # Tablica zostaje – po rozwiązaniu konfliktu migrację można powtórzyć
+                logger.error(
+                    f"Could not migrate devices of location {location['_id']}: "
+                    f"{len(e.details.get('writeErrors', []))} conflict(s), e.g. "
+                    f"{(e.details.get('writeErrors') or [{}])[0].get('errmsg')}"
+                )
+                moved += e.details.get("nUpserted", 0)
+                continue
+        moved += inserted
+
+        if keep_embedded:
+            await db["locations"].update_one({"_id": location["_id"]}, {"$set": {"devices_migrated": True}})
+        else:
+            await db["locations"].update_one({"_id": location["_id"]}, {"$unset": {"devices": ""}})
+
+        logger.info(f"Migrated {inserted} device(s) of location {location['_id']}")
+
+    return moved
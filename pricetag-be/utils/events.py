@@ -0,0 +1,128 @@
+"""
+Broker zdarzeń lokalizacji dla strumienia SSE (`GET /api/locations/{id}/events`).
+
+Zapisy (utils/changes.record_change) publikują tu zdarzenia z numerem `seq`.
+Broker układa je w kolejności numerów (równoległe zapisy mogą skończyć się
+w innej kolejności, niż dostały numery), a potem dla całej paczki robi jedno
+zapytanie o aktualny stan urządzeń i rozsyła gotowe wiadomości do wszystkich
+subskrybentów – koszt w MongoDB nie rośnie z liczbą podłączonych klientów.
+
+Broker działa w obrębie jednego procesu API. Subskrybent, który nie nadąża,
+dostaje wiadomość `overflow` i dociąga zaległości z `device_events`.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Set
+
+from utils.devices import DEVICES, serialize_device
+
+
+async def device_states(db, events: List[dict]) -> Dict[str, dict]:
+    """Aktualny stan urządzeń, których dotyczą zdarzenia – jednym zapytaniem."""
+    touched = list(dict.fromkeys(d for e in events for d in e["device_ids"]))
+    states = {}
+    if touched:
+        async for doc in db[DEVICES].find({"_id": {"$in": touched}}):
+            states[doc["_id"]] = serialize_device(doc)
+    return states
+
+
+def change_message(event: dict, states: Dict[str, dict]) -> dict:
+    """Wiadomość strumienia dla zdarzenia; urządzenia, których już nie ma, trafiają do `deleted`."""
+    return {
+        "type": "change",
+        "seq": event["seq"],
+        "op": event["op"],
+        "devices": [states[d] for d in event["device_ids"] if d in states],
+        "deleted": [d for d in event["device_ids"] if d not in states]
+    }
+
+
+class LocationEventBroker:
+    def __init__(self, queue_size: int = 256, gap_grace: float = 5.0):
+        self.queue_size = queue_size
+        self.gap_grace = gap_grace
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._next_seq: Dict[str, int] = {}
+        self._pending: Dict[str, Dict[int, dict]] = defaultdict(dict)
+        self._gap_timers: Dict[str, asyncio.TimerHandle] = {}
+
+    def subscribe(self, location_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[location_id].add(queue)
+        return queue
+
+    def unsubscribe(self, location_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(location_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[location_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    async def publish(self, db, location_id: str, seq: int, op: str, device_ids: List[str]):
+        """Przyjmuje zdarzenie zapisu; dostarcza je po uzupełnieniu wcześniejszych numerów."""
+        event = {"seq": seq, "op": op, "device_ids": list(device_ids)}
+        if seq < self._next_seq.get(location_id, seq):
+            # Spóźniony zapis po pominiętej luce – dostarczamy od razu, klient deduplikuje po seq
+            await self._deliver(db, location_id, [event])
+            return
+        self._pending[location_id][seq] = event
+        await self._drain(db, location_id, force=False)
+
+    async def _drain(self, db, location_id: str, force: bool):
+        pending = self._pending.get(location_id)
+        if not pending:
+            return
+
+        expected = self._next_seq.get(location_id, min(pending))
+        if force and expected not in pending:
+            expected = min(pending)
+
+        ready = []
+        while expected in pending:
+            ready.append(pending.pop(expected))
+            expected += 1
+        self._next_seq[location_id] = expected
+
+        timer = self._gap_timers.pop(location_id, None)
+        if timer:
+            timer.cancel()
+        if pending:
+            # Luka w numeracji – czekamy chwilę na brakujący zapis, potem ją pomijamy
+            loop = asyncio.get_running_loop()
+            self._gap_timers[location_id] = loop.call_later(
+                self.gap_grace, lambda: asyncio.ensure_future(self._drain(db, location_id, force=True))
+            )
+        else:
+            self._pending.pop(location_id, None)
+
+        if ready:
+            await self._deliver(db, location_id, ready)
+
+    async def _deliver(self, db, location_id: str, events: List[dict]):
+        subscribers = self._subscribers.get(location_id)
+        if not subscribers:
+            return
+
+        # Jedno zapytanie o stan urządzeń dla całej paczki, niezależnie od liczby klientów
+        states = await device_states(db, events)
+        for event in events:
+            message = change_message(event, states)
+            for queue in list(subscribers):
+                self._offer(queue, message)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: dict):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Klient nie nadąża – czyścimy kolejkę, a on dociągnie zaległości z dziennika
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "overflow"})
+
+
+broker = LocationEventBroker()
@@ -0,0 +1,85 @@
+"""
+Wspólny limit równoczesnych procesów ffmpeg/ffprobe tego procesu API.
+
+Miniaturki wideo, kodowanie wersji "device" i ffprobe manifestu uruchamiają ffmpeg/ffprobe
+z różnych miejsc (workery kolejki, żądania, upload). Wszystkie przechodzą przez `ffmpeg.run`,
+który wpuszcza najwyżej FFMPEG_CONCURRENCY procesów naraz; reszta czeka na wolne miejsce.
+Czas oczekiwania w kolejce jest w /metrics jako `ffmpeg`.
+"""
+import asyncio
+import os
+import time
+from typing import Optional, Tuple
+
+from config import settings
+
+
+class FfmpegLimiter:
+    def __init__(self, limit: int):
+        self.limit = max(limit, 1)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._running = 0
+        self._max_waiting = 0
+        self._completed = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Tworzony leniwie – w pętli zdarzeń, w której działa aplikacja
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    async def run(self, cmd: list, timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+        """
+        Uruchamia `cmd`, gdy jest wolne miejsce; zwraca (kod wyjścia, stdout, stderr).
+        `timeout` liczy się od startu procesu (nie od wejścia do kolejki) – po nim proces
+        jest zabijany i leci asyncio.TimeoutError.
+        """
+        queued = time.monotonic()
+        self._waiting += 1
+        self._max_waiting = max(self._max_waiting, self._waiting)
+        try:
+            await self._get_semaphore().acquire()
+        finally:
+            self._waiting -= 1
+        started = time.monotonic()
+        waited = started - queued
+        self._wait_seconds += waited
+        self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        self._running += 1
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # Nie zostawiamy osieroconego ffmpeg zajmującego rdzeń
+                process.kill()
+                await process.wait()
+                raise
+            return process.returncode, stdout, stderr
+        finally:
+            self._running -= 1
+            self._completed += 1
+            self._run_seconds += time.monotonic() - started
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        completed = self._completed
+        return {
+            "limit": self.limit,
+            "waiting": self._waiting,
+            "running": self._running,
+            "max_waiting": self._max_waiting,
+            "completed": completed,
+            "avg_wait_ms": round(self._wait_seconds / completed * 1000, 1) if completed else 0.0,
+            "max_wait_ms": round(self._max_wait_seconds * 1000, 1),
+            "avg_run_ms": round(self._run_seconds / completed * 1000, 1) if completed else 0.0
+        }
+
+
+ffmpeg = FfmpegLimiter(settings.FFMPEG_CONCURRENCY or os.cpu_count() or 1)
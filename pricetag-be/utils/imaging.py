@@ -0,0 +1,88 @@
+"""
+Osobna, ograniczona pula wątków dla pracy Pillow (dekodowanie, skalowanie, kodowanie PNG).
+
+Praca obrazowa nie trafia do domyślnego executora asyncio.to_thread, z którego korzystają
+zapisy plików i hashowanie – 50 miniaturek galerii zajmuje najwyżej IMAGE_WORKERS wątków,
+a reszta czeka w kolejce, zamiast konkurować z logowaniem i odpytywaniem urządzeń.
+Pillow zwalnia GIL przy dekodowaniu i skalowaniu, więc wątki wystarczają.
+
+Liczniki (kolejka, aktywne, czasy oczekiwania) są w /metrics jako `image_pool`.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from config import settings
+
+
+class ImagePool:
+    def __init__(self, workers: int):
+        self.workers = max(workers, 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._max_queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+        return self._executor
+
+    async def run(self, fn: Callable, *args):
+        """Wykonuje `fn(*args)` w puli obrazów i czeka na wynik bez blokowania pętli."""
+        submitted = time.monotonic()
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+        def task():
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._wait_seconds += started - submitted
+            ok = False
+            try:
+                result = fn(*args)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._run_seconds += time.monotonic() - started
+                    if ok:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), task)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "workers": self.workers,
+                "queued": self._queued,
+                "active": self._active,
+                "max_queued": self._max_queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(self._wait_seconds / finished * 1000, 1) if finished else 0.0,
+                "avg_run_ms": round(self._run_seconds / finished * 1000, 1) if finished else 0.0
+            }
+
+
+image_pool = ImagePool(settings.IMAGE_WORKERS or os.cpu_count() or 1)
@@ -0,0 +1,89 @@
+"""
+Indeksy wszystkich kolekcji i kontrola planów zapytań – uruchamiane przy starcie API.
+
+`ensure_indexes` jest idempotentne (create_index na istniejącym indeksie nic nie robi).
+`audit_query_plans` robi explain() głównych zapytań i ostrzega w logach, gdy któreś
+przechodzi przez całą kolekcję (COLLSCAN) – np. po ręcznym usunięciu indeksu.
+"""
+import logging
+from typing import List
+
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+from utils import changes as change_log
+from utils import devices as device_store
+from utils import jobs
+from utils import manifest
+
+logger = logging.getLogger(__name__)
+
+# (kolekcja, klucze, opcje create_index)
+INDEXES = [
+    # Harmonogramy urządzenia: lista, usuwanie, has-schedule i sprawdzanie duplikatu przy dodawaniu
+    ("schedules", [("locationId", ASCENDING), ("deviceId", ASCENDING)], {"name": "locationId_deviceId"}),
+    ("groups", [("location_id", ASCENDING)], {"name": "location_id"}),
+    ("priceusers", [("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    ("users", [("login", ASCENDING)], {"name": "login_unique", "unique": True}),
+    # Sprzątanie porzuconych sesji uploadu (utils/uploads.cleanup_upload_sessions)
+    ("upload_sessions", [("updated_at", ASCENDING)], {"name": "updated_at"}),
+]
+
+# Reprezentatywne zapytania API: (kolekcja, filtr). Wartości są przykładowe – liczy się kształt.
+_SAMPLE_ID = ObjectId()
+AUDITED_QUERIES = [
+    ("devices", {"location_id": _SAMPLE_ID}),
+    ("devices", {"location_id": _SAMPLE_ID, "groups": _SAMPLE_ID}),
+    ("device_events", {"location_id": _SAMPLE_ID, "seq": {"$gt": 0}}),
+    ("schedules", {"locationId": _SAMPLE_ID, "deviceId": _SAMPLE_ID}),
+    ("groups", {"location_id": _SAMPLE_ID}),
+    ("priceusers", {"email": "audit@example.com"}),
+    ("users", {"login": "audit"}),
+    ("media", {"location_id": _SAMPLE_ID}),
+]
+
+
+async def ensure_indexes(db):
+    await device_store.ensure_indexes(db)
+    await change_log.ensure_indexes(db)
+    await manifest.ensure_indexes(db)
+    await jobs.ensure_indexes(db)
+
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            # Np. duplikaty e-maili w starych danych – API ma działać, ale trzeba to posprzątać
+            logger.error(f"Could not create index {options['name']} on {collection}: {e}")
+
+
+def _plan_stages(plan) -> List[str]:
+    """Wszystkie etapy planu (winningPlan bywa zagnieżdżony w inputStage/inputStages/queryPlan)."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def audit_query_plans(db) -> List[dict]:
+    """explain() głównych zapytań; zwraca listę wyników i loguje te, które skanują kolekcję."""
+    results = []
+    for collection, query in AUDITED_QUERIES:
+        try:
+            explained = await db[collection].find(query).explain()
+        except OperationFailure as e:
+            logger.error(f"Could not explain query on {collection}: {e}")
+            continue
+        stages = _plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+        collscan = "COLLSCAN" in stages
+        results.append({"collection": collection, "fields": sorted(query), "stages": stages, "collscan": collscan})
+        if collscan:
+            logger.warning(f"Query on {collection} by {sorted(query)} scans the whole collection (COLLSCAN)")
+    return results
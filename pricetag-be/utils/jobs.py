@@ -0,0 +1,331 @@
+"""
+Trwała kolejka zadań (kolekcja `jobs`) i pula workerów dla ciężkiej obróbki mediów
+(ffmpeg, Pillow) – poza żądaniem HTTP.
+
+Zadanie:
+    {
+        "kind": str, "params": dict, "priority": int, "status": "queued" | "running" | "done" | "failed",
+        "attempts": int, "max_attempts": int, "run_at": datetime, "lease_until": datetime | None,
+        "worker": str | None, "active_key": str (tylko gdy queued/running), "key": str | None,
+        "result": dict | None, "error": str | None, "progress": dict | None (długie zadania),
+        "created_at", "updated_at", "finished_at"
+    }
+
+Worker przejmuje zadanie atomowo (find_one_and_update) na czas dzierżawy (`lease_until`),
+którą przedłuża, dopóki zadanie trwa. Zadanie po restarcie API (wygasła dzierżawa) wraca
+do kolejki. Błąd -> ponowienie z wykładniczym odstępem, po `max_attempts` -> failed.
+
+Niższe `priority` wygrywa: miniaturka, na którą czeka użytkownik (PRIORITY_INTERACTIVE),
+wyprzedza kodowania w tle (PRIORITY_BULK). `key` deduplikuje – to samo zadanie zlecone
+ponownie, gdy poprzednie jeszcze czeka, zwraca istniejące (z wyższym z priorytetów).
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+JOBS = "jobs"
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+LEASE_SECONDS = 60
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 600
+IDLE_POLL_SECONDS = 2.0
+
+# Ile zadań ukończonych trzymamy (status, wynik) – potem Mongo je usuwa (TTL)
+FINISHED_TTL_SECONDS = 7 * 24 * 3600
+
+Handler = Callable[[object, dict, dict], Awaitable[Optional[dict]]]
+_handlers: Dict[str, Handler] = {}
+
+
+def handler(kind: str):
+    """Rejestruje obsługę rodzaju zadania: `async def fn(db, params, job) -> dict | None`."""
+    def register(fn: Handler) -> Handler:
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+
+
+def job_response(job: dict) -> dict:
+    return {
+        "job_id": str(job["_id"]),
+        "kind": job["kind"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "params": job.get("params", {}),
+        "attempts": job.get("attempts", 0),
+        "max_attempts": job.get("max_attempts"),
+        "run_at": job.get("run_at"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "progress": job.get("progress"),
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at")
+    }
+
+
+async def enqueue(
+    db,
+    kind: str,
+    params: dict,
+    priority: int = PRIORITY_BULK,
+    key: Optional[str] = None,
+    max_attempts: int = 3
+) -> dict:
+    """Dodaje zadanie (albo zwraca to samo, jeszcze niewykonane – po `key`)."""
+    now = datetime.utcnow()
+    job = {
+        "kind": kind,
+        "params": params,
+        "priority": priority,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": now,
+        "lease_until": None,
+        "worker": None,
+        "key": key,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None
+    }
+    if key:
+        job["active_key"] = key
+    try:
+        result = await db[JOBS].insert_one(job)
+        job["_id"] = result.inserted_id
+    except DuplicateKeyError:
+        # To samo zadanie już czeka – najwyżej podbijamy mu priorytet
+        job = await db[JOBS].find_one_and_update(
+            {"active_key": key},
+            {"$min": {"priority": priority}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            # Poprzednie właśnie się zakończyło – spróbuj jeszcze raz
+            return await enqueue(db, kind, params, priority, key, max_attempts)
+    pool.notify()
+    return job
+
+
+async def report_progress(db, job: dict, progress: dict):
+    """Zapisuje postęp trwającego zadania (widoczny w GET /api/jobs/{job_id})."""
+    await db[JOBS].update_one(
+        {"_id": job["_id"], "worker": job.get("worker"), "status": "running"},
+        {"$set": {"progress": dict(progress), "updated_at": datetime.utcnow()}}
+    )
+
+
+async def get_job(db, job_id: str) -> Optional[dict]:
+    if not ObjectId.is_valid(job_id):
+        return None
+    return await db[JOBS].find_one({"_id": ObjectId(job_id)})
+
+
+async def wait_for(db, job_id, timeout: float) -> dict:
+    """Czeka na zakończenie zadania najwyżej `timeout` s; zwraca bieżący stan zadania."""
+    job_id = ObjectId(job_id)
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await db[JOBS].find_one({"_id": job_id})
+        remaining = deadline - asyncio.get_running_loop().time()
+        if job is None or job["status"] in ("done", "failed") or remaining <= 0:
+            return job
+        # Zadania z tego procesu budzą od razu; inne procesy – przy następnym odpytaniu
+        await pool.wait_finished(job_id, min(remaining, 0.5))
+
+
+async def ensure_indexes(db):
+    await db[JOBS].create_index(
+        [("status", ASCENDING), ("priority", ASCENDING), ("run_at", ASCENDING)], name="claim_order"
+    )
+    await db[JOBS].create_index([("active_key", ASCENDING)], unique=True, sparse=True, name="active_key_unique")
+    await db[JOBS].create_index(
+        [("finished_at", ASCENDING)], expireAfterSeconds=FINISHED_TTL_SECONDS, name="finished_ttl"
+    )
+
+
+class JobWorkerPool:
+    """
+    `concurrency` workerów w pętli zdarzeń tego procesu. Ciężka praca dzieje się w
+    podprocesach ffmpeg i w wątkach (Pillow), więc liczba workerów ogranicza liczbę
+    jednocześnie zajętych rdzeni. `kind_limits` dodatkowo ogranicza wybrane rodzaje
+    (np. kodowanie wideo), żeby zawsze został worker dla zadań interaktywnych.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = 0
+        self.kind_limits: Dict[str, int] = {}
+        self._db = None
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._finished: Dict[ObjectId, asyncio.Event] = {}
+        self._running: Dict[str, int] = {}
+        self._processed = 0
+        self._failed = 0
+        self._retried = 0
+
+    def start(self, db, concurrency: int, kind_limits: Optional[Dict[str, int]] = None):
+        self._db = db
+        self.concurrency = max(concurrency, 1)
+        self.kind_limits = kind_limits or {}
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait_finished(self, job_id: ObjectId, timeout: float):
+        event = self._finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if self._finished.get(job_id) is event:
+                self._finished.pop(job_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.concurrency,
+            "running": {kind: count for kind, count in self._running.items() if count},
+            "processed": self._processed,
+            "retried": self._retried,
+            "failed": self._failed
+        }
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        busy_kinds = [kind for kind, limit in self.kind_limits.items() if self._running.get(kind, 0) >= limit]
+        query = {
+            "$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                # Dzierżawa wygasła – worker padł w trakcie, zadanie wraca
+                {"status": "running", "lease_until": {"$lt": now}}
+            ],
+            "kind": {"$in": [kind for kind in _handlers if kind not in busy_kinds]}
+        }
+        return await self._db[JOBS].find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": self.worker_id,
+                    "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority", ASCENDING), ("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _keep_lease(self, job_id: ObjectId):
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            await self._db[JOBS].update_one(
+                {"_id": job_id, "worker": self.worker_id, "status": "running"},
+                {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}}
+            )
+
+    async def _finish(self, job: dict, update: dict):
+        update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+        await self._db[JOBS].update_one({"_id": job["_id"], "worker": self.worker_id}, update)
+        event = self._finished.get(job["_id"])
+        if event:
+            event.set()
+
+    async def _run(self, job: dict):
+        kind = job["kind"]
+        self._running[kind] = self._running.get(kind, 0) + 1
+        lease = asyncio.create_task(self._keep_lease(job["_id"]))
+        try:
+            result = await _handlers[kind](self._db, job.get("params", {}), job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            now = datetime.utcnow()
+            if job["attempts"] < job.get("max_attempts", 1):
+                self._retried += 1
+                delay = backoff_seconds(job["attempts"])
+                logger.warning(f"Job {job['_id']} ({kind}) failed, retry in {delay:.0f}s: {e}")
+                await self._finish(job, {"$set": {
+                    "status": "queued", "run_at": now + timedelta(seconds=delay),
+                    "lease_until": None, "worker": None, "error": str(e)[-1000:]
+                }})
+            else:
+                self._failed += 1
+                logger.error(f"Job {job['_id']} ({kind}) failed permanently: {e}")
+                await self._finish(job, {
+                    "$set": {"status": "failed", "finished_at": now, "lease_until": None, "error": str(e)[-1000:]},
+                    "$unset": {"active_key": ""}
+                })
+        else:
+            self._processed += 1
+            await self._finish(job, {
+                "$set": {"status": "done", "finished_at": datetime.utcnow(), "lease_until": None,
+                         "result": result, "error": None},
+                "$unset": {"active_key": ""}
+            })
+        finally:
+            lease.cancel()
+            self._running[kind] -= 1
+            # Zwolnione miejsce dla rodzaju z limitem – niech inny worker sprawdzi kolejkę
+            self.notify()
+
+    async def _worker_loop(self):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), IDLE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+
+pool = JobWorkerPool()
+
+
+def start_workers(db, kind_limits: Optional[Dict[str, int]] = None) -> JobWorkerPool:
+    """Uruchamia pulę: JOB_WORKERS workerów (0 = liczba rdzeni)."""
+    pool.start(db, concurrency=settings.JOB_WORKERS or os.cpu_count() or 1, kind_limits=kind_limits)
+    return pool
@@ -0,0 +1,335 @@
+"""
+Manifest mediów lokalizacji (kolekcja `media`) – lista plików bez chodzenia po dysku.
+
+Dokument pliku:
+    {
+        "location_id": ObjectId, "filename": str,
+        "size": int, "mtime": datetime, "mime": str, "sha256": str, "md5": str,
+        "duration": float | None, "width": int | None, "height": int | None,
+        "fps": float | None, "video_codec": str | None, "audio_codec": str | None,
+        "has_audio": bool | None, "bit_rate": int | None, "pix_fmt": str | None,
+        "variants": {"<nazwa>": {"status", "sha256", "size", "md5", ...}},
+        "updated_at": datetime
+    }
+
+Manifest jest aktualizowany przy każdym uploadzie i usunięciu pliku. Lokalizacja bez
+manifestu (stare dane, pliki wrzucone ręcznie) jest indeksowana przy pierwszym
+odczycie listy albo na żądanie (`?refresh=true`). `locations.media_rev` rośnie przy
+każdej zmianie i służy do ETag listy.
+
+Metadane (ffprobe / Pillow) są badane raz, przy zapisie pliku – transkodowanie,
+miniaturki i UI harmonogramów czytają je z manifestu zamiast uruchamiać ffprobe.
+
+`md5` to wielkimi literami MD5 w formacie oczekiwanym przez cenówki (PictureMD5/VideoMD5
+w tasku i `sign` uploadu) – liczony raz przy zapisie pliku, a nie przy każdej wysyłce.
+"""
+import asyncio
+import json
+import logging
+import mimetypes
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from utils.blobs import blob_hash, location_dir
+from utils.ffmpeg import ffmpeg
+from utils.uploads import file_digests
+
+logger = logging.getLogger(__name__)
+
+MEDIA = "media"
+
+SORT_FIELDS = {"name": "filename", "size": "size", "mtime": "mtime"}
+
+PROBE_FIELDS = ("duration", "width", "height", "fps", "video_codec", "audio_codec", "has_audio", "bit_rate", "pix_fmt")
+
+# ffprobe czyta tylko nagłówki – zawieszony proces (uszkodzony plik) jest zabijany
+FFPROBE_TIMEOUT_SECONDS = 30
+
+_MANIFEST_FIELDS = ("filename", "size", "mtime", "mime", "sha256", "md5") + PROBE_FIELDS
+
+
+def _is_listed(path: Path) -> bool:
+    # Pliki z kropką to pliki tymczasowe uploadu (.upload-*, .blob-*) – nie są jeszcze gotowe
+    return path.is_file() and not path.name.startswith(".")
+
+
+def _mtime(stat) -> datetime:
+    """mtime jako naiwny UTC z dokładnością MongoDB (milisekundy) – da się porównać z zapisanym."""
+    mtime = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).replace(tzinfo=None)
+    return mtime.replace(microsecond=mtime.microsecond // 1000 * 1000)
+
+
+def _frame_rate(value: Optional[str]) -> Optional[float]:
+    # ffprobe podaje ułamek, np. "24000/1001"
+    try:
+        numerator, _, denominator = (value or "").partition("/")
+        rate = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return round(rate, 3) if rate > 0 else None
+
+
+def _number(value, cast):
+    try:
+        return cast(value) if value not in (None, "", "N/A") else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def _ffprobe(path: Path) -> dict:
+    # Przez wspólny limit procesów ffmpeg/ffprobe – równoczesne uploady i przebudowa manifestu
+    # nie uruchamiają nieograniczonej liczby ffprobe
+    _, stdout, _ = await ffmpeg.run(
+        ["ffprobe", "-v", "error", "-show_streams", "-show_format", "-of", "json", str(path)],
+        timeout=FFPROBE_TIMEOUT_SECONDS
+    )
+    data = json.loads(stdout or b"{}")
+    streams = data.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    fmt = data.get("format") or {}
+    duration = _number(fmt.get("duration"), float)
+    return {
+        "duration": round(duration, 3) if duration is not None else None,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": _frame_rate(video.get("avg_frame_rate")) or _frame_rate(video.get("r_frame_rate")),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "has_audio": audio is not None,
+        "bit_rate": _number(fmt.get("bit_rate"), int),
+        "pix_fmt": video.get("pix_fmt"),
+    }
+
+
+def _image_metadata(path: Path) -> dict:
+    from PIL import Image
+    with Image.open(path) as img:
+        return {"width": img.size[0], "height": img.size[1], "video_codec": (img.format or "").lower() or None}
+
+
+async def probe_media(path: Path, mime: str) -> dict:
+    """Metadane pliku: Pillow (w wątku) dla obrazów, ffprobe dla wideo (brak narzędzia -> None)."""
+    result = dict.fromkeys(PROBE_FIELDS)
+    try:
+        if mime.startswith("image/"):
+            result.update(await asyncio.to_thread(_image_metadata, path))
+            result["has_audio"] = False
+        elif mime.startswith("video/"):
+            result.update(await _ffprobe(path))
+    except Exception as e:
+        logger.warning(f"Could not probe {path}: {e}")
+    return result
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.replace(tzinfo=timezone.utc).isoformat() if value else None
+
+
+def _is_current(doc: Optional[dict], stat) -> bool:
+    """
+    Czy wpis manifestu opisuje plik w tej wersji (rozmiar + mtime) i ma komplet skrótów
+    oraz metadanych (wpisy sprzed dodania pola są badane ponownie).
+    """
+    return (
+        bool(doc) and doc.get("size") == stat.st_size and doc.get("mtime") == _mtime(stat)
+        and bool(doc.get("md5")) and "has_audio" in doc
+    )
+
+
+def _file_entry(path: Path, sha256: Optional[str], md5: Optional[str]) -> dict:
+    stat = path.stat()
+    mime = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    sha256 = sha256 or blob_hash(path.name)
+    if not sha256 or not md5:
+        digests = file_digests(path)
+        sha256, md5 = sha256 or digests["sha256"], md5 or digests["md5"]
+    return {
+        "filename": path.name,
+        "size": stat.st_size,
+        "mtime": _mtime(stat),
+        "mime": mime,
+        "sha256": sha256,
+        "md5": md5.upper(),
+    }
+
+
+async def probe_file(path: Path, sha256: Optional[str] = None, md5: Optional[str] = None) -> dict:
+    """
+    Wpis manifestu dla pliku: stat i skróty w wątku, metadane przez `probe_media`.
+    Skróty policzone już przy uploadzie można podać – plik nie jest wtedy czytany ponownie.
+    """
+    entry = await asyncio.to_thread(_file_entry, path, sha256, md5)
+    entry.update(await probe_media(path, entry["mime"]))
+    return entry
+
+
+async def _bump_media_rev(db, location_id: str, indexed: bool = False):
+    update = {"$inc": {"media_rev": 1}}
+    if indexed:
+        update["$set"] = {"media_indexed": True}
+    await db["locations"].update_one({"_id": ObjectId(location_id)}, update)
+
+
+async def index_file(
+    db, location_id: str, filename: str, sha256: Optional[str] = None, md5: Optional[str] = None
+):
+    """Dodaje/odświeża wpis pliku po zapisie (upload, blob, zakończona sesja uploadu)."""
+    path = location_dir(location_id) / filename
+    entry = await probe_file(path, sha256, md5)
+    entry["updated_at"] = datetime.utcnow()
+    await db[MEDIA].update_one(
+        {"location_id": ObjectId(location_id), "filename": filename},
+        {"$set": entry},
+        upsert=True
+    )
+    await _bump_media_rev(db, location_id)
+    return entry
+
+
+async def get_entry(db, location_id: str, filename: str) -> Optional[dict]:
+    return await db[MEDIA].find_one({"location_id": ObjectId(location_id), "filename": filename})
+
+
+async def is_current_content(db, location_id: str, filename: str, sha256: str) -> bool:
+    """Czy plik w manifeście ma nadal treść `sha256` (zadanie zlecone przed nadpisaniem pliku)."""
+    return bool(await db[MEDIA].count_documents(
+        {"location_id": ObjectId(location_id), "filename": filename, "sha256": sha256}, limit=1
+    ))
+
+
+async def remove_file(db, location_id: str, filename: str) -> Optional[dict]:
+    """Usuwa wpis pliku; zwraca usunięty wpis (np. do sprzątnięcia wersji pochodnych)."""
+    removed = await db[MEDIA].find_one_and_delete({"location_id": ObjectId(location_id), "filename": filename})
+    await _bump_media_rev(db, location_id)
+    return removed
+
+
+async def rebuild_manifest(db, location_id: str) -> int:
+    """
+    Porównuje manifest z katalogiem: nowe i zmienione pliki (rozmiar/mtime) są badane
+    ponownie, brakujące usuwane. Zwraca liczbę zmienionych wpisów.
+    """
+    directory = location_dir(location_id)
+
+    def scan():
+        if not directory.exists():
+            return {}
+        return {p.name: p.stat() for p in directory.iterdir() if _is_listed(p)}
+
+    on_disk = await asyncio.to_thread(scan)
+    known = {
+        doc["filename"]: doc
+        async for doc in db[MEDIA].find({"location_id": ObjectId(location_id)}, {"filename": 1, "size": 1, "mtime": 1, "md5": 1, "has_audio": 1})
+    }
+
+    changed = 0
+    for name, stat in on_disk.items():
+        doc = known.get(name)
+        if _is_current(doc, stat):
+            continue
+        entry = await probe_file(directory / name)
+        entry["updated_at"] = datetime.utcnow()
+        await db[MEDIA].update_one(
+            {"location_id": ObjectId(location_id), "filename": name}, {"$set": entry}, upsert=True
+        )
+        changed += 1
+
+    missing = [name for name in known if name not in on_disk]
+    if missing:
+        await db[MEDIA].delete_many({"location_id": ObjectId(location_id), "filename": {"$in": missing}})
+        changed += len(missing)
+
+    await _bump_media_rev(db, location_id, indexed=True)
+    return changed
+
+
+async def current_entry(db, location_id: str, filename: str) -> dict:
+    """
+    Wpis manifestu aktualnej wersji pliku. Wpis brakujący albo nieaktualny (plik
+    podmieniony poza API) jest najpierw odświeżany.
+    """
+    path = location_dir(location_id) / filename
+    stat = await asyncio.to_thread(path.stat)
+    doc = await db[MEDIA].find_one({"location_id": ObjectId(location_id), "filename": filename})
+    if _is_current(doc, stat):
+        return doc
+    await index_file(db, location_id, filename)
+    return await get_entry(db, location_id, filename)
+
+
+def variants_response(entry: dict) -> dict:
+    """Wersje pochodne bieżącej treści pliku (stan po poprzedniej treści jest pomijany)."""
+    return {
+        name: {key: state.get(key) for key in ("status", "size", "md5")}
+        for name, state in (entry.get("variants") or {}).items()
+        if state.get("sha256") == entry.get("sha256")
+    }
+
+
+def entry_response(entry: dict) -> dict:
+    """Wpis manifestu w odpowiedzi API (bez _id, daty jako ISO)."""
+    result = {field: entry.get(field) for field in _MANIFEST_FIELDS}
+    result["mtime"] = _iso(entry.get("mtime"))
+    variants = variants_response(entry)
+    if variants:
+        result["variants"] = variants
+    return result
+
+
+async def set_variant_state(db, location_id: str, sha256: str, variant: str, state: dict):
+    """
+    Zapisuje stan wersji pochodnej (`variants.<variant>`) wszystkich plików lokalizacji
+    z treścią `sha256`. Zmiana podbija `media_rev` – lista plików pokazuje stan wersji.
+    """
+    state = {**state, "sha256": sha256, "updated_at": datetime.utcnow()}
+    result = await db[MEDIA].update_many(
+        {"location_id": ObjectId(location_id), "sha256": sha256},
+        {"$set": {f"variants.{variant}": state}}
+    )
+    if result.modified_count:
+        await _bump_media_rev(db, location_id)
+
+
+async def manifest_state(db, location_id: str, refresh: bool = False) -> Optional[int]:
+    """
+    Rewizja manifestu (do ETag) – buduje manifest, jeśli lokalizacja go jeszcze nie ma.
+    None, gdy lokalizacja nie istnieje.
+    """
+    location = await db["locations"].find_one(
+        {"_id": ObjectId(location_id)}, {"media_rev": 1, "media_indexed": 1}
+    )
+    if not location:
+        return None
+    if refresh or not location.get("media_indexed"):
+        await rebuild_manifest(db, location_id)
+        location = await db["locations"].find_one({"_id": ObjectId(location_id)}, {"media_rev": 1})
+    return location.get("media_rev", 0)
+
+
+async def list_manifest(
+    db, location_id: str, sort: str = "name", order: str = "asc", offset: int = 0, limit: Optional[int] = None
+) -> dict:
+    query = {"location_id": ObjectId(location_id)}
+    total = await db[MEDIA].count_documents(query)
+    direction = DESCENDING if order == "desc" else ASCENDING
+    cursor = db[MEDIA].find(query, {field: 1 for field in _MANIFEST_FIELDS} | {"variants": 1, "_id": 0})
+    cursor = cursor.sort([(SORT_FIELDS[sort], direction), ("filename", ASCENDING)]).skip(offset)
+    if limit:
+        cursor = cursor.limit(limit)
+    items: List[dict] = []
+    async for doc in cursor:
+        items.append(entry_response(doc))
+    return {"total": total, "offset": offset, "limit": limit, "items": items}
+
+
+async def ensure_indexes(db):
+    await db[MEDIA].create_index(
+        [("location_id", ASCENDING), ("filename", ASCENDING)],
+        unique=True,
+        name="location_id_filename_unique"
+    )
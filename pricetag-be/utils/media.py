@@ -0,0 +1,179 @@
+"""
+Serwowanie plików mediów z walidatorami HTTP: silny ETag z SHA-256 treści,
+Last-Modified, odpowiedzi 304 (If-None-Match / If-Modified-Since) i zakresy bajtów
+(Range / If-Range -> 206, 416).
+
+Pliki adresowane treścią (`<sha256>.<ext>`) i adresy z `?v=` są niezmienne, więc
+dostają `Cache-Control: immutable` – przeglądarka nie pyta o nie ponownie.
+Pozostałe dostają `no-cache`: każde użycie to tania rewalidacja zakończona 304.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from config import settings
+from utils.blobs import blob_hash
+from utils.revisions import etag_matches
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# MD5 treści wielkimi literami – tak jak liczą go cenówki (PictureMD5/VideoMD5, `sign`)
+DEVICE_MD5_HEADER = "X-Device-MD5"
+
+# SHA-256 zwykłych plików liczymy raz na wersję pliku (rozmiar + mtime)
+_DIGEST_CACHE_SIZE = 4096
+_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+
+
+def _sha256_of(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def content_sha256(path: Path, stat: os.stat_result) -> str:
+    """SHA-256 treści: z nazwy pliku adresowanego treścią albo policzony (i zapamiętany)."""
+    from_name = blob_hash(path.name)
+    if from_name:
+        return from_name
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    cached = _digests.get(key)
+    if cached is None:
+        cached = await asyncio.to_thread(_sha256_of, path)
+        _digests[key] = cached
+        while len(_digests) > _DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    else:
+        _digests.move_to_end(key)
+    return cached
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Pojedynczy zakres `bytes=a-b` / `bytes=a-` / `bytes=-n` -> (start, end) włącznie.
+    None = brak lub nieobsługiwany nagłówek (wiele zakresów) -> cały plik.
+    ValueError = zakres poza plikiem (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, separator, end_text = header[len("bytes="):].strip().partition("-")
+    if not separator or not all(t == "" or t.isdigit() for t in (start_text, end_text)):
+        return None
+
+    if start_text == "":
+        if end_text == "":
+            return None
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - length, 0), size - 1
+
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _not_modified_since(request: Request, last_modified: datetime) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header or request.headers.get("if-none-match"):
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return last_modified.replace(microsecond=0) <= since
+
+
+def _if_range_allows(request: Request, etag: str, last_modified_header: str) -> bool:
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return if_range == last_modified_header
+
+
+async def _iter_file(path: Path, start: int, length: int):
+    chunk_size = settings.UPLOAD_CHUNK_SIZE
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+async def media_response(
+    request: Request, path: Path, immutable: Optional[bool] = None, extra_headers: Optional[dict] = None,
+    sha256: Optional[str] = None
+) -> Response:
+    """
+    Odpowiedź z pliku z obsługą ETag/Last-Modified/304 i Range/206/416.
+    `immutable=None` – rozpoznaj po nazwie pliku / `?v=`; `extra_headers` trafiają do
+    każdej odpowiedzi (także 304 i 206). `sha256` – skrót treści znany z manifestu
+    (ETag bez czytania pliku); bez niego liczony przez `content_sha256`.
+    """
+    stat = await asyncio.to_thread(path.stat)
+    size = stat.st_size
+    etag = f'"{sha256 or await content_sha256(path, stat)}"'
+    last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+    last_modified_header = format_datetime(last_modified, usegmt=True)
+
+    if immutable is None:
+        immutable = blob_hash(path.name) is not None or "v" in request.query_params
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified_header,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        **(extra_headers or {})
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag) or _not_modified_since(request, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    byte_range = None
+    if _if_range_allows(request, etag, last_modified_header):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(
+        _iter_file(path, start, length),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers
+    )
@@ -0,0 +1,175 @@
+"""
+Animowany podgląd wideo – krótka, mała, animowana WebP do siatki urządzeń i galerii.
+
+Pierwsze PREVIEW_SECONDS filmu, PREVIEW_FPS klatek/s, zmieszczone w PREVIEW_SIZE px,
+bez dźwięku – kilkadziesiąt-kilkaset KB zamiast oryginalnego MP4, więc 100 podglądów
+w przeglądarce nie zapycha łącza sklepu.
+
+Podgląd jest kluczowany treścią źródła (`<lokalizacja>/.variants/preview/<sha256>.webp`),
+generowany zadaniem `preview` w kolejce (jak wersja "device", priorytet tła), a jego stan
+trafia do manifestu (`media.variants.preview`). Adres podglądu zawiera skrót treści, więc
+może być cache'owany bezterminowo. Wideo wgrane przed wprowadzeniem podglądów dostają je
+przy starcie API (`backfill_previews`) i w zadaniu rozgrzewania lokalizacji
+(`queue_missing_previews`) – lista plików tylko czyta.
+"""
+import asyncio
+import os
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+from bson import ObjectId
+
+from utils import jobs
+from utils.blobs import location_dir
+from utils.ffmpeg import ffmpeg
+from utils.manifest import MEDIA, entry_response, is_current_content, set_variant_state
+
+PREVIEW_VARIANT = "preview"
+PREVIEW_JOB = "preview"
+
+PREVIEW_SECONDS = 4
+PREVIEW_FPS = 8
+PREVIEW_SIZE = 160
+PREVIEW_QUALITY = 50
+
+
+def preview_path(location_id: str, sha256: str) -> Path:
+    return location_dir(location_id) / ".variants" / PREVIEW_VARIANT / f"{sha256}.webp"
+
+
+def preview_url(location_id: str, sha256: str) -> str:
+    return f"/api/locations/{location_id}/previews/{sha256}.webp"
+
+
+async def _render_preview(src: Path, out: Path):
+    await asyncio.to_thread(out.parent.mkdir, parents=True, exist_ok=True)
+    tmp = out.with_name(f".{out.stem}.{uuid.uuid4().hex[:8]}.tmp.webp")
+    try:
+        returncode, _, stderr = await ffmpeg.run([
+            "ffmpeg", "-y", "-t", str(PREVIEW_SECONDS), "-i", str(src),
+            "-vf", f"fps={PREVIEW_FPS},scale={PREVIEW_SIZE}:{PREVIEW_SIZE}:force_original_aspect_ratio=decrease",
+            "-an", "-c:v", "libwebp", "-loop", "0", "-q:v", str(PREVIEW_QUALITY), str(tmp)
+        ])
+        if returncode != 0 or not tmp.exists():
+            raise RuntimeError(f"Could not generate preview: {stderr.decode(errors='replace')[-1000:]}")
+        await asyncio.to_thread(os.replace, tmp, out)
+    finally:
+        await asyncio.to_thread(tmp.unlink, missing_ok=True)
+
+
+@jobs.handler(PREVIEW_JOB)
+async def render_preview(db, params: dict, job: dict) -> dict:
+    location_id, filename, sha256 = params["location_id"], params["filename"], params["sha256"]
+    out = preview_path(location_id, sha256)
+    if not out.exists() and not await is_current_content(db, location_id, filename, sha256):
+        # Plik nadpisano/usunięto po zleceniu – podgląd nowej treści zlecił zapis pliku
+        return {"status": "skipped"}
+    try:
+        if not out.exists():
+            await _render_preview(location_dir(location_id) / filename, out)
+        size = out.stat().st_size
+    except Exception as e:
+        # Ostatnia próba – zapamiętaj porażkę, żeby nie generować w kółko
+        if job["attempts"] >= job["max_attempts"]:
+            await set_variant_state(db, location_id, sha256, PREVIEW_VARIANT, {"status": "failed", "error": str(e)[-500:]})
+        raise
+
+    state = {"status": "ready", "size": size}
+    await set_variant_state(db, location_id, sha256, PREVIEW_VARIANT, state)
+    return state
+
+
+async def request_preview(
+    db, location_id: str, filename: str, priority: int = jobs.PRIORITY_BULK
+) -> Optional[dict]:
+    """
+    Stan podglądu pliku; brakujący zleca w tle (raz na treść).
+    Zwraca {"status": "ready", "path", "url"} | {"status": "processing", "job_id"} |
+    {"status": "failed", "error"} | {"status": "unsupported"}; None, gdy pliku nie ma w manifeście.
+    """
+    entry = await db[MEDIA].find_one(
+        {"location_id": ObjectId(location_id), "filename": filename},
+        {"sha256": 1, "mime": 1, "variants": 1}
+    )
+    if not entry:
+        return None
+    if not (entry.get("mime") or "").startswith("video/"):
+        return {"status": "unsupported"}
+
+    sha256 = entry["sha256"]
+    state = (entry.get("variants") or {}).get(PREVIEW_VARIANT) or {}
+    if state.get("sha256") == sha256:
+        path = preview_path(location_id, sha256)
+        if state.get("status") == "ready" and path.exists():
+            return {"status": "ready", "path": path, "url": preview_url(location_id, sha256)}
+        if state.get("status") == "failed":
+            return {"status": "failed", "error": state.get("error")}
+
+    job = await jobs.enqueue(
+        db,
+        PREVIEW_JOB,
+        {"location_id": location_id, "filename": filename, "sha256": sha256},
+        priority=priority,
+        key=f"{PREVIEW_JOB}:{location_id}:{sha256}"
+    )
+    return {"status": "processing", "job_id": str(job["_id"])}
+
+
+async def queue_missing_previews(db, location_id: str, items: List[dict]) -> int:
+    """
+    Dogenerowanie podglądów plików sprzed ich wprowadzenia: zleca podgląd każdego wideo
+    z listy (wpisy `entry_response`), które nie ma jeszcze żadnego stanu podglądu dla
+    bieżącej treści, i zapisuje stan "queued" – kolejna lista już go nie zleca.
+    Zwraca liczbę zleconych podglądów.
+    """
+    queued = 0
+    for item in items:
+        if not (item.get("mime") or "").startswith("video/") or PREVIEW_VARIANT in (item.get("variants") or {}):
+            continue
+        state = await request_preview(db, location_id, item["filename"])
+        if state and state["status"] == "processing":
+            await set_variant_state(db, location_id, item["sha256"], PREVIEW_VARIANT, {"status": "queued"})
+            queued += 1
+    return queued
+
+
+async def backfill_previews(db) -> int:
+    """
+    Przy starcie API: zleca podglądy wszystkich wideo, które nie mają jeszcze stanu podglądu
+    dla bieżącej treści (pliki sprzed wprowadzenia podglądów). Zwraca liczbę zleconych.
+    """
+    entries = await db[MEDIA].find(
+        {
+            "mime": {"$regex": "^video/"},
+            "$expr": {"$ne": [f"$variants.{PREVIEW_VARIANT}.sha256", "$sha256"]}
+        },
+        {"location_id": 1, "filename": 1, "sha256": 1, "mime": 1, "variants": 1}
+    ).to_list(None)
+    by_location = {}
+    for entry in entries:
+        by_location.setdefault(str(entry["location_id"]), []).append(entry_response(entry))
+    queued = 0
+    for location_id, items in by_location.items():
+        queued += await queue_missing_previews(db, location_id, items)
+    return queued
+
+
+async def refresh_preview(db, location_id: str, filename: str, previous_sha256: Optional[str] = None):
+    """
+    Po zapisie pliku: zleca podgląd nowej treści (tylko wideo) i sprząta podgląd
+    poprzedniej treści, jeśli nic już z niej nie korzysta.
+    """
+    state = await request_preview(db, location_id, filename)
+    if previous_sha256 and state is not None:
+        await discard_preview(db, location_id, previous_sha256)
+    return state
+
+
+async def discard_preview(db, location_id: str, sha256: Optional[str]):
+    """Usuwa podgląd, jeśli żaden plik lokalizacji nie ma już tej treści."""
+    if not sha256:
+        return
+    if await db[MEDIA].count_documents({"location_id": ObjectId(location_id), "sha256": sha256}, limit=1):
+        return
+    await asyncio.to_thread(preview_path(location_id, sha256).unlink, missing_ok=True)
@@ -0,0 +1,65 @@
+"""
+Licznik rewizji lokalizacji (`locations.rev`) i obsługa ETag / If-None-Match.
+
+Każdy zapis dotyczący lokalizacji (urządzenia, grupy, harmonogramy, nazwa/adres)
+podbija `rev`. Odczyty budują z niego silny ETag, więc klient, który odpytuje
+co minutę, dostaje 304 Not Modified bez serializacji całej listy.
+"""
+import hashlib
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import Request, Response, status
+from pymongo import ReturnDocument
+
+from utils.cache import location_cache
+
+
+async def bump_revision(db, location_id: str) -> int:
+    """Podbija rewizję lokalizacji i zwraca nową wartość (0 gdy lokalizacja nie istnieje)."""
+    doc = await db["locations"].find_one_and_update(
+        {"_id": ObjectId(location_id)},
+        {"$inc": {"rev": 1}},
+        projection={"rev": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["rev"] if doc else 0
+
+
+async def get_revision(db, location_id: str) -> Optional[int]:
+    """Aktualna rewizja lokalizacji albo None, gdy lokalizacja nie istnieje."""
+    cached = location_cache.peek(location_id)
+    if cached is not None:
+        return cached.get("rev", 0)
+    doc = await db["locations"].find_one({"_id": ObjectId(location_id)}, {"rev": 1})
+    if not doc:
+        return None
+    return doc.get("rev", 0)
+
+
+def make_etag(location_id: str, rev: int, variant: str = "") -> str:
+    """
+    Silny ETag dla zasobu lokalizacji. `variant` rozróżnia reprezentacje tego samego
+    zasobu (np. ?view=slim, ?fields=..., konkretne urządzenie).
+    """
+    tag = f"{location_id}-{rev}"
+    if variant:
+        tag += "-" + hashlib.sha1(variant.encode("utf-8")).hexdigest()[:12]
+    return f'"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Czy nagłówek If-None-Match pasuje do ETag (obsługa '*', listy i prefiksu W/)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return any(c[2:] == etag if c.startswith("W/") else c == etag for c in candidates)
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Odpowiedź 304 z ETag, jeśli klient ma już tę wersję; w przeciwnym razie None."""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
@@ -0,0 +1,39 @@
+"""
+Łączenie równoczesnych, identycznych operacji w jedną („single-flight”).
+
+Dziesięć kart przeglądarki (albo cenówek) prosi o tę samą, jeszcze niewygenerowaną
+miniaturkę – pierwsze żądanie uruchamia pracę, pozostałe czekają na jej wynik, zamiast
+startować własną. Praca biegnie w osobnym tasku: rozłączenie klienta, który ją zaczął,
+nie przerywa jej pozostałym.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self._started = 0
+        self._shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Wynik `fn()` – wspólny dla wszystkich, którzy wołają z tym samym `key` w tym samym czasie."""
+        flight = self._flights.get(key)
+        if flight is None:
+            self._started += 1
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._shared += 1
+        return await asyncio.shield(flight)
+
+    def _forget(self, key: Hashable, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            # Wyjątek odebrali czekający; bez tego asyncio loguje "never retrieved"
+            flight.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "started": self._started, "shared": self._shared}
@@ -0,0 +1,490 @@
+"""
+Miniaturki plików lokalizacji – trwały cache na dysku kluczowany treścią.
+
+Plik miniaturki: `<lokalizacja>/.thumbcache/<sha256 źródła>-<size>.<format>`. Klucz to
+skrót treści z manifestu, więc plik wgrany ponownie pod tą samą nazwą dostaje nową
+miniaturkę, `cube.png` i `cube.mp4` się nie zderzają, a każdy rozmiar ma własny plik.
+
+Cache ma budżet bajtów (THUMBNAIL_CACHE_BYTES) z usuwaniem najdawniej używanych (LRU);
+miniaturki treści, której nie ma już w lokalizacji, są usuwane razem z plikiem.
+
+Obrazy są tanie, więc żądanie generuje je od razu – ale w puli wątków obrazów
+(utils/imaging.py), nie w pętli zdarzeń. Wideo (ffmpeg) zawsze idzie przez kolejkę zadań,
+a sam ffmpeg przez wspólny limit procesów (utils/ffmpeg.py). Równoczesne żądania tej
+samej miniaturki są łączone w jedno (`thumbnail_flights`).
+
+Miniaturki standardowych rozmiarów są zlecane z góry – po uploadzie i przypisaniu pliku
+urządzeniu (`warm_thumbnails`) – a całą lokalizację rozgrzewa zadanie `warm_thumbnails`.
+"""
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import re
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+from bson import ObjectId
+
+from config import settings
+from utils import jobs
+from utils.blobs import location_dir
+from utils.ffmpeg import ffmpeg
+from utils.imaging import image_pool
+from utils.manifest import MEDIA, entry_response
+from utils.previews import queue_missing_previews
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_JOB = "thumbnail"
+WARM_JOB = "warm_thumbnails"
+THUMBCACHE_DIR = ".thumbcache"
+# Stary układ (`.thumbnails/<nazwa bez rozszerzenia>.png`) – tylko do sprzątania
+LEGACY_THUMBNAILS_DIR = ".thumbnails"
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi", ".mkv"}
+
+# format -> (format Pillow, typ MIME)
+FORMATS = {"png": ("PNG", "image/png"), "webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+# Jak długo żądanie miniaturki wideo czeka na zadanie w puli – potem od razu 202 z job_id
+# (klient odpytuje GET /api/jobs/{id}); krótko, żeby ffmpeg nie trzymał żądania i połączenia
+THUMBNAIL_WAIT_SECONDS = 1
+
+# Rozmiary (bok, format) generowane z góry – te, o które prosi FE (galeria, siatka urządzeń, arkusze)
+WARM_SIZES = ((128, "png"),)
+# Jak często zadanie rozgrzewania lokalizacji zapisuje postęp
+WARM_PROGRESS_SECONDS = 1.0
+
+# Arkusz miniaturek (galeria): najwięcej plików w jednym żądaniu, kafelków w rzędzie
+SPRITE_MAX_FILES = 200
+SPRITE_COLUMNS = 10
+SPRITE_MAX_TILE = 256
+# Limit powierzchni arkusza (kafelki × bok²) – arkusz RGBA to 4 B/px w pamięci wątku obrazów
+SPRITE_MAX_PIXELS = 4 * 1024 * 1024
+SPRITE_NAME_RE = re.compile(r"^sprite-[0-9a-f]{64}-\d+\.(?:png|webp|jpeg)$")
+
+# Klatka miniaturki wideo (sekunda); krótsze filmy (czas z manifestu) – środek filmu
+VIDEO_FRAME_SECOND = 5
+
+
+def media_kind(filename: str):
+    extension = Path(filename).suffix.lower()
+    if extension in IMAGE_EXTENSIONS:
+        return "image"
+    if extension in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+def cache_path(location_id: str, sha256: str, size: int, fmt: str = "png") -> Path:
+    return location_dir(location_id) / THUMBCACHE_DIR / f"{sha256}-{size}.{fmt}"
+
+
+class ThumbnailCache:
+    """
+    Indeks LRU plików `.thumbcache` tego procesu: ścieżka -> rozmiar w bajtach.
+    Przy starcie wczytywany z dysku (kolejność wg mtime), potem aktualizowany przy
+    trafieniach i zapisach; po przekroczeniu budżetu wskazuje najdawniej używane pliki.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def load(self, root: Path) -> List[Path]:
+        """
+        Wczytuje istniejące miniaturki (blokujące – wywoływać przez asyncio.to_thread).
+        Zwraca pliki ponad budżet do usunięcia.
+        """
+        found = []
+        for path in root.glob(f"*/{THUMBCACHE_DIR}/*"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            found.append((stat.st_mtime, str(path), stat.st_size))
+        for _, key, size in sorted(found):
+            self._put(key, size)
+        return self._trim()
+
+    def hit(self, path: Path) -> bool:
+        """Czy miniaturka jest w cache (i oznacz ją jako użytą)."""
+        key = str(path)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return True
+        try:
+            # Zapisana przez inny proces albo przed wczytaniem indeksu
+            size = path.stat().st_size
+        except OSError:
+            self._misses += 1
+            return False
+        self._put(key, size)
+        self._hits += 1
+        return True
+
+    def _put(self, key: str, size: int):
+        self._bytes += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+
+    def _trim(self) -> List[Path]:
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._evictions += 1
+            evicted.append(Path(key))
+        return evicted
+
+    def add(self, path: Path) -> List[Path]:
+        """Rejestruje nowy plik; zwraca pliki do usunięcia (przekroczony budżet)."""
+        self._put(str(path), path.stat().st_size)
+        return self._trim()
+
+    def forget(self, path: Path):
+        size = self._entries.pop(str(path), None)
+        if size is not None:
+            self._bytes -= size
+
+    def stats(self) -> dict:
+        total = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hit_ratio": round(self._hits / total, 3) if total else None
+        }
+
+
+thumbnail_cache = ThumbnailCache(settings.THUMBNAIL_CACHE_BYTES)
+# Miniaturki w trakcie generowania (klucz: ścieżka w cache) – wspólne dla równoczesnych żądań
+thumbnail_flights = SingleFlight()
+
+
+def _unlink_all(paths):
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
+
+
+async def _store(path: Path):
+    evicted = thumbnail_cache.add(path)
+    if evicted:
+        await asyncio.to_thread(_unlink_all, evicted)
+
+
+def _image_thumbnail(src: Path, out: Path, size: int, fmt: str):
+    from PIL import Image
+    pil_format, _ = FORMATS[fmt]
+    tmp = out.with_name(f".{out.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with Image.open(src) as img:
+        img.thumbnail((size, size))
+        if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(tmp, format=pil_format)
+    os.replace(tmp, out)
+
+
+async def image_thumbnail(location_id: str, filename: str, sha256: str, size: int, fmt: str = "png") -> Path:
+    """Miniaturka obrazu (z cache albo wygenerowana w puli wątków obrazów)."""
+    out = cache_path(location_id, sha256, size, fmt)
+    if thumbnail_cache.hit(out):
+        return out
+
+    async def render():
+        await asyncio.to_thread(out.parent.mkdir, parents=True, exist_ok=True)
+        await image_pool.run(_image_thumbnail, location_dir(location_id) / filename, out, size, fmt)
+        await _store(out)
+        return out
+
+    # Równoczesne żądania tej samej miniaturki – jedno renderowanie
+    return await thumbnail_flights.do(out, render)
+
+
+def frame_second(duration: Optional[float]) -> float:
+    if duration is None or duration > VIDEO_FRAME_SECOND:
+        return VIDEO_FRAME_SECOND
+    return round(duration / 2, 3)
+
+
+async def _video_thumbnail(src: Path, out: Path, size: int, duration: Optional[float] = None):
+    tmp = out.with_name(f".{out.stem}.{uuid.uuid4().hex[:8]}.tmp{out.suffix}")
+    errors = ""
+    for second in dict.fromkeys((frame_second(duration), 0)):
+        returncode, _, stderr = await ffmpeg.run([
+            "ffmpeg", "-ss", str(second), "-i", str(src), "-vframes", "1",
+            "-vf", f"scale={size}:{size}:force_original_aspect_ratio=decrease", "-f", "image2", "-y", str(tmp)
+        ])
+        if returncode == 0 and tmp.exists():
+            os.replace(tmp, out)
+            return
+        errors = stderr.decode(errors="replace")
+    tmp.unlink(missing_ok=True)
+    raise RuntimeError(f"Could not generate video thumbnail: {errors[-1000:]}")
+
+
+async def render_cached(db, location_id: str, filename: str, sha256: str, size: int, fmt: str = "png") -> Path:
+    """Generuje miniaturkę do cache, jeśli jej tam jeszcze nie ma (bez kolejki)."""
+    out = cache_path(location_id, sha256, size, fmt)
+    if media_kind(filename) == "image":
+        await image_thumbnail(location_id, filename, sha256, size, fmt)
+    elif not out.exists():
+        await asyncio.to_thread(out.parent.mkdir, parents=True, exist_ok=True)
+        entry = await db[MEDIA].find_one(
+            {"location_id": ObjectId(location_id), "filename": filename}, {"duration": 1}
+        )
+        await _video_thumbnail(location_dir(location_id) / filename, out, size, (entry or {}).get("duration"))
+        await _store(out)
+    return out
+
+
+@jobs.handler(THUMBNAIL_JOB)
+async def render_thumbnail(db, params: dict, job: dict) -> dict:
+    out = await render_cached(
+        db, params["location_id"], params["filename"], params["sha256"], params["size"], params.get("format", "png")
+    )
+    return {"path": f"{params['location_id']}/{THUMBCACHE_DIR}/{out.name}"}
+
+
+async def request_thumbnail(
+    db, location_id: str, filename: str, sha256: str, size: int, fmt: str = "png",
+    priority: int = jobs.PRIORITY_INTERACTIVE
+) -> dict:
+    """Zleca miniaturkę w kolejce (domyślnie z priorytetem interaktywnym)."""
+    return await jobs.enqueue(
+        db,
+        THUMBNAIL_JOB,
+        {"location_id": location_id, "filename": filename, "sha256": sha256, "size": size, "format": fmt},
+        priority=priority,
+        key=f"{THUMBNAIL_JOB}:{location_id}:{sha256}:{size}:{fmt}"
+    )
+
+
+async def warm_thumbnails(
+    db, location_id: str, filename: str, sha256: Optional[str] = None, priority: int = jobs.PRIORITY_BULK
+) -> List[dict]:
+    """
+    Zleca miniaturki pliku w standardowych rozmiarach (WARM_SIZES), żeby pierwsze
+    otwarcie galerii/siatki urządzeń nie czekało na ffmpeg. Nie czeka na wynik.
+    """
+    if media_kind(filename) is None:
+        return []
+    if sha256 is None:
+        entry = await db[MEDIA].find_one(
+            {"location_id": ObjectId(location_id), "filename": filename}, {"sha256": 1}
+        )
+        if not entry:
+            return []
+        sha256 = entry["sha256"]
+    return [
+        await request_thumbnail(db, location_id, filename, sha256, size, fmt, priority=priority)
+        for size, fmt in WARM_SIZES
+        if not cache_path(location_id, sha256, size, fmt).exists()
+    ]
+
+
+@jobs.handler(WARM_JOB)
+async def warm_location(db, params: dict, job: dict) -> dict:
+    """
+    Generuje brakujące miniaturki standardowych rozmiarów wszystkich plików lokalizacji,
+    po kolei (jeden worker), z postępem w zadaniu (`progress`), i zleca brakujące podglądy
+    wideo. Ponowione po przerwaniu pomija to, co już jest w cache.
+    """
+    location_id = params["location_id"]
+    entries = await db[MEDIA].find(
+        {"location_id": ObjectId(location_id)}, {"filename": 1, "sha256": 1, "mime": 1, "variants": 1}
+    ).to_list(None)
+    # Przy okazji: animowane podglądy wideo, których jeszcze nie ma (pliki sprzed ich wprowadzenia)
+    previews_queued = await queue_missing_previews(db, location_id, [entry_response(entry) for entry in entries])
+    entries = [entry for entry in entries if media_kind(entry["filename"])]
+
+    progress = {
+        "total": len(entries) * len(WARM_SIZES), "done": 0, "generated": 0, "failed": 0,
+        "previews_queued": previews_queued
+    }
+    await jobs.report_progress(db, job, progress)
+    reported = asyncio.get_running_loop().time()
+    for entry in entries:
+        for size, fmt in WARM_SIZES:
+            cached = cache_path(location_id, entry["sha256"], size, fmt).exists()
+            try:
+                if not cached:
+                    await render_cached(db, location_id, entry["filename"], entry["sha256"], size, fmt)
+                    progress["generated"] += 1
+            except Exception as e:
+                progress["failed"] += 1
+                logger.warning(f"Could not warm thumbnail of {location_id}/{entry['filename']}: {e}")
+            progress["done"] += 1
+        if asyncio.get_running_loop().time() - reported >= WARM_PROGRESS_SECONDS:
+            await jobs.report_progress(db, job, progress)
+            reported = asyncio.get_running_loop().time()
+    await jobs.report_progress(db, job, progress)
+    return progress
+
+
+async def request_warm_location(db, location_id: str) -> dict:
+    """Zleca rozgrzanie cache miniaturek całej lokalizacji (jedno zadanie na lokalizację)."""
+    return await jobs.enqueue(
+        db, WARM_JOB, {"location_id": location_id}, priority=jobs.PRIORITY_BULK, key=f"{WARM_JOB}:{location_id}"
+    )
+
+
+async def get_thumbnail(
+    db, location_id: str, filename: str, sha256: str, size: int, fmt: str = "png",
+    timeout: float = THUMBNAIL_WAIT_SECONDS
+):
+    """
+    Miniaturka z cache albo wygenerowana: obraz – od razu, w puli wątków obrazów; wideo –
+    zadanie w kolejce (priorytet interaktywny), na które czekamy najwyżej `timeout` s.
+    Zwraca ścieżkę pliku albo stan zadania (dict), które nie skończyło się powodzeniem.
+    """
+    if media_kind(filename) == "image":
+        return await image_thumbnail(location_id, filename, sha256, size, fmt)
+
+    path = cache_path(location_id, sha256, size, fmt)
+    if thumbnail_cache.hit(path):
+        return path
+
+    async def wait_for_thumbnail():
+        job = await request_thumbnail(db, location_id, filename, sha256, size, fmt)
+        finished = await jobs.wait_for(db, job["_id"], timeout)
+        if finished is None:
+            # Zadanie zniknęło (anulowane przez DELETE /api/jobs/{id}) – zleć je ponownie
+            job = await request_thumbnail(db, location_id, filename, sha256, size, fmt)
+            finished = await jobs.wait_for(db, job["_id"], timeout)
+        # Nadal brak dokumentu – zwróć ostatnie zlecone zadanie (wołający odpowie 202)
+        return finished or job
+
+    # Równoczesne żądania tej samej miniaturki czekają na jedno zadanie (jedno odpytywanie bazy)
+    job = await thumbnail_flights.do(path, wait_for_thumbnail)
+    if job["status"] != "done" or not path.exists():
+        return job
+    return path
+
+
+def sprite_path(location_id: str, tiles: List[Optional[str]], size: int, fmt: str) -> Path:
+    """Arkusz jest kluczowany listą treści kafelków (None – pusty kafelek), nie nazwami."""
+    key = hashlib.sha256("\n".join(sha or "-" for sha in tiles).encode()).hexdigest()
+    return location_dir(location_id) / THUMBCACHE_DIR / f"sprite-{key}-{size}.{fmt}"
+
+
+def sprite_file(location_id: str, name: str) -> Optional[Path]:
+    """Plik arkusza po nazwie z adresu (None, gdy nazwa nie jest nazwą arkusza)."""
+    if not SPRITE_NAME_RE.match(name):
+        return None
+    return location_dir(location_id) / THUMBCACHE_DIR / name
+
+
+def sprite_map(filenames: List[str], size: int, columns: int) -> dict:
+    """Położenie kafelka pliku w arkuszu: lewy górny róg komórki `size`×`size`."""
+    return {
+        "size": size,
+        "columns": columns,
+        "tiles": {
+            filename: {"x": index % columns * size, "y": index // columns * size}
+            for index, filename in enumerate(filenames)
+        }
+    }
+
+
+def _compose_sprite(tiles: List[Optional[Path]], size: int, columns: int, out: Path, fmt: str):
+    from PIL import Image
+    pil_format, _ = FORMATS[fmt]
+    rows = max((len(tiles) + columns - 1) // columns, 1)
+    sheet = Image.new("RGBA", (columns * size, rows * size), (0, 0, 0, 0))
+    for index, tile in enumerate(tiles):
+        if tile is None:
+            continue
+        with Image.open(tile) as img:
+            img = img.convert("RGBA")
+            # Miniaturka mieści się w kwadracie – wyśrodkowana w komórce
+            x = index % columns * size + (size - img.width) // 2
+            y = index // columns * size + (size - img.height) // 2
+            sheet.paste(img, (x, y), img)
+    if pil_format == "JPEG":
+        sheet = sheet.convert("RGB")
+    tmp = out.with_name(f".{out.name}.{uuid.uuid4().hex[:8]}.tmp")
+    sheet.save(tmp, format=pil_format)
+    os.replace(tmp, out)
+
+
+async def thumbnail_sprite(db, location_id: str, entries: List[dict], size: int, fmt: str = "webp"):
+    """
+    Arkusz miniaturek (sprite) plików `entries` (wpisy manifestu, w kolejności kafelków).
+    Kafelki to zwykłe miniaturki z cache (png); brakujące klatki wideo są zlecane razem
+    i czekamy na nie łącznie najwyżej THUMBNAIL_WAIT_SECONDS. Zwraca (ścieżka arkusza,
+    mapa kafelków). Pliki, których miniaturka jeszcze się generuje (`pending`) albo się nie
+    udała (`failed`), mają pusty kafelek – klucz arkusza jest wtedy inny niż pełnego.
+    """
+    results = await asyncio.gather(*(
+        get_thumbnail(db, location_id, entry["filename"], entry["sha256"], size)
+        for entry in entries
+    ), return_exceptions=True)
+
+    tiles, pending, failed = [], [], []
+    for entry, result in zip(entries, results):
+        if isinstance(result, Path):
+            tiles.append(result)
+            continue
+        tiles.append(None)
+        if isinstance(result, dict) and result["status"] not in ("done", "failed"):
+            pending.append(entry["filename"])
+        else:
+            failed.append(entry["filename"])
+
+    columns = min(len(entries), SPRITE_COLUMNS) or 1
+    mapping = sprite_map([entry["filename"] for entry in entries], size, columns)
+    mapping.update({"pending": pending, "failed": failed})
+
+    out = sprite_path(location_id, [
+        entry["sha256"] if tile else None for entry, tile in zip(entries, tiles)
+    ], size, fmt)
+    if not thumbnail_cache.hit(out):
+        async def render():
+            await image_pool.run(_compose_sprite, tiles, size, columns, out, fmt)
+            await _store(out)
+            return out
+        await thumbnail_flights.do(out, render)
+    return out, mapping
+
+
+async def discard_thumbnails(db, location_id: str, sha256: Optional[str], filename: Optional[str] = None):
+    """
+    Usuwa miniaturki treści `sha256`, jeśli żaden plik lokalizacji jej już nie ma
+    (oraz miniaturkę starego układu dla `filename`).
+    """
+    directory = location_dir(location_id)
+    paths = []
+    if filename:
+        paths.append(directory / LEGACY_THUMBNAILS_DIR / f"{Path(filename).stem}.png")
+    if sha256 and not await db[MEDIA].count_documents(
+        {"location_id": ObjectId(location_id), "sha256": sha256}, limit=1
+    ):
+        pattern = f"{glob.escape(sha256)}-*"
+        paths.extend(await asyncio.to_thread(lambda: list((directory / THUMBCACHE_DIR).glob(pattern))))
+    for path in paths:
+        thumbnail_cache.forget(path)
+    await asyncio.to_thread(_unlink_all, paths)
+
+
+async def load_thumbnail_cache() -> int:
+    """Wczytuje indeks cache z dysku przy starcie (i przycina go do budżetu)."""
+    evicted = await asyncio.to_thread(thumbnail_cache.load, Path(settings.UPLOAD_DIR))
+    if evicted:
+        await asyncio.to_thread(_unlink_all, evicted)
+    return thumbnail_cache.stats()["entries"]
@@ -0,0 +1,218 @@
+"""
+Wersja "device" mediów – plik gotowy do wysłania na cenówkę, kodowany raz na treść.
+
+Profil jest ten sam, co w pricetag-cl/3_modify_file_for_upload.py: MP4 720x1280 (pion),
+24 fps CFR, H.264 High@4.1 yuv420p, AAC 128k/44100 (cisza, gdy źródło nie ma dźwięku),
+faststart. Obraz staje się 1-sekundowym MP4 – tak jak na brzegu.
+
+Wynik leży obok oryginału: `<lokalizacja>/.variants/device/<sha256 źródła>.mp4`, więc ten
+sam plik wysłany na 100 cenówek (albo wgrany pod kilkoma nazwami) to jedno kodowanie.
+Stan wersji jest zapisywany w manifeście (`media.variants.device`), a samo kodowanie to
+zadanie `transcode_device` w kolejce (utils/jobs.py) z priorytetem tła.
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from bson import ObjectId
+
+from utils import jobs
+from utils.blobs import location_dir
+from utils.ffmpeg import ffmpeg
+from utils.imaging import image_pool
+from utils.manifest import MEDIA, is_current_content, set_variant_state
+from utils.uploads import file_digests
+
+logger = logging.getLogger(__name__)
+
+DEVICE_VARIANT = "device"
+TRANSCODE_JOB = "transcode_device"
+
+# ------------------ PROFIL CENÓWEK ------------------
+TARGET_W, TARGET_H = 720, 1280
+FPS = 24
+GOP = FPS * 2
+VIDEO_BR = "1200k"
+MAXRATE = "1200k"
+BUFSIZE = "2400k"
+AUDIO_BR = "128k"
+AUDIO_SR = "44100"
+PIX_FMT = "yuv420p"
+PROFILE = "high"
+LEVEL = "4.1"
+IMG_DURATION = 1
+
+_VIDEO_FILTER = (
+    f"scale={TARGET_W}:{TARGET_H}:force_original_aspect_ratio=decrease,"
+    f"pad={TARGET_W}:{TARGET_H}:(ow-iw)/2:(oh-ih)/2,"
+    f"setsar=1:1,setdar=9/16"
+)
+
+_ENCODE_ARGS = [
+    "-filter:v", _VIDEO_FILTER,
+    "-r", str(FPS), "-vsync", "cfr",
+    "-c:v", "libx264",
+    "-pix_fmt", PIX_FMT,
+    "-profile:v", PROFILE, "-level", LEVEL,
+    "-b:v", VIDEO_BR, "-maxrate", MAXRATE, "-bufsize", BUFSIZE,
+    "-g", str(GOP), "-keyint_min", str(GOP), "-sc_threshold", "0",
+]
+
+_OUTPUT_ARGS = [
+    "-c:a", "aac", "-b:a", AUDIO_BR, "-ar", AUDIO_SR,
+    "-sn", "-dn",
+    "-movflags", "+faststart",
+    "-video_track_timescale", "1000",
+    "-metadata:s:v:0", "rotate=0",
+]
+
+_SILENCE = f"anullsrc=channel_layout=stereo:sample_rate={AUDIO_SR}"
+
+def variant_path(location_id: str, sha256: str) -> Path:
+    return location_dir(location_id) / ".variants" / DEVICE_VARIANT / f"{sha256}.mp4"
+
+
+async def _run(cmd: list) -> bytes:
+    returncode, stdout, stderr = await ffmpeg.run(cmd)
+    if returncode != 0:
+        raise RuntimeError(stderr.decode(errors="replace")[-2000:])
+    return stdout
+
+
+async def _has_audio(path: Path) -> bool:
+    out = await _run([
+        "ffprobe", "-v", "error", "-select_streams", "a",
+        "-show_entries", "stream=index", "-of", "csv=p=0", str(path)
+    ])
+    return bool(out.strip())
+
+
+def _prepare_image(src: Path, out: Path):
+    # Jak na brzegu: Pillow zdejmuje profile kolorów i ustawia dokładny rozmiar
+    from PIL import Image
+    with Image.open(src) as img:
+        img.convert("RGB").resize((TARGET_W, TARGET_H), Image.LANCZOS).save(out, format="PNG")
+
+
+async def transcode_to_device(src: Path, mime: str, out: Path, has_audio: Optional[bool] = None):
+    """
+    Koduje `src` do profilu cenówek; wynik pojawia się pod `out` atomowo.
+    `has_audio` z manifestu oszczędza wywołanie ffprobe (None -> sprawdź).
+    """
+    await asyncio.to_thread(out.parent.mkdir, parents=True, exist_ok=True)
+    tmp_out = out.parent / f".{out.stem}.tmp.mp4"
+    tmp_png = out.parent / f".{out.stem}.tmp.png"
+    try:
+        if mime.startswith("image/"):
+            await image_pool.run(_prepare_image, src, tmp_png)
+            inputs = [
+                "-loop", "1", "-t", str(IMG_DURATION), "-i", str(tmp_png),
+                "-f", "lavfi", "-t", str(IMG_DURATION), "-i", _SILENCE,
+            ]
+            mapping = ["-map", "0:v:0", "-map", "1:a:0"]
+        elif has_audio if has_audio is not None else await _has_audio(src):
+            inputs = ["-i", str(src)]
+            mapping = ["-map", "0:v:0", "-map", "0:a:0"]
+        else:
+            inputs = ["-i", str(src), "-f", "lavfi", "-t", "9999", "-i", _SILENCE]
+            mapping = ["-map", "0:v:0", "-map", "1:a:0", "-shortest"]
+
+        await _run(["ffmpeg", "-y", *inputs, *_ENCODE_ARGS, *mapping, *_OUTPUT_ARGS, str(tmp_out)])
+        await asyncio.to_thread(os.replace, tmp_out, out)
+    finally:
+        for leftover in (tmp_out, tmp_png):
+            await asyncio.to_thread(leftover.unlink, missing_ok=True)
+
+
+async def _set_state(db, location_id: str, sha256: str, state: dict):
+    await set_variant_state(db, location_id, sha256, DEVICE_VARIANT, state)
+
+
+@jobs.handler(TRANSCODE_JOB)
+async def render_device_variant(db, params: dict, job: dict) -> dict:
+    location_id, filename, sha256 = params["location_id"], params["filename"], params["sha256"]
+    out = variant_path(location_id, sha256)
+    if not out.exists() and not await is_current_content(db, location_id, filename, sha256):
+        # Plik nadpisano/usunięto po zleceniu – nie kodujemy treści, której już nie ma
+        # (zadanie dla nowej treści zlecił zapis pliku)
+        return {"status": "skipped"}
+    try:
+        if not out.exists():
+            started = asyncio.get_running_loop().time()
+            await transcode_to_device(
+                location_dir(location_id) / filename, params["mime"], out, params.get("has_audio")
+            )
+            logger.info(
+                f"Device variant of {location_id}/{filename} ready in "
+                f"{asyncio.get_running_loop().time() - started:.1f}s"
+            )
+        digests = await asyncio.to_thread(file_digests, out)
+    except Exception as e:
+        # Ostatnia próba – zapamiętaj porażkę, żeby nie kodować w kółko
+        if job["attempts"] >= job["max_attempts"]:
+            await _set_state(db, location_id, sha256, {"status": "failed", "error": str(e)[-500:]})
+        raise
+
+    state = {"status": "ready", "size": out.stat().st_size, "md5": digests["md5"].upper()}
+    await _set_state(db, location_id, sha256, state)
+    return state
+
+
+async def request_device_variant(db, location_id: str, filename: str) -> dict:
+    """
+    Stan wersji "device" pliku; brakującą zleca do zakodowania w tle (raz na treść).
+    Zwraca {"status": "ready", "path", "md5"} | {"status": "processing"} |
+    {"status": "failed", "error"} | {"status": "unsupported"}; None, gdy pliku nie ma w manifeście.
+    """
+    entry = await db[MEDIA].find_one(
+        {"location_id": ObjectId(location_id), "filename": filename},
+        {"sha256": 1, "mime": 1, "has_audio": 1, "variants": 1}
+    )
+    if not entry:
+        return None
+    mime = entry.get("mime") or ""
+    if not mime.startswith(("image/", "video/")):
+        return {"status": "unsupported"}
+
+    sha256 = entry["sha256"]
+    state = (entry.get("variants") or {}).get(DEVICE_VARIANT) or {}
+    if state.get("sha256") == sha256:
+        path = variant_path(location_id, sha256)
+        if state.get("status") == "ready" and path.exists():
+            return {"status": "ready", "path": path, "md5": state.get("md5")}
+        if state.get("status") == "failed":
+            return {"status": "failed", "error": state.get("error")}
+
+    job = await jobs.enqueue(
+        db,
+        TRANSCODE_JOB,
+        {
+            "location_id": location_id, "filename": filename, "sha256": sha256, "mime": mime,
+            "has_audio": entry.get("has_audio")
+        },
+        priority=jobs.PRIORITY_BULK,
+        key=f"{TRANSCODE_JOB}:{location_id}:{sha256}"
+    )
+    return {"status": "processing", "job_id": str(job["_id"])}
+
+
+async def refresh_device_variant(db, location_id: str, filename: str, previous_sha256: Optional[str] = None):
+    """
+    Po zapisie pliku: zleca kodowanie nowej treści i sprząta wersję poprzedniej treści
+    (plik nadpisany pod tą samą nazwą), jeśli nic już z niej nie korzysta.
+    """
+    state = await request_device_variant(db, location_id, filename)
+    if previous_sha256 and state is not None:
+        await discard_device_variant(db, location_id, previous_sha256)
+    return state
+
+
+async def discard_device_variant(db, location_id: str, sha256: Optional[str]):
+    """Usuwa wersję "device", jeśli żaden plik lokalizacji nie ma już tej treści."""
+    if not sha256:
+        return
+    if await db[MEDIA].count_documents({"location_id": ObjectId(location_id), "sha256": sha256}, limit=1):
+        return
+    await asyncio.to_thread(variant_path(location_id, sha256).unlink, missing_ok=True)
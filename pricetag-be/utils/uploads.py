@@ -0,0 +1,203 @@
+"""
+Strumieniowy zapis wgrywanych plików bez blokowania pętli zdarzeń.
+
+Za duże uploady odrzuca UploadSizeLimitMiddleware (main.py) – po Content-Length albo
+w trakcie odbioru, zanim Starlette zbuforuje cały formularz.
+
+Plik jest czytany z UploadFile porcjami (UPLOAD_CHUNK_SIZE), zapisywany do pliku
+tymczasowego w katalogu docelowym w wątku roboczym i dopiero na końcu atomowo
+przemianowywany (os.replace) – częściowy plik nigdy nie jest widoczny pod docelową
+nazwą. SHA-256 i MD5 liczone są w tym samym przebiegu.
+
+Duże pliki można też wgrywać we wznawialnych sesjach (api/uploads.py): porcje trafiają
+do `<lokalizacja>/.uploads/<upload_id>.part`, postęp (offset) jest w kolekcji
+`upload_sessions`, a porzucone sesje sprząta cleanup_upload_sessions.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+
+from config import settings
+from utils.blobs import location_dir
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Sama nazwa pliku (bez katalogów z nazwy podanej przez klienta)."""
+    name = Path(filename or "").name
+    if name in ("", ".", ".."):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid filename")
+    return name
+
+
+# Zapas na nagłówki części multipart ponad MAX_UPLOAD_SIZE samego pliku
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Limit rozmiaru body uploadów multipart (`paths` – końcówki ścieżek POST), zanim
+    Starlette zbuforuje cały formularz na dysk: za duży `Content-Length` -> od razu 413,
+    a body bez długości (chunked) jest liczone w locie i przerywane po przekroczeniu.
+    """
+
+    def __init__(self, app, paths: tuple, max_body: Optional[int] = None):
+        self.app = app
+        self.paths = paths
+        self.max_body = max_body if max_body is not None else settings.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].endswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_body:
+            await self._reject(send)
+            return
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    # HTTPException przechodzi przez parsowanie formularza FastAPI bez zamiany na 400
+                    raise self._too_large()
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except HTTPException as e:
+            # Odczyt body poza obsługą wyjątków aplikacji (np. w middleware) – odpowiedz tutaj
+            if e.status_code != status.HTTP_413_REQUEST_ENTITY_TOO_LARGE or started:
+                raise
+            await self._reject(send)
+
+    @staticmethod
+    def _too_large() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {settings.MAX_UPLOAD_SIZE} byte upload limit"
+        )
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": self._too_large().detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _discard(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def stream_to_temp(upload: UploadFile, directory: Path, max_size: Optional[int] = None) -> dict:
+    """
+    Zapisuje upload do pliku tymczasowego w `directory`.
+    Zwraca {"tmp_path", "size", "sha256", "md5"}; przekroczenie limitu -> 413.
+    """
+    max_size = settings.MAX_UPLOAD_SIZE if max_size is None else max_size
+    chunk_size = settings.UPLOAD_CHUNK_SIZE
+
+    await asyncio.to_thread(directory.mkdir, parents=True, exist_ok=True)
+    fd, tmp_path = await asyncio.to_thread(tempfile.mkstemp, dir=directory, prefix=".upload-")
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds the {max_size} byte upload limit"
+                    )
+                sha256.update(chunk)
+                md5.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(_discard, tmp_path)
+        raise
+
+    return {"tmp_path": tmp_path, "size": size, "sha256": sha256.hexdigest(), "md5": md5.hexdigest()}
+
+
+async def commit_temp(tmp_path: str, target: Path):
+    """Atomowo przenosi plik tymczasowy pod docelową nazwę (nadpisuje istniejący)."""
+    await asyncio.to_thread(os.replace, tmp_path, target)
+
+
+async def discard_temp(tmp_path: str):
+    await asyncio.to_thread(_discard, tmp_path)
+
+
+# ===== Sesje wznawialnego uploadu (api/uploads.py) =====
+
+UPLOAD_SESSIONS = "upload_sessions"
+
+# Podkatalog lokalizacji na częściowe pliki sesji (nie pojawia się na liście plików)
+SESSIONS_DIR = ".uploads"
+
+
+def session_part_path(location_dir: Path, upload_id: str) -> Path:
+    return location_dir / SESSIONS_DIR / f"{upload_id}.part"
+
+
+def open_part_at(part_path: Path, offset: int):
+    """
+    Otwiera częściowy plik sesji do dopisywania od pozycji `offset`. Plik jest przycinany
+    do `offset`, więc przerwany wcześniej zapis porcji nie zostawia śmieci.
+    """
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    f = open(part_path, "ab")
+    f.truncate(offset)
+    return f
+
+
+def file_digests(path: Path) -> dict:
+    """SHA-256 i MD5 pliku czytanego porcjami (bez ładowania całości do pamięci)."""
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+            md5.update(chunk)
+    return {"sha256": sha256.hexdigest(), "md5": md5.hexdigest()}
+
+
+async def cleanup_upload_sessions(db) -> int:
+    """Usuwa porzucone sesje (bez zapisu dłużej niż UPLOAD_SESSION_TTL_SECONDS) i ich pliki."""
+    expired_before = datetime.utcnow() - timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS)
+    removed = 0
+    async for session in db[UPLOAD_SESSIONS].find({"updated_at": {"$lt": expired_before}}):
+        part_path = session_part_path(location_dir(str(session["location_id"])), str(session["_id"]))
+        # Warunek na updated_at – sesja wznowiona w międzyczasie zostaje
+        result = await db[UPLOAD_SESSIONS].delete_one({"_id": session["_id"], "updated_at": session["updated_at"]})
+        if result.deleted_count:
+            await asyncio.to_thread(_discard, str(part_path))
+            removed += 1
+    return removed
@@ -256,9 +256,12 @@ BASE_IP = "192.168.68."
 
 # === API HELPERS ===
 
+# Skaner potrzebuje tylko tych pól – backend nie czyta/serializuje reszty dokumentu
+DEVICE_FIELDS = "_id,clientId,ip,changed,photo,video"
+
 def get_devices_from_database():
     try:
-        response = requests.get(f"{API_BASE}/{LOCATION_ID}/devices", timeout=10)
+        response = requests.get(f"{API_BASE}/{LOCATION_ID}/devices", params={"fields": DEVICE_FIELDS}, timeout=10)
         if response.status_code == 200:
             return response.json()
         else:
@@ -335,6 +338,23 @@ def update_device_ip_in_db(device_id: str, new_ip: str) -> bool:
         print(f"❌ Błąd PUT (update IP) dla {device_id}: {e}")
         return False
 
+def bulk_update_devices(items: list) -> bool:
+    """Wysyła stan wielu urządzeń jednym PATCH /devices/bulk (zamiast PUT per urządzenie)."""
+    url = f"{API_BASE}/{LOCATION_ID}/devices/bulk"
+    try:
+        resp = requests.patch(url, json=items, headers={"Content-Type": "application/json"}, timeout=30)
+        if resp.status_code != 200:
+            print(f"❌ Zbiorczy PATCH nieudany. Status: {resp.status_code} | Body: {resp.text}")
+            return False
+        for result in resp.json().get("results", []):
+            if result.get("status") != "updated":
+                print(f"❌ {result.get('clientId') or result.get('device_id')}: {result.get('status')} | {result.get('detail')}")
+        print(f"📦 Zbiorczo zaktualizowano {resp.json().get('updated', 0)}/{len(items)} urządzeń")
+        return True
+    except requests.RequestException as e:
+        print(f"❌ Błąd PATCH (bulk): {e}")
+        return False
+
 # === Skan sieci ===
 
 def check_device(args):
@@ -382,6 +402,11 @@ def _maybe_decode_b64(s: str) -> bytes | None:
     except (B64Error, ValueError):
         return None
 
+def _is_blob_filename(s: str) -> bool:
+    # Nowe rekordy trzymają nazwę pliku z galerii – dostarcza je 2_download_devices_files.py
+    return bool(re.match(r'^[\w .()-]+\.[A-Za-z0-9]{2,5}$', s.strip()))
+
+
 def save_device_media(device):
     device_id = device.get("_id")
     client_id = device.get("clientId") or "unknown"
@@ -395,6 +420,11 @@ def save_device_media(device):
         photo = device.get("photo") or ""
         video = device.get("video") or ""
 
+        # Tylko stare rekordy z base64 – przypisanie po nazwie pliku zostaje nietknięte
+        # (nie kasujemy go ani nie zdejmujemy flagi 'changed' przed krokiem pobierania)
+        if _is_blob_filename(photo) or _is_blob_filename(video):
+            return
+
         photo_bytes = _maybe_decode_b64(photo)
         if photo_bytes:
             with open(f"{client_id}.png", "wb") as f:
@@ -458,22 +488,33 @@ def main():
                 # nic więcej — backend ustawi isOnline=True
                 pass
 
-    # 4) Ustaw ONLINE dla wszystkich, które odpowiedziały + ewentualnie podmień IP
+    # 4) ONLINE (+ ewentualnie nowe IP) dla tych, które odpowiedziały,
+    # 5) OFFLINE dla tych, których nie było w skanie — wszystko jednym zbiorczym PATCH
+    bulk_items = []
     for device in scanned_devices:
         client_id = device["clientid"]
         new_ip = device["ip"]
         if client_id in db_clientid_to_id:
-            device_id = db_clientid_to_id[client_id]
+            fields = {"isOnline": True}
             # jeśli IP w bazie różni się od zeskanowanego — zaktualizuj
             if db_clientid_to_ip.get(client_id, "") != new_ip:
-                update_device_ip_in_db(device_id, new_ip)
-            # to urządzenie jest dostępne — ustaw online
-            set_device_online(device_id)
+                fields["ip"] = new_ip
+            bulk_items.append({"device_id": db_clientid_to_id[client_id], "fields": fields})
 
-    # 5) Ustaw OFFLINE tym, których nie było w skanie (wcześniej tu je kasowałeś)
     for client_id, device_id in db_clientid_to_id.items():
         if client_id not in scanned_client_ids:
-            set_device_offline(device_id)
+            bulk_items.append({"device_id": device_id, "fields": {"isOnline": False}})
+
+    if bulk_items and not bulk_update_devices(bulk_items):
+        # starszy backend bez /devices/bulk — pojedyncze PUT-y jak dotychczas
+        for item in bulk_items:
+            fields = item["fields"]
+            if "ip" in fields:
+                update_device_ip_in_db(item["device_id"], fields["ip"])
+            if fields["isOnline"]:
+                set_device_online(item["device_id"])
+            else:
+                set_device_offline(item["device_id"])
 
     print_devices(scanned_devices)
 
@@ -1,6 +1,7 @@
 import requests
 import os
 import json
+import time
 from datetime import datetime
 import pytz
 from pathlib import Path
@@ -10,6 +11,185 @@ LOCATION_ID = "685003cbf071eb1bb4304cd2"
 API_BASE = "http://localhost:8000/api/locations"
 script_dir = os.path.dirname(os.path.abspath(__file__))
 LAST_CHECK_PATH = os.path.join(script_dir, "lastHourCheck.txt")
+DEVICES_STATE_PATH = os.path.join(script_dir, ".devices_state_download.json")
+DOWNLOAD_ETAGS_PATH = os.path.join(script_dir, ".download_etags.json")
+# MD5 (format cenówek) z nagłówka X-Device-MD5 i metadane z /meta – 3_modify i 4_send
+# nie uruchamiają dla pobranych plików ffprobe ani nie liczą MD5 ponownie
+MEDIA_MD5_PATH = os.path.join(script_dir, ".media_md5.json")
+DEVICE_FIELDS = "_id,clientId,changed,photo,video"
+# Ile najdłużej czekamy, aż backend zakoduje wersję "device" (potem pobieramy oryginał)
+DEVICE_VARIANT_WAIT_SECONDS = 120
+
+
+class VariantPending(Exception):
+    """Backend jeszcze koduje wersję pliku (202) – spróbuj za `retry_after` sekund."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Variant pending, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def download_file(file_url, local_filepath, variant=None):
+    """
+    Pobiera plik tylko wtedy, gdy lokalna kopia różni się od tej na serwerze:
+    wysyła If-None-Match z ETagiem poprzedniego pobrania i przy 304 zostawia plik.
+    Zwraca True, gdy plik został pobrany na nowo; 202 (wersja w trakcie kodowania)
+    -> VariantPending.
+    """
+    etags = {}
+    if os.path.exists(DOWNLOAD_ETAGS_PATH):
+        try:
+            with open(DOWNLOAD_ETAGS_PATH, "r") as f:
+                etags = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    known = etags.get(local_filepath)
+    headers = {}
+    if known and known.get("url") == file_url and os.path.exists(local_filepath):
+        headers["If-None-Match"] = known["etag"]
+
+    r = requests.get(file_url, stream=True, headers=headers, timeout=60)
+    if r.status_code == 202:
+        raise VariantPending(int(r.headers.get("Retry-After", "5")))
+    if r.status_code == 304:
+        print(f"♻️ Bez zmian (ETag) – zostawiam lokalny plik {os.path.basename(local_filepath)}")
+        return False
+    r.raise_for_status()
+
+    tmp_path = local_filepath + ".part"
+    with open(tmp_path, "wb") as f:
+        for chunk in r.iter_content(chunk_size=1024 * 1024):
+            f.write(chunk)
+    os.replace(tmp_path, local_filepath)
+
+    if r.headers.get("ETag"):
+        etags[local_filepath] = {"url": file_url, "etag": r.headers["ETag"]}
+        with open(DOWNLOAD_ETAGS_PATH, "w") as f:
+            json.dump(etags, f, indent=2)
+    save_media_md5(local_filepath, r.headers.get("X-Device-MD5"), variant)
+    return True
+
+
+def download_media(filename, client_id, media_type):
+    """
+    Pobiera plik dla cenówki jako `<clientId>.<ext>` i zwraca lokalną ścieżkę.
+    Najpierw wersja "device" (MP4 w profilu cenówek, zakodowany raz na backendzie –
+    3_modify_file_for_upload.py go już nie przerabia), a gdy jej nie ma – oryginał.
+    """
+    file_url = f"{API_BASE}/{LOCATION_ID}/files/{filename}"
+    device_path = os.path.join(script_dir, f"{client_id}.mp4")
+    deadline = time.monotonic() + DEVICE_VARIANT_WAIT_SECONDS
+    while True:
+        try:
+            download_file(f"{file_url}?variant=device", device_path, variant="device")
+            return device_path
+        except VariantPending as pending:
+            if time.monotonic() + pending.retry_after > deadline:
+                print(f"⏳ Wersja device dla {filename} wciąż się koduje – pobieram oryginał")
+                break
+            time.sleep(pending.retry_after)
+        except requests.HTTPError as e:
+            print(f"⚠️ Brak wersji device dla {filename} ({e.response.status_code}) – pobieram oryginał")
+            break
+
+    extension = ".png" if media_type in ["photo", "image"] else ".mp4"
+    local_filepath = os.path.join(script_dir, f"{client_id}{extension}")
+    if download_file(file_url, local_filepath) and extension == ".mp4":
+        save_media_meta(file_url, local_filepath)
+    return local_filepath
+
+
+def save_media_meta(file_url, local_filepath):
+    """Metadane oryginału z backendu (has_audio itd.) dla 3_modify_file_for_upload.py."""
+    try:
+        r = requests.get(f"{file_url}/meta", timeout=15)
+        r.raise_for_status()
+    except requests.RequestException as e:
+        print(f"⚠️ Brak metadanych dla {os.path.basename(local_filepath)}: {e}")
+        return
+    meta = r.json()
+    update_media_info(local_filepath, has_audio=meta.get("has_audio"), duration=meta.get("duration"))
+
+
+def remove_other_media(client_id, local_filepath):
+    """Cenówka dostaje jeden plik – usuń pozostałe `<clientId>.png/.mp4`."""
+    for ext in (".png", ".mp4"):
+        other_path = os.path.join(script_dir, f"{client_id}{ext}")
+        if other_path != local_filepath and os.path.exists(other_path):
+            os.remove(other_path)
+            print(f"🗑️ Usunięto poprzedni plik {other_path}")
+
+
+def save_media_md5(local_filepath, md5, variant=None):
+    """
+    Zapamiętuje MD5 pobranego pliku razem z jego rozmiarem i mtime – jeśli plik zostanie
+    potem zmieniony (np. transkodowanie w 3_modify), wpis przestaje pasować i 4_send liczy MD5 sam.
+    """
+    update_media_info(local_filepath, replace=True, md5=md5.upper() if md5 else None, variant=variant)
+
+
+def update_media_info(local_filepath, replace=False, **fields):
+    """Wpis pliku w MEDIA_MD5_PATH, ważny dla bieżącego rozmiaru i mtime pliku."""
+    known = {}
+    if os.path.exists(MEDIA_MD5_PATH):
+        try:
+            with open(MEDIA_MD5_PATH, "r") as f:
+                known = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    name = os.path.basename(local_filepath)
+    stat = os.stat(local_filepath)
+    entry = {} if replace else known.get(name, {})
+    if entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+        entry = {}
+    entry.update(fields, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    known[name] = entry
+    with open(MEDIA_MD5_PATH, "w") as f:
+        json.dump(known, f, indent=2)
+
+
+def get_devices_incremental():
+    """
+    Synchronizuje lokalną kopię listy urządzeń przez /devices/changes?since=<kursor>:
+    pobiera tylko urządzenia zmienione od poprzedniego uruchomienia (pełna lista tylko
+    za pierwszym razem albo gdy backend zwróci reset).
+    """
+    state = {"cursor": 0, "devices": {}}
+    if os.path.exists(DEVICES_STATE_PATH):
+        try:
+            with open(DEVICES_STATE_PATH, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    while True:
+        response = requests.get(
+            f"{API_BASE}/{LOCATION_ID}/devices/changes",
+            params={"since": state["cursor"], "fields": DEVICE_FIELDS},
+            timeout=30
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        if data["reset"] or state["cursor"] == 0:
+            state["devices"] = {}
+        for device in data["devices"]:
+            state["devices"][device["_id"]] = device
+        for device_id in data["deleted"]:
+            state["devices"].pop(device_id, None)
+        print(f"🔄 Zmiany urządzeń: {len(data['devices'])} zmienionych, {len(data['deleted'])} usuniętych (kursor {data['cursor']})")
+        moved = data["cursor"] != state["cursor"]
+        state["cursor"] = data["cursor"]
+
+        # Kursor nie ruszył (świeża luka w dzienniku) – reszta przy następnym uruchomieniu
+        if not data.get("more") or not moved:
+            break
+
+    with open(DEVICES_STATE_PATH, "w") as f:
+        json.dump(state, f)
+    return list(state["devices"].values())
 
 def set_thumbnail_from_schedule(location_id: str, device_id: str, filename: str, media_type: str):
     """
@@ -63,9 +243,7 @@ now = datetime.now(pytz.timezone("Europe/Warsaw"))
 print(f"\n🕒 Obecny czas (Warszawa): {now.strftime('%Y-%m-%d %H:%M:%S')}")
 
 try:
-    response = requests.get(f"{API_BASE}/{LOCATION_ID}/devices")
-    response.raise_for_status()
-    devices = response.json()
+    devices = get_devices_incremental()
 except requests.RequestException as e:
     print(f"❌ Błąd podczas pobierania listy urządzeń: {e}")
     exit()
@@ -102,27 +280,15 @@ for device in devices:
         media = active_schedule["media"]
         filename = media["filename"]
         media_type = media["mediaType"]
-        extension = ".png" if media_type in ["photo", "image"] else ".mp4"
-        local_filename = f"{client_id}{extension}"
-        local_filepath = os.path.join(script_dir, local_filename)
-        file_url = f"{API_BASE}/{LOCATION_ID}/files/{filename}"
 
         try:
-            r = requests.get(file_url, stream=True)
-            r.raise_for_status()
-            with open(local_filepath, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            print(f"📥 ({media_type}) Zapisano wg harmonogramu: {local_filename}")
+            local_filepath = download_media(filename, client_id, media_type)
+            print(f"📥 ({media_type}) Zapisano wg harmonogramu: {os.path.basename(local_filepath)}")
 
             # --- NOWE: ustaw miniaturkę w bazie dla pliku z harmonogramu ---
             set_thumbnail_from_schedule(LOCATION_ID, device_id, filename, media_type)
 
-            other_ext = ".mp4" if extension == ".png" else ".png"
-            old_path = os.path.join(script_dir, f"{client_id}{other_ext}")
-            if os.path.exists(old_path):
-                os.remove(old_path)
-                print(f"🗑️ Usunięto poprzedni plik {old_path}")
+            remove_other_media(client_id, local_filepath)
 
             if active_schedule["type"] == "fixed":
                 del_url = f"{API_BASE}/{LOCATION_ID}/devices/{device_id}/schedules"
@@ -141,28 +307,17 @@ for device in devices:
     if changed == "true" and not skip_standard:
         print(f"\n⚙️ Przetwarzanie changed: true dla {client_id}...")
 
-        for media_type, ext in [("photo", ".png"), ("video", ".mp4")]:
+        for media_type in ["photo", "video"]:
             filename = device.get(media_type)
             if filename:
-                file_url = f"{API_BASE}/{LOCATION_ID}/files/{filename}"
-                local_filename = f"{client_id}{ext}"
-                local_filepath = os.path.join(script_dir, local_filename)
-
                 try:
-                    r = requests.get(file_url, stream=True)
-                    r.raise_for_status()
-                    with open(local_filepath, "wb") as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    print(f"✅ Zapisano {media_type} jako {local_filename}")
+                    local_filepath = download_media(filename, client_id, media_type)
+                    print(f"✅ Zapisano {media_type} jako {os.path.basename(local_filepath)}")
 
                     # --- NOWE: ustaw miniaturkę spójną z pobranym plikiem ---
                     set_thumbnail_from_schedule(LOCATION_ID, device_id, filename, media_type)
 
-                    other_path = os.path.join(script_dir, f"{client_id}{'.mp4' if ext == '.png' else '.png'}")
-                    if os.path.exists(other_path):
-                        os.remove(other_path)
-                        print(f"🗑️ Usunięto drugi plik {other_path}")
+                    remove_other_media(client_id, local_filepath)
 
                 except Exception as e:
                     print(f"❌ Błąd pobierania {media_type}: {e}")
@@ -23,6 +23,11 @@ IMG_DURATION = 1                       # ile sekund ma trwać MP4 z PNG
 # Rozszerzenia wideo do przeróbki (możesz dopisać inne)
 VIDEO_EXTS = {".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v", ".ts"}
 
+# Pliki pobrane przez 2_download jako wersja "device" są już w tym profilu (backend koduje
+# raz na treść), a dla oryginałów backend podaje has_audio – wpis ważny, dopóki plik ma
+# ten sam rozmiar i mtime co przy pobraniu
+MEDIA_MD5_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".media_md5.json")
+
 # ------------------ POMOCNICZE ------------------
 
 def run(cmd: list):
@@ -41,12 +46,29 @@ def ffprobe_json(path: str):
         return {}
 
 def has_audio_stream(path: str) -> bool:
+    known = media_info(path).get("has_audio")
+    if known is not None:
+        return known
     meta = ffprobe_json(path)
     for st in meta.get("streams", []):
         if st.get("codec_type") == "audio":
             return True
     return False
 
+def media_info(path: str) -> dict:
+    try:
+        with open(MEDIA_MD5_PATH, "r") as f:
+            entry = json.load(f).get(os.path.basename(path)) or {}
+    except (OSError, ValueError):
+        return {}
+    stat = os.stat(path)
+    if entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+        return {}
+    return entry
+
+def is_device_ready(path: str) -> bool:
+    return media_info(path).get("variant") == "device"
+
 def ensure_dirsafe_name(name: str) -> str:
     # Bez zmian, ale możesz dodać sanitizację jeśli trzeba
     return name
@@ -213,6 +235,9 @@ if __name__ == "__main__":
             # pomiń już „converted_”, jeśli KEEP_ORIGINALS=True
             if not KEEP_ORIGINALS and filename.startswith("converted_"):
                 continue
+            if is_device_ready(filename):
+                print(f"⏭️ {filename} – wersja device z backendu, bez transkodowania")
+                continue
             transcode_video(filename)
 
     print("🏁 Gotowe.")
@@ -10,13 +10,36 @@ import time
 LOCATION_ID = "685003cbf071eb1bb4304cd2"
 API_BASE = "http://localhost:8000/api/locations"
 IMAGE_FOLDER = "."  # Folder z plikami PNG, MP4 i JS
+DEVICES_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".devices_cache_send.json")
+# MD5 podane przez backend przy pobieraniu (2_download_devices_files.py, nagłówek X-Device-MD5)
+MEDIA_MD5_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".media_md5.json")
 
-# Pobierz urządzenia z bazy
+# Pobierz urządzenia z bazy (If-None-Match – przy 304 używamy kopii z poprzedniego uruchomienia)
 def get_devices_from_database() -> List[dict]:
+    cached = {}
+    if os.path.exists(DEVICES_CACHE_PATH):
+        try:
+            with open(DEVICES_CACHE_PATH, "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+
+    headers = {"If-None-Match": cached["etag"]} if cached.get("etag") else {}
     try:
-        response = requests.get(f"{API_BASE}/{LOCATION_ID}/devices")
+        response = requests.get(
+            f"{API_BASE}/{LOCATION_ID}/devices",
+            params={"fields": "_id,clientId,clientName,ip"},
+            headers=headers
+        )
+        if response.status_code == 304 and "devices" in cached:
+            return cached["devices"]
         if response.status_code == 200:
-            return response.json()
+            devices = response.json()
+            etag = response.headers.get("ETag")
+            if etag:
+                with open(DEVICES_CACHE_PATH, "w") as f:
+                    json.dump({"etag": etag, "devices": devices}, f)
+            return devices
         else:
             print(f"❌ Błąd pobierania urządzeń. Status: {response.status_code}")
             return []
@@ -24,13 +47,37 @@ def get_devices_from_database() -> List[dict]:
         print(f"❌ Błąd pobierania urządzeń: {e}")
         return []
 
-# Obliczanie MD5
+# Obliczanie MD5 – każdy plik co najwyżej raz (task JSON i `sign` uploadu używają tego samego
+# skrótu), a pliki pobrane z backendu wcale, jeśli nie zmieniły się od pobrania
+_md5_memo = {}
+
+
+def _served_md5(file_path, stat):
+    try:
+        with open(MEDIA_MD5_PATH, "r") as f:
+            entry = json.load(f).get(os.path.basename(file_path))
+    except (OSError, ValueError):
+        return None
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return entry.get("md5")
+    return None
+
+
 def calculate_md5(file_path):
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest().upper()
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if key in _md5_memo:
+        return _md5_memo[key]
+
+    md5 = _served_md5(file_path, stat)
+    if not md5:
+        hash_md5 = hashlib.md5()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hash_md5.update(chunk)
+        md5 = hash_md5.hexdigest().upper()
+    _md5_memo[key] = md5
+    return md5
 
 # Czyszczenie pamięci urządzenia
 def clear_device_space(ip):
@@ -1,10 +1,15 @@
 import React, { useEffect, useState } from "react";
 import styles from "./Gallery.module.css";
 import Navbar from "./Navbar";
+import { spriteTilePending, spriteTileStyle, useThumbnailSprite } from "./thumbnailSprite";
 import { useNavigate } from "react-router-dom";
 
 const API_BASE_URL = `${import.meta.env.VITE_BACKEND_URL}/api/locations`;
 
+// Miniaturki galerii: jeden arkusz (sprite) webp z kafelkami SPRITE_TILE px, wyświetlane w 100px
+const SPRITE_TILE = 128;
+const GALLERY_TILE = 100;
+
 function Gallery() {
   const navigate = useNavigate();
 
@@ -37,6 +42,7 @@ function Gallery() {
   const [previewUrl, setPreviewUrl] = useState(null);
   const [showModal, setShowModal] = useState(false);
   const [fileToDelete, setFileToDelete] = useState(null);
+  const sprite = useThumbnailSprite(currentLocationId, galleryFiles, SPRITE_TILE);
 
   // Guard: wymuś logowanie i posiadanie lokalizacji
   useEffect(() => {
@@ -188,6 +194,8 @@ function Gallery() {
             {galleryFiles.map((filename) => {
               const fileType = getFileType(filename);
               const fileUrl = `${API_BASE_URL}/${currentLocationId}/files/${filename}`;
+              const thumbnail = spriteTileStyle(sprite, filename, GALLERY_TILE);
+              const pending = spriteTilePending(sprite, filename);
 
               return (
                 <div key={filename} className={styles.galleryItem}>
@@ -199,7 +207,13 @@ function Gallery() {
                     ×
                   </button>
                   <div className={styles.galleryMediaWrapper}>
-                    {fileType === "image" ? (
+                    {thumbnail ? (
+                      <div role="img" aria-label={filename} className={styles.galleryMedia} style={thumbnail} />
+                    ) : pending ? (
+                      <div className={styles.galleryPlaceholder}>
+                        <span className={styles.fileIcon}>⏳</span>
+                      </div>
+                    ) : fileType === "image" ? (
                       <img src={fileUrl} alt={filename} className={styles.galleryMedia} />
                     ) : fileType === "video" ? (
                       <video src={fileUrl} autoPlay loop muted className={styles.galleryMedia} />
@@ -1,6 +1,7 @@
 import React, { useEffect, useState, useRef } from "react";
 import styles from "./Groups.module.css";
 import Navbar from "./Navbar";
+import { spriteTilePending, spriteTileStyle, useThumbnailSprite } from "./thumbnailSprite";
 import editIcon from './../assets/images/edit.png';
 import groupIcon from './../assets/images/group.png';
 import { useNavigate } from "react-router-dom";
@@ -20,6 +21,12 @@ const storedLocationIds = (() => {
 
 const API_BASE_URL = `${import.meta.env.VITE_BACKEND_URL}/api/locations`;
 
+// Siatka urządzeń: miniaturki z jednego arkusza (kafelki DEVICE_SPRITE_TILE px) zamiast oryginałów
+// w każdym kafelku; wymiary jak .deviceImage
+const DEVICE_SPRITE_TILE = 128;
+const DEVICE_TILE_WIDTH = 117;
+const DEVICE_TILE_HEIGHT = 192;
+
 function Groups() {
   const [devices, setDevices] = useState([]);
   const [groups, setGroups] = useState([]);
@@ -45,6 +52,13 @@ function Groups() {
   const [newGroupName, setNewGroupName] = useState("");
   const [newGroupDescription, setNewGroupDescription] = useState("");
   const [selectedLocationId, setSelectedLocationId] = useState(storedLocationIds[0] || null);
+  const sprite = useThumbnailSprite(
+    selectedLocationId,
+    devices.map((device) => device.thumbnail).filter(Boolean),
+    DEVICE_SPRITE_TILE
+  );
+  const deviceTile = (device) =>
+    device.thumbnail ? spriteTileStyle(sprite, device.thumbnail, DEVICE_TILE_WIDTH, DEVICE_TILE_HEIGHT) : null;
 
   const getDisplayName = (clientName) => {
     return editedNames[clientName] || clientName;
@@ -258,61 +272,45 @@ function Groups() {
         setErrorMsg("Wybrany plik z galerii nie jest zdjęciem ani filmem i nie może zostać przypisany.");
         return;
       }
-      for (let i = 0; i < selectedDevices.length; i++) {
-        const device = selectedDevices[i];
-        setUploadStatuses(prev => ({
-          ...prev,
-          [device._id]: { status: 'in_progress', message: `${getDisplayName(device.clientName)}, ${device.clientId}: Aktualizowanie...` }
-        }));
-        try {
-          // Delete existing files (photo/video)
-          await fetch(
-            `${API_BASE_URL}/${selectedLocationId}/devices/${device._id}/delete-files`,
-            { method: "DELETE" }
-          );
+      // jedno żądanie dla wszystkich zaznaczonych urządzeń (media, changed, miniaturka)
+      const markAll = (status, text) =>
+        setUploadStatuses((prev) => {
+          const next = { ...prev };
+          selectedDevices.forEach((device) => {
+            next[device._id] = { status, message: `${getDisplayName(device.clientName)}, ${device.clientId}: ${text}` };
+          });
+          return next;
+        });
 
-          const updateFieldResponse = await fetch(
-            `${API_BASE_URL}/${selectedLocationId}/devices/${device._id}/${fieldToUpdate}`,
-            {
-              method: "PUT",
-              headers: { "Content-Type": "application/json" },
-              body: JSON.stringify({ [fieldToUpdate]: filenameToUse }),
-            }
-          );
-          if (!updateFieldResponse.ok) {
-            throw new Error(`Błąd podczas aktualizacji pola ${fieldToUpdate}`);
-          }
-          const updateChangedFlagResponse = await fetch(
-            `${API_BASE_URL}/${selectedLocationId}/devices/${device._id}/changed-true`,
-            { method: "PUT" }
-          );
-          if (!updateChangedFlagResponse.ok) {
-            throw new Error("Błąd podczas ustawiania flagi 'changed' na true");
-          }
-          const updateThumbnailResponse = await fetch(
-            `${API_BASE_URL}/${selectedLocationId}/devices/${device._id}/thumbnail`,
-            {
-              method: "PUT",
-              headers: { "Content-Type": "application/json" },
-              body: JSON.stringify({
-                thumbnail: filenameToUse,
-              }),
-            }
-          );
-          if (!updateThumbnailResponse.ok) {
-            throw new Error("Błąd podczas aktualizacji miniaturki urządzenia");
-          }
-          setUploadStatuses(prev => ({
-            ...prev,
-            [device._id]: { status: 'success', message: `${getDisplayName(device.clientName)}, ${device.clientId}: Zakończono sukcesem` }
-          }));
-        } catch (err) {
-          console.error(`Błąd podczas aktualizacji urządzenia ${getDisplayName(device.clientName)}:`, err);
-          setUploadStatuses(prev => ({
-            ...prev,
-            [device._id]: { status: 'error', message: `${getDisplayName(device.clientName)}, ${device.clientId}: Błąd: ${err.message}` }
-          }));
+      markAll('in_progress', "Aktualizowanie...");
+      try {
+        const assignResponse = await fetch(`${API_BASE_URL}/${selectedLocationId}/devices/assign-media`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            device_ids: selectedDevices.map((device) => device._id),
+            filename: filenameToUse,
+            mediaType: fieldToUpdate,
+          }),
+        });
+        if (!assignResponse.ok) throw new Error("Błąd podczas przypisywania pliku do urządzeń");
+
+        const { not_found: notFound = [] } = await assignResponse.json();
+        markAll('success', "Zakończono sukcesem");
+        if (notFound.length) {
+          setUploadStatuses((prev) => {
+            const next = { ...prev };
+            selectedDevices
+              .filter((device) => notFound.includes(device._id))
+              .forEach((device) => {
+                next[device._id] = { status: 'error', message: `${getDisplayName(device.clientName)}, ${device.clientId}: Błąd: nie znaleziono urządzenia` };
+              });
+            return next;
+          });
         }
+      } catch (err) {
+        console.error("Błąd podczas przypisywania pliku do urządzeń:", err);
+        markAll('error', `Błąd: ${err.message}`);
       }
       fetchDevicesAndGroups(); // Re-fetch to update device list and their assigned files
       setIsModalOpen(false);
@@ -632,7 +630,11 @@ function Groups() {
                           <div className={styles.hangerBar}></div>
                           <div className={styles.stick + " " + styles.left}></div>
                           <div className={styles.stick + " " + styles.right}></div>
-                          {getFileType(device.thumbnail || '') === 'video' ? (
+                          {deviceTile(device) ? (
+                            <div role="img" aria-label="Device" className={styles.deviceImage} style={deviceTile(device)} />
+                          ) : device.thumbnail && spriteTilePending(sprite, device.thumbnail) ? (
+                            <img src="/src/assets/images/device.png" alt="Device" className={styles.deviceImage} />
+                          ) : getFileType(device.thumbnail || '') === 'video' ? (
                             <video
                               src={device.thumbnail ? `${API_BASE_URL}/${selectedLocationId}/files/${device.thumbnail}` : null}
                               autoPlay
@@ -757,7 +759,11 @@ function Groups() {
                         <div className={styles.hangerBar}></div>
                         <div className={`${styles.stick} ${styles.left}`}></div>
                         <div className={`${styles.stick} ${styles.right}`}></div>
-                        {getFileType(device.thumbnail || '') === 'video' ? (
+                        {deviceTile(device) ? (
+                          <div role="img" aria-label="Device" className={styles.deviceImage} style={deviceTile(device)} />
+                        ) : device.thumbnail && spriteTilePending(sprite, device.thumbnail) ? (
+                          <img src="/src/assets/images/device.png" alt="Device" className={styles.deviceImage} />
+                        ) : getFileType(device.thumbnail || '') === 'video' ? (
                           <video
                             src={
                               device.thumbnail
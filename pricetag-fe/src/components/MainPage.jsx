@@ -37,6 +37,7 @@ function MainPage() {
   const [activeTab, setActiveTab] = useState("photo");
   const [errorMsg, setErrorMsg] = useState(null);
   const [galleryFiles, setGalleryFiles] = useState([]);
+  const [mediaPreviews, setMediaPreviews] = useState({}); // nazwa pliku -> adres animowanego podglądu
   const [selectedGalleryFile, setSelectedGalleryFile] = useState(null);
   const [uploadStatuses, setUploadStatuses] = useState({});
   const [isModalOpen, setIsModalOpen] = useState(false);
@@ -114,11 +115,8 @@ function MainPage() {
   // === POBIERANIE DANYCH – teraz reaguje na zmianę currentLocationId ===
   useEffect(() => {
     if (!currentLocationId) return;
+    // fetchDevices dociąga też listę plików (galeria i podglądy) dla tej lokalizacji
     fetchDevices(currentLocationId);
-    // jeżeli aktywna karta to 'gallery', dociągnij galerie dla tej lokalizacji
-    if (activeTab === "gallery") {
-      fetchGalleryFiles(currentLocationId);
-    }
     // wyczyść wybory przy zmianie lokalizacji
     setSelectedDevices([]);
     setUploadStatuses({});
@@ -127,7 +125,7 @@ function MainPage() {
 
   useEffect(() => {
     if (selectedDevices.length > 0 && activeTab === "gallery" && currentLocationId) {
-      fetchGalleryFiles(currentLocationId);
+      fetchLocationFiles(currentLocationId);
     }
   }, [selectedDevices, activeTab, currentLocationId]);
 
@@ -146,22 +144,29 @@ function MainPage() {
         };
       }
       setUploadedFiles(filesInfo);
+      fetchLocationFiles(locId);
     } catch (err) {
       console.error("Błąd pobierania urządzeń:", err);
       setErrorMsg("Nie udało się pobrać urządzeń.");
     }
   };
 
-  const fetchGalleryFiles = async (locId) => {
+  // Jedna lista plików lokalizacji: nazwy do galerii i animowane podglądy wideo (mała WebP)
+  // zamiast odtwarzania oryginalnych MP4 w siatce urządzeń
+  const fetchLocationFiles = async (locId) => {
     try {
       const res = await fetch(`${API_BASE_URL}/${locId}/files/`);
-      if (!res.ok) {
-        throw new Error("Błąd podczas pobierania listy plików z galerii");
-      }
+      if (!res.ok) throw new Error("Błąd podczas pobierania listy plików");
       const data = await res.json();
+      const previews = {};
+      for (const item of data.items || []) {
+        if (item.preview_url) previews[item.filename] = `${import.meta.env.VITE_BACKEND_URL}${item.preview_url}`;
+      }
       setGalleryFiles(data.files || []);
+      setMediaPreviews(previews);
     } catch (err) {
-      console.error("Błąd pobierania plików galerii:", err);
+      console.error("Błąd pobierania plików lokalizacji:", err);
+      setMediaPreviews({});
       setErrorMsg("Nie udało się załadować plików galerii.");
     }
   };
@@ -298,53 +303,45 @@ function MainPage() {
         return;
       }
 
-      for (let i = 0; i < selectedDevices.length; i++) {
-        const device = selectedDevices[i];
-        setUploadStatuses((prev) => ({
-          ...prev,
-          [device._id]: { status: "in_progress", message: `${device.clientName}, ${device.clientId}: Aktualizowanie...` },
-        }));
-
-        try {
-          await fetch(`${API_BASE_URL}/${currentLocationId}/devices/${device._id}/delete-files`, { method: "DELETE" });
-
-          const updateFieldResponse = await fetch(
-            `${API_BASE_URL}/${currentLocationId}/devices/${device._id}/${fieldToUpdate}`,
-            {
-              method: "PUT",
-              headers: { "Content-Type": "application/json" },
-              body: JSON.stringify({ [fieldToUpdate]: filenameToUse }),
-            }
-          );
-          if (!updateFieldResponse.ok) throw new Error(`Błąd podczas aktualizacji pola ${fieldToUpdate}`);
-
-          const updateChangedFlagResponse = await fetch(
-            `${API_BASE_URL}/${currentLocationId}/devices/${device._id}/changed-true`,
-            { method: "PUT" }
-          );
-          if (!updateChangedFlagResponse.ok) throw new Error("Błąd podczas ustawiania flagi 'changed' na true");
-
-          const updateThumbnailResponse = await fetch(
-            `${API_BASE_URL}/${currentLocationId}/devices/${device._id}/thumbnail`,
-            {
-              method: "PUT",
-              headers: { "Content-Type": "application/json" },
-              body: JSON.stringify({ thumbnail: filenameToUse }),
-            }
-          );
-          if (!updateThumbnailResponse.ok) throw new Error("Błąd podczas aktualizacji miniaturki urządzenia");
-
-          setUploadStatuses((prev) => ({
-            ...prev,
-            [device._id]: { status: "success", message: `${device.clientName}, ${device.clientId}: Zakończono sukcesem` },
-          }));
-        } catch (err) {
-          console.error(`Błąd podczas aktualizacji urządzenia ${device.clientName}:`, err);
-          setUploadStatuses((prev) => ({
-            ...prev,
-            [device._id]: { status: "error", message: `${device.clientName}, ${device.clientId}: Błąd: ${err.message}` },
-          }));
+      // jedno żądanie dla wszystkich zaznaczonych urządzeń (media, changed, miniaturka)
+      const markAll = (status, text) =>
+        setUploadStatuses((prev) => {
+          const next = { ...prev };
+          selectedDevices.forEach((device) => {
+            next[device._id] = { status, message: `${device.clientName}, ${device.clientId}: ${text}` };
+          });
+          return next;
+        });
+
+      markAll("in_progress", "Aktualizowanie...");
+      try {
+        const assignResponse = await fetch(`${API_BASE_URL}/${currentLocationId}/devices/assign-media`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            device_ids: selectedDevices.map((device) => device._id),
+            filename: filenameToUse,
+            mediaType: fieldToUpdate,
+          }),
+        });
+        if (!assignResponse.ok) throw new Error("Błąd podczas przypisywania pliku do urządzeń");
+
+        const { not_found: notFound = [] } = await assignResponse.json();
+        markAll("success", "Zakończono sukcesem");
+        if (notFound.length) {
+          setUploadStatuses((prev) => {
+            const next = { ...prev };
+            selectedDevices
+              .filter((device) => notFound.includes(device._id))
+              .forEach((device) => {
+                next[device._id] = { status: "error", message: `${device.clientName}, ${device.clientId}: Błąd: nie znaleziono urządzenia` };
+              });
+            return next;
+          });
         }
+      } catch (err) {
+        console.error("Błąd podczas przypisywania pliku do urządzeń:", err);
+        markAll("error", `Błąd: ${err.message}`);
       }
 
       // odśwież listę urządzeń
@@ -467,7 +464,13 @@ function MainPage() {
                   <div className={styles.hangerBar}></div>
                   <div className={styles.stick + " " + styles.left}></div>
                   <div className={styles.stick + " " + styles.right}></div>
-                  {getFileType(device.thumbnail || "") === "video" ? (
+                  {mediaPreviews[device.thumbnail] ? (
+                    <img
+                      src={mediaPreviews[device.thumbnail]}
+                      alt="Device"
+                      className={styles.deviceImage}
+                    />
+                  ) : getFileType(device.thumbnail || "") === "video" ? (
                     <video
                       src={
                         device.thumbnail
@@ -599,7 +602,7 @@ function MainPage() {
                     setActiveTab("gallery");
                     setFile(null);
                     setPreviewUrl(null);
-                    if (currentLocationId) fetchGalleryFiles(currentLocationId);
+                    if (currentLocationId) fetchLocationFiles(currentLocationId);
                   }}
                 >
                   Galeria plików
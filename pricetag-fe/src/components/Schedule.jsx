@@ -1,6 +1,7 @@
 import React, { useEffect, useState, useRef } from "react";
 import styles from "./Schedule.module.css";
 import Navbar from "./Navbar";
+import { spriteTilePending, spriteTileStyle, useThumbnailSprite } from "./thumbnailSprite";
 import DatePicker, { registerLocale } from "react-datepicker";
 import pl from "date-fns/locale/pl";
 import "react-datepicker/dist/react-datepicker.css";
@@ -10,6 +11,12 @@ registerLocale("pl", pl);
 
 const API_BASE_URL = `${import.meta.env.VITE_BACKEND_URL}/api/locations`;
 
+// Siatka urządzeń: miniaturki z jednego arkusza (kafelki DEVICE_SPRITE_TILE px) zamiast oryginałów
+// w każdym kafelku; wymiary jak .deviceImage
+const DEVICE_SPRITE_TILE = 128;
+const DEVICE_TILE_WIDTH = 117;
+const DEVICE_TILE_HEIGHT = 192;
+
 function Schedule() {
   const navigate = useNavigate();
 
@@ -88,6 +95,14 @@ function Schedule() {
 
   const getDisplayName = (clientName) => editedNames[clientName] || clientName;
 
+  const sprite = useThumbnailSprite(
+    currentLocationId,
+    devices.map((device) => device.thumbnail).filter(Boolean),
+    DEVICE_SPRITE_TILE
+  );
+  const deviceTile = (device) =>
+    device.thumbnail ? spriteTileStyle(sprite, device.thumbnail, DEVICE_TILE_WIDTH, DEVICE_TILE_HEIGHT) : null;
+
   // Guard: wymuś logowanie i posiadanie lokalizacji
   useEffect(() => {
     if (!parsedUser) {
@@ -485,7 +500,11 @@ function Schedule() {
                           <div className={styles.hangerBar}></div>
                           <div className={`${styles.stick} ${styles.left}`}></div>
                           <div className={`${styles.stick} ${styles.right}`}></div>
-                          {getFileType(device.thumbnail || "") === "video" ? (
+                          {deviceTile(device) ? (
+                            <div role="img" aria-label="Device" className={styles.deviceImage} style={deviceTile(device)} />
+                          ) : device.thumbnail && spriteTilePending(sprite, device.thumbnail) ? (
+                            <img src="/src/assets/images/device.png" alt="Device" className={styles.deviceImage} />
+                          ) : getFileType(device.thumbnail || "") === "video" ? (
                             <video
                               src={
                                 device.thumbnail
@@ -586,7 +605,11 @@ function Schedule() {
                       <div className={styles.hangerBar}></div>
                       <div className={`${styles.stick} ${styles.left}`}></div>
                       <div className={`${styles.stick} ${styles.right}`}></div>
-                      {getFileType(device.thumbnail || "") === "video" ? (
+                      {deviceTile(device) ? (
+                        <div role="img" aria-label="Device" className={styles.deviceImage} style={deviceTile(device)} />
+                      ) : device.thumbnail && spriteTilePending(sprite, device.thumbnail) ? (
+                        <img src="/src/assets/images/device.png" alt="Device" className={styles.deviceImage} />
+                      ) : getFileType(device.thumbnail || "") === "video" ? (
                         <video
                           src={
                             device.thumbnail
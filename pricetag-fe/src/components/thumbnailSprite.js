@@ -0,0 +1,77 @@
+import { useEffect, useState } from "react";
+
+const API_BASE_URL = `${import.meta.env.VITE_BACKEND_URL}/api/locations`;
+
+// Miniaturki siatek (galeria, urządzenia): jeden arkusz (sprite) zamiast oryginałów każdego kafelka
+export const SPRITE_MAX_FILES = 200; // limit backendu na jeden arkusz
+const SPRITE_RETRY_MS = 2000;
+
+const PREVIEWABLE_EXTENSIONS = ["jpg", "jpeg", "png", "gif", "bmp", "webp", "mp4", "mov", "avi", "mkv"];
+
+const isPreviewable = (filename) =>
+  PREVIEWABLE_EXTENSIONS.includes((filename || "").split(".").pop().toLowerCase());
+
+// Arkusz miniaturek plików `filenames` lokalizacji: { url, map }; null – jeszcze się ładuje,
+// { url: null } – arkusza nie ma (błąd), wtedy awaryjnie oryginalne pliki.
+// Klatki wideo w trakcie generowania (`map.pending`) są dociągane ponownie co SPRITE_RETRY_MS.
+export function useThumbnailSprite(locationId, filenames, size) {
+  const [sprite, setSprite] = useState(null);
+  const previewable = [...new Set(filenames.filter(isPreviewable))].slice(0, SPRITE_MAX_FILES);
+  const key = previewable.join("\n");
+
+  useEffect(() => {
+    if (!locationId) return;
+    if (previewable.length === 0) {
+      setSprite({ url: null, map: {} });
+      return;
+    }
+    let cancelled = false; // w międzyczasie zmieniono lokalizację/pliki
+    let retry = null;
+
+    const load = async () => {
+      try {
+        const res = await fetch(`${API_BASE_URL}/${locationId}/thumbnails/sprite`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ filenames: previewable, size, format: "webp" }),
+        });
+        if (!res.ok) throw new Error("Błąd podczas pobierania miniaturek");
+        const map = await res.json();
+        if (cancelled) return;
+        // Adres arkusza zależy od treści plików – przeglądarka trzyma go w cache na stałe
+        setSprite({ url: `${import.meta.env.VITE_BACKEND_URL}${map.url}`, map });
+        if (map.pending?.length) retry = setTimeout(load, SPRITE_RETRY_MS);
+      } catch (err) {
+        console.error("Błąd pobierania miniaturek:", err);
+        if (!cancelled) setSprite({ url: null, map: {} });
+      }
+    };
+    load();
+
+    return () => {
+      cancelled = true;
+      clearTimeout(retry);
+    };
+  }, [locationId, key, size]);
+
+  return sprite;
+}
+
+// Czy kafelek pliku jeszcze się ładuje (arkusz w drodze albo klatka wideo w generowaniu)
+export const spriteTilePending = (sprite, filename) =>
+  sprite === null || Boolean(sprite.map.pending?.includes(filename));
+
+// Styl elementu width×height pokazującego kafelek pliku z arkusza; null – brak kafelka.
+// Kafelek (kwadrat, miniaturka wyśrodkowana) skalowany do dłuższego boku elementu i wyśrodkowany.
+export const spriteTileStyle = (sprite, filename, width, height = width) => {
+  const tile = sprite?.url && sprite.map.tiles?.[filename];
+  if (!tile || sprite.map.pending?.includes(filename) || sprite.map.failed?.includes(filename)) return null;
+  const cell = Math.max(width, height);
+  const scale = cell / sprite.map.size;
+  return {
+    backgroundImage: `url(${sprite.url})`,
+    backgroundSize: `${sprite.map.columns * cell}px auto`,
+    backgroundPosition: `${(width - cell) / 2 - tile.x * scale}px ${(height - cell) / 2 - tile.y * scale}px`,
+    backgroundRepeat: "no-repeat",
+  };
+};